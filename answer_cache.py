@@ -0,0 +1,86 @@
+"""Semantic cache of FAQ answers, questions similar to an answered one are served without LLM calls."""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600, threshold: float = 0.95):
+        # Entries are kept in least recently used order, each one remembers the knowledge base version it was answered from
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.entries = OrderedDict()
+        self.next_key = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _normalize(self, vector: list[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _evict_expired(self, now: float) -> None:
+        for key in [key for key, entry in self.entries.items() if now - entry["created_at"] > self.ttl]:
+            del self.entries[key]
+
+    def get(self, vector: list[float], language: str, kb_version: int) -> str:
+        """Answer of the most similar cached question with the same language and knowledge base version, None on a miss."""
+        vector = self._normalize(vector)
+        with self.lock:
+            self._evict_expired(time.time())
+            best_key, best_similarity = None, self.threshold
+            for key, entry in self.entries.items():
+                if entry["language"] != language or entry["kb_version"] != kb_version or entry["vector"].shape != vector.shape:
+                    continue
+                similarity = float(np.dot(entry["vector"], vector))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(best_key)
+            return self.entries[best_key]["answer"]
+
+    def put(self, vector: list[float], language: str, kb_version: int, answer: str) -> None:
+        """Caches the answer, the least recently used entry is evicted when the cache is full."""
+        with self.lock:
+            self.entries[self.next_key] = {"vector": self._normalize(vector), "language": language, "kb_version": kb_version, "answer": answer, "created_at": time.time()}
+            self.next_key += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """Drops every answer, e.g. after the FAQ document changes."""
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+_shared_answer_cache = None
+_shared_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Returns the process-wide answer cache, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL and ANSWER_CACHE_THRESHOLD configure it."""
+    global _shared_answer_cache
+    with _shared_answer_cache_lock:
+        if _shared_answer_cache is None:
+            _shared_answer_cache = SemanticAnswerCache(max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+                                                       ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+                                                       threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")))
+        return _shared_answer_cache
@@ -1,11 +1,26 @@
 from fastapi import FastAPI, File, Form, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 from user import User
-from service import upload_documents, ask_question
+from service import upload_documents, ask_question, get_ingestion_status, reload_llm_clients, get_cache_stats
+from hotel_manager import get_hotel_manager
+from retriever import get_retriever
+from intent_classifier import get_intent_classifier
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema migrations and room seeding run once here, requests reuse the same hotel manager
+    get_hotel_manager()
+    # Vector store is loaded once and kept in memory for question answering
+    get_retriever()
+    # Intent classifier is trained on the logs before the first request is routed
+    await asyncio.to_thread(get_intent_classifier)
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 origins=["*"]
 
@@ -13,7 +28,7 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["POST", "OPTIONS"],
+    allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization"]
 )
 
@@ -25,11 +40,34 @@ async def check_health():
 async def document_uploader(files: list[UploadFile] = File(...), password: str = Form(...)):
     user = User(username="ADMIN")
     response, status_code = await upload_documents(user, files, password)
+    if status_code == 202:
+        return JSONResponse(status_code=202, content={"response": "Document is queued for uploading.", "job_id": response})
+    elif status_code == 200 or status_code == 400:
+        return {"response": response}
+    else:
+        raise HTTPException(status_code=status_code, detail=response)
+
+@app.get("/document-uploader/{job_id}")
+async def document_uploader_status(job_id: str):
+    response, status_code = await get_ingestion_status(job_id)
+    if status_code == 200:
+        return {"response": response}
+    else:
+        raise HTTPException(status_code=status_code, detail=response)
+
+@app.post("/llm-reloader")
+async def llm_reloader(password: str = Form(...)):
+    response, status_code = await reload_llm_clients(password)
     if status_code == 200 or status_code == 400:
         return {"response": response}
     else:
         raise HTTPException(status_code=status_code, detail=response)
 
+@app.get("/cache-stats")
+async def cache_stats():
+    response, status_code = await get_cache_stats()
+    return {"response": response}
+
 @app.post("/question-answerer")
 async def question_answerer(username: str = Form(...), question: str = Form(...)):
     user = User(username=username)
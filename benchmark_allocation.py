@@ -0,0 +1,88 @@
+"""Concurrency stress benchmark of room allocation. Worker processes with their own connections book random stays
+at the same time, afterwards every room night is checked to be booked at most once."""
+
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import date, timedelta
+from multiprocessing import Pool
+from hotel_manager import HotelManager
+
+ROOM_TYPES = ["single", "double", "suite"]
+
+
+def _book(args) -> tuple[int, int, int]:
+    """(booked, rejected, failed) reservation counts of one worker."""
+    db_name, rooms_file, bookings, max_rooms, horizon, seed = args
+    random.seed(seed)
+    hotel_manager = HotelManager(db_name=db_name, rooms_file=rooms_file)
+    booked = rejected = failed = 0
+    first_night = date(2030, 1, 1)
+    for _ in range(bookings):
+        start = first_night + timedelta(days=random.randrange(horizon))
+        end = start + timedelta(days=random.randint(1, 5))
+        try:
+            room_id, _, _ = hotel_manager.reserve_room("Stress Test", "5555555555", "stress@example.com", random.choice(ROOM_TYPES),
+                                                       start.isoformat(), end.isoformat(), 1, random.randint(1, max_rooms), "credit card", False, "")
+        except sqlite3.Error as e:
+            print(f"[DEBUG] Booking failed: {e}")
+            failed += 1
+            continue
+        if room_id:
+            booked += 1
+        else:
+            rejected += 1
+    hotel_manager.conn.close()
+    return booked, rejected, failed
+
+
+def check_no_double_booking(db_name: str) -> list[tuple]:
+    """Pairs of reservations that share a room on an overlapping night, read from the reservations and not the occupancy index."""
+    conn = sqlite3.connect(db_name)
+    overlaps = conn.execute('''SELECT a.reservation_id, b.reservation_id, ra.room_id FROM reservation_rooms ra
+                               JOIN reservation_rooms rb ON ra.room_id = rb.room_id AND ra.reservation_id < rb.reservation_id
+                               JOIN reservations a ON ra.reservation_id = a.reservation_id
+                               JOIN reservations b ON rb.reservation_id = b.reservation_id
+                               WHERE a.start_date < b.end_date AND b.start_date < a.end_date''').fetchall()
+    # Every reservation has exactly the rooms it asked for
+    partial = conn.execute('''SELECT res.reservation_id FROM reservations res
+                              JOIN reservation_rooms rr ON res.reservation_id = rr.reservation_id
+                              GROUP BY res.reservation_id HAVING COUNT(*) != MAX(res.number_of_rooms)''').fetchall()
+    conn.close()
+    return overlaps + [("partial", reservation_id) for reservation_id, in partial]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--bookings", type=int, default=50, help="bookings per worker")
+    parser.add_argument("--max-rooms", type=int, default=3, help="maximum number of rooms of one booking")
+    parser.add_argument("--horizon", type=int, default=14, help="days the stays start in, fewer days means more conflicts")
+    parser.add_argument("--rooms-file", default="room.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_name = os.path.join(temp_dir, "hotel.db")
+        # Schema and rooms are created once before the workers start
+        HotelManager(db_name=db_name, rooms_file=args.rooms_file).conn.close()
+        jobs = [(db_name, args.rooms_file, args.bookings, args.max_rooms, args.horizon, seed) for seed in range(args.workers)]
+        started = time.time()
+        with Pool(args.workers) as pool:
+            results = pool.map(_book, jobs)
+        elapsed = time.time() - started
+
+        booked, rejected, failed = (sum(counts) for counts in zip(*results))
+        total = args.workers * args.bookings
+        print(f"Bookings: {total} in {elapsed:.2f}s ({total / elapsed:.0f}/s), booked: {booked}, no rooms: {rejected}, failed: {failed}")
+        conflicts = check_no_double_booking(db_name)
+        if conflicts:
+            print(f"Double booked: {conflicts[:10]}")
+            raise SystemExit(1)
+        print("No room night is double booked.")
+
+
+if __name__ == "__main__":
+    main()
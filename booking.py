@@ -1,6 +1,19 @@
 import re
 from datetime import datetime
 
+VALIDATION_MESSAGES = {
+    "date_format": "Dates must be in YYYY-MM-DD format. Are you sure you entered the start and end date?",
+    "date_order": "End date must be after start date.",
+    "room_type": "Room type can be either single, double, or suite.",
+    "guest_count": "Guest count must be at least 1.",
+    "number_of_rooms": "Number of rooms must be at least 1.",
+    "phone_number": "Phone number must be between 10 and 15 digits.",
+    "email": "The email format is invalid, can you check the format?",
+    "include_breakfast": "Include breakfast must be a boolean."
+}
+
+BOOKING_FIELDS = ["full_name", "phone_number", "email", "start_date", "end_date", "guest_count", "room_type", "number_of_rooms", "payment_method", "include_breakfast"]
+
 class Booking:
     def __init__(self, full_name:str=None, phone_number:str=None, email:str=None, start_date:str=None, end_date:str=None, guest_count:int=None, room_type:str=None, number_of_rooms:int=None, payment_method:str=None, include_breakfast:bool=None, note:str=None):
         self.full_name = full_name
@@ -14,6 +27,8 @@ class Booking:
         self.payment_method = payment_method
         self.include_breakfast = include_breakfast
         self.note = note if note else {}
+        # Slot states are derived from the values, confirmed values are the ones of the saved reservation
+        self.confirmed_fields = {}
 
     def show_booking_details(self):
         """Returns each field in a formatted string."""
@@ -50,38 +65,84 @@ class Booking:
         return details
 
 
-    def is_valid(self) -> tuple[bool, str]:
-        """Checks the validation of the value of the each field."""
-        # Date checks
-        try:
-            start_date = datetime.strptime(self.start_date, "%Y-%m-%d")
-            end_date = datetime.strptime(self.end_date, "%Y-%m-%d")
-        except ValueError:
-            return False, "Dates must be in YYYY-MM-DD format. Are you sure you entered the start and end date?"
+    def _check_field(self, field_name: str) -> str:
+        """Validation error code of a filled field, None if its value is valid."""
+        value = getattr(self, field_name)
+        if field_name in ("start_date", "end_date"):
+            try:
+                parsed = datetime.strptime(value, "%Y-%m-%d")
+            except (TypeError, ValueError):
+                return "date_format"
+            if field_name == "end_date" and self.start_date is not None:
+                try:
+                    if datetime.strptime(self.start_date, "%Y-%m-%d") >= parsed:
+                        return "date_order"
+                except (TypeError, ValueError):
+                    pass
+        elif field_name == "room_type":
+            if value != 'single' and value != 'double' and value != 'suite':
+                return "room_type"
+        elif field_name in ("guest_count", "number_of_rooms"):
+            if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+                return field_name
+        elif field_name == "phone_number":
+            # Simple validation for digits only, length may vary by country
+            if not re.match(r"^\d{10,15}$", str(value)):
+                return "phone_number"
+        elif field_name == "email":
+            if not re.match(r"[^@]+@[^@]+\.[^@]+", str(value)):
+                return "email"
+        elif field_name == "include_breakfast":
+            if not isinstance(value, bool):
+                return "include_breakfast"
+        return None
+
+    def get_slot_state(self, field_name: str) -> str:
+        """State of a slot: empty, filled, invalid, or confirmed if the value was part of a saved reservation."""
+        value = getattr(self, field_name)
+        if value is None or value == "":
+            return "empty"
+        if self._check_field(field_name):
+            return "invalid"
+        if field_name in self.confirmed_fields and self.confirmed_fields[field_name] == value:
+            return "confirmed"
+        return "filled"
 
-        if start_date >= end_date:
-            return False, "End date must be after start date."
-        
-        if self.room_type != 'single' and self.room_type != 'double' and self.room_type != 'suite':
-            return False, "Room type can be either single, double, or suite."
+    def get_slot_states(self) -> dict[str, str]:
+        return {field_name: self.get_slot_state(field_name) for field_name in BOOKING_FIELDS}
 
-        # Guest count check
-        if self.guest_count <= 0:
-            return False, "Guest count must be at least 1."
+    def get_missing_fields(self) -> list[str]:
+        """Slots that are empty or invalid, in the order they are asked."""
+        return [field_name for field_name, state in self.get_slot_states().items() if state in ("empty", "invalid")]
 
-        # Room count check
-        if self.number_of_rooms <= 0:
-            return False, "Number of rooms must be at least 1."
+    def get_invalid_fields(self) -> dict[str, str]:
+        """Validation error codes of the invalid slots."""
+        return {field_name: self._check_field(field_name) for field_name, state in self.get_slot_states().items() if state == "invalid"}
 
-        # Phone number check (simple validation for digits only, length may vary by country)
-        if not re.match(r"^\d{10,15}$", self.phone_number):
-            return False, "Phone number must be between 10 and 15 digits."
+    def fill(self, field_name: str, value) -> str:
+        """Sets a slot and returns its new state, empty values do not clear a slot."""
+        if value is not None and value != "":
+            setattr(self, field_name, value)
+        return self.get_slot_state(field_name)
 
-        # Email format check
-        if not re.match(r"[^@]+@[^@]+\.[^@]+", self.email):
-            return False, "The email format is invalid, can you check the format?"
+    def confirm(self) -> None:
+        """Marks the current values as confirmed, e.g. after the reservation is saved."""
+        self.confirmed_fields = {field_name: getattr(self, field_name) for field_name in BOOKING_FIELDS}
 
-        # Include breakfast check (should be a boolean)
-        if not isinstance(self.include_breakfast, bool):
-            return False, "Include breakfast must be a boolean."
-        return True, "Booking is valid."
\ No newline at end of file
+    def is_confirmed(self) -> bool:
+        return all(state == "confirmed" for state in self.get_slot_states().values())
+
+    def get_validation_error(self) -> str:
+        """Code of the first invalid field value, None if the filled fields are valid."""
+        errors = set(self.get_invalid_fields().values())
+        for error in VALIDATION_MESSAGES:
+            if error in errors:
+                return error
+        return None
+
+    def is_valid(self) -> tuple[bool, str]:
+        """Checks the validation of the value of the each field."""
+        error = self.get_validation_error()
+        if error:
+            return False, VALIDATION_MESSAGES[error]
+        return True, "Booking is valid."
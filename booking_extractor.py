@@ -0,0 +1,329 @@
+"""Booking fields that can be read from a message without an LLM call."""
+
+import re
+import json
+from datetime import date, timedelta
+from booking import Booking
+
+MONTHS = {
+    "january": 1, "jan": 1, "ocak": 1,
+    "february": 2, "feb": 2, "şubat": 2,
+    "march": 3, "mar": 3, "mart": 3,
+    "april": 4, "apr": 4, "nisan": 4,
+    "may": 5, "mayıs": 5,
+    "june": 6, "jun": 6, "haziran": 6,
+    "july": 7, "jul": 7, "temmuz": 7,
+    "august": 8, "aug": 8, "ağustos": 8,
+    "september": 9, "sep": 9, "sept": 9, "eylül": 9,
+    "october": 10, "oct": 10, "ekim": 10,
+    "november": 11, "nov": 11, "kasım": 11,
+    "december": 12, "dec": 12, "aralık": 12
+}
+NUMBERS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "bir": 1, "iki": 2, "üç": 3, "dört": 4, "beş": 5, "altı": 6}
+
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_NUMBER = r"\d{1,2}|" + "|".join(NUMBERS)
+_NAME = r"[A-ZÇĞİÖŞÜ][a-zçğıöşü]+(?:\s+[A-ZÇĞİÖŞÜ][a-zçğıöşü]+)+"
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+PHONE_PATTERN = re.compile(r"(?<![\w-])\+?\d[\d\s().-]{8,18}\d(?![\w-])")
+ISO_DATE_PATTERN = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+NUMERIC_DATE_PATTERN = re.compile(r"\b(\d{1,2})[./](\d{1,2})[./](\d{4})\b")
+MONTH_DAY_PATTERN = re.compile(rf"\b({_MONTH})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?\b(?:,?\s+(\d{{4}}))?", re.I)
+DAY_MONTH_PATTERN = re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th|\.)?\s+(?:of\s+)?({_MONTH})\b(?:,?\s+(\d{{4}}))?", re.I)
+DAY_PATTERN = re.compile(r"\b(?:the\s+)?(\d{1,2})\s?(?:st|nd|rd|th)\b", re.I)
+RELATIVE_DATE_PATTERN = re.compile(r"\b(today|tomorrow|bugün|yarın)\b", re.I)
+GUEST_PATTERN = re.compile(rf"\b({_NUMBER})\s*(?:people|persons|person|guests|guest|adults|kişiyiz|kişi|misafir)\b", re.I)
+WE_ARE_PATTERN = re.compile(rf"\bwe\s+are\s+({_NUMBER})\b", re.I)
+COUPLE_PATTERN = re.compile(r"\b(?:my\s+(?:wife|husband|girlfriend|boyfriend|partner)\s+and\s+i|me\s+and\s+my\s+(?:wife|husband|girlfriend|boyfriend|partner)|eşimle|eşim\s+ve\s+ben)\b", re.I)
+ROOMS_PATTERN = re.compile(rf"\b({_NUMBER})\s+(?:(?:single|double|suite)\s+)?(?:rooms|room|oda)\b", re.I)
+ONE_ROOM_PATTERN = re.compile(r"\b(?:a|an|one)\s+(?:\w+\s+)?room\b", re.I)
+ROOM_TYPE_PATTERNS = [
+    ("single", re.compile(r"\b(?:single|tek\s+kişilik)\b", re.I)),
+    ("double", re.compile(r"\b(?:double|çift\s+kişilik)\b", re.I)),
+    ("suite", re.compile(r"\b(?:suite|süit)\b", re.I))
+]
+PAYMENT_PATTERNS = [
+    ("credit card", re.compile(r"\b(?:credit\s+card|visa|master\s?card|amex|kredi\s+kartı)", re.I)),
+    ("debit card", re.compile(r"\b(?:debit\s+card|banka\s+kartı)", re.I)),
+    ("cash", re.compile(r"\b(?:cash|nakit)\b", re.I)),
+    ("bank transfer", re.compile(r"\b(?:bank\s+transfer|wire\s+transfer|havale|eft)\b", re.I))
+]
+NO_BREAKFAST_PATTERN = re.compile(r"\b(?:no|without|don't\s+want|do\s+not\s+want|skip)\s+(?:the\s+|any\s+)?breakfasts?\b|\bkahvaltı\s+istemiyoruz|\bkahvaltı\s+istemiyorum|\bkahvaltısız", re.I)
+BREAKFAST_PATTERN = re.compile(r"\bbreakfasts?\b|\bkahvaltı", re.I)
+NAME_PATTERN = re.compile(rf"\b(?i:my\s+name\s+is|I\s+am|I'm|this\s+is|adım|ismim|ben)\s+({_NAME})")
+# Capitalized words after "I am" that are not names, a name ends before the first of them
+NAME_STOP_WORDS = {
+    "staying", "with", "my", "and", "the", "a", "an", "here", "looking", "coming", "travelling", "traveling", "going", "arriving", "leaving",
+    "interested", "planning", "from", "in", "at", "for", "to", "on", "wife", "husband", "family", "friend", "friends", "kids", "children",
+    "not", "sure", "just", "very", "so", "also", "booking", "calling", "writing", "trying", "happy", "glad", "sorry", "ready", "alone"
+}
+# Month names that are also common words are only read as months when they are written like a date
+AMBIGUOUS_MONTHS = {"may", "mar", "march", "jun", "sept", "dec"}
+QUESTION_START_PATTERN = re.compile(r"^\s*(?:is|are|does|do|can|could|will|would|what|how|when|which|should|may)\b", re.I)
+DATE_HINT_PATTERN = re.compile(r"\b(leave|leaving|depart|departing|check[\s-]?out|until|till|çıkış|arrive|arriving|arrival|check[\s-]?in|from|giriş)\b", re.I)
+END_DATE_HINT = re.compile(r"leav|depart|check[\s-]?out|until|till|çıkış", re.I)
+
+# Words that do not carry booking information, a message made of them is not sent to the LLM
+FILLER_WORDS = {
+    "yes", "no", "ok", "okay", "sorry", "it", "is", "its", "it's", "my", "the", "a", "an", "and", "or", "i", "am", "i'm", "me", "please",
+    "thanks", "thank", "you", "here", "mail", "email", "e", "phone", "number", "at", "to", "from", "on", "of", "for", "we", "are",
+    "would", "like", "want", "that", "this", "be", "will", "with", "also", "our", "room", "rooms", "date", "dates", "by", "pay",
+    "evet", "hayır", "tamam", "lütfen", "teşekkürler", "pardon", "benim", "ve", "ile", "numaram", "mailim", "adresim"
+}
+
+
+def _to_number(value: str) -> int:
+    return int(value) if value.isdigit() else NUMBERS[value.lower()]
+
+
+def _make_date(year: int, month: int, day: int, today: date) -> date:
+    try:
+        parsed = date(year or today.year, month, day)
+    except ValueError:
+        return None
+    if not year and parsed < today:
+        parsed = parsed.replace(year=parsed.year + 1)
+    return parsed
+
+
+def _is_month(match: re.Match, month: str) -> bool:
+    """Whether a month word of a date match is meant as a month, "we may 2 come" is not a date but "May 2" and "may 2nd" are."""
+    if month.lower() not in AMBIGUOUS_MONTHS or month[0].isupper() or match.group(3):
+        return True
+    return re.search(r"\d(?:st|nd|rd|th)|\bof\b", match.group(0), re.I) is not None
+
+
+def _is_question(text: str, position: int) -> bool:
+    """Whether the sentence around the position asks something instead of stating it."""
+    start = max(text.rfind(mark, 0, position) for mark in ".!?\n") + 1
+    ends = [index for index in (text.find(mark, position) for mark in ".!?\n") if index != -1]
+    end = min(ends) if ends else len(text)
+    return text[end:end + 1] == "?" or QUESTION_START_PATTERN.match(text[start:end]) is not None
+
+
+def _clean_name(name: str) -> str:
+    """The name up to the first word that is not part of a name, None if less than two words are left."""
+    words = []
+    for word in name.split():
+        if word.lower() in NAME_STOP_WORDS:
+            break
+        words.append(word)
+    return " ".join(words) if len(words) >= 2 else None
+
+
+def _find_dates(text: str, today: date) -> list[tuple[int, int, date]]:
+    """(start, end, date) of every date in the text in order. A bare "24th" is a day after the date before it."""
+    found = []
+    for match in ISO_DATE_PATTERN.finditer(text):
+        found.append((match.start(), match.end(), _make_date(int(match.group(1)), int(match.group(2)), int(match.group(3)), today)))
+    for match in NUMERIC_DATE_PATTERN.finditer(text):
+        found.append((match.start(), match.end(), _make_date(int(match.group(3)), int(match.group(2)), int(match.group(1)), today)))
+    for match in MONTH_DAY_PATTERN.finditer(text):
+        if _is_month(match, match.group(1)):
+            found.append((match.start(), match.end(), _make_date(int(match.group(3) or 0), MONTHS[match.group(1).lower()], int(match.group(2)), today)))
+    for match in DAY_MONTH_PATTERN.finditer(text):
+        if _is_month(match, match.group(2)):
+            found.append((match.start(), match.end(), _make_date(int(match.group(3) or 0), MONTHS[match.group(2).lower()], int(match.group(1)), today)))
+    for match in RELATIVE_DATE_PATTERN.finditer(text):
+        days = 0 if match.group(1).lower() in ("today", "bugün") else 1
+        found.append((match.start(), match.end(), today + timedelta(days=days)))
+
+    # Longer matches win over the ones they overlap
+    dates = []
+    for start, end, parsed in sorted(found, key=lambda item: (item[0], -(item[1] - item[0]))):
+        if parsed and not any(start < other_end and other_start < end for other_start, other_end, _ in dates):
+            dates.append((start, end, parsed))
+
+    for match in DAY_PATTERN.finditer(text):
+        previous = [parsed for start, end, parsed in dates if end <= match.start()]
+        if not previous or any(match.start() < end and start < match.end() for start, end, _ in dates):
+            continue
+        day, previous_date = int(match.group(1)), previous[-1]
+        parsed = _make_date(previous_date.year, previous_date.month, day, today) if day > previous_date.day else None
+        if parsed is None:
+            next_month = (previous_date.replace(day=1) + timedelta(days=32)).replace(day=1)
+            parsed = _make_date(next_month.year, next_month.month, day, today)
+        if parsed:
+            dates.append((match.start(), match.end(), parsed))
+    return sorted(dates)
+
+
+def extract_booking_fields(text: str, today: date = None) -> tuple[dict, str]:
+    """Fields found in the message and the rest of the message. A single date that is not marked as arrival or departure is returned as "date"."""
+    today = today or date.today()
+    fields = {}
+    spans = []
+
+    def take(match):
+        spans.append((match.start(), match.end()))
+
+    for match in EMAIL_PATTERN.finditer(text):
+        fields["email"] = match.group(0)
+        take(match)
+
+    dates = _find_dates(text, today)
+    for start, end, _ in dates:
+        spans.append((start, end))
+
+    for match in PHONE_PATTERN.finditer(text):
+        if any(match.start() < end and start < match.end() for start, end in spans):
+            continue
+        digits = re.sub(r"\D", "", match.group(0))
+        if 10 <= len(digits) <= 15:
+            fields["phone_number"] = digits
+            take(match)
+
+    if len(dates) >= 2:
+        fields["start_date"], fields["end_date"] = dates[0][2].isoformat(), dates[1][2].isoformat()
+    elif dates:
+        # The closest arrival or departure word before the date decides which one it is
+        hints = DATE_HINT_PATTERN.findall(text[max(0, dates[0][0] - 30):dates[0][0]])
+        if not hints:
+            fields["date"] = dates[0][2].isoformat()
+        elif END_DATE_HINT.match(hints[-1]):
+            fields["end_date"] = dates[0][2].isoformat()
+        else:
+            fields["start_date"] = dates[0][2].isoformat()
+
+    for room_type, pattern in ROOM_TYPE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            fields["room_type"] = room_type
+            take(match)
+            break
+
+    match = ROOMS_PATTERN.search(text)
+    if match:
+        fields["number_of_rooms"] = _to_number(match.group(1))
+        take(match)
+    elif ONE_ROOM_PATTERN.search(text):
+        fields["number_of_rooms"] = 1
+
+    match = GUEST_PATTERN.search(text) or WE_ARE_PATTERN.search(text)
+    if match:
+        fields["guest_count"] = _to_number(match.group(1))
+        take(match)
+    else:
+        match = COUPLE_PATTERN.search(text)
+        if match:
+            fields["guest_count"] = 2
+            take(match)
+
+    for payment_method, pattern in PAYMENT_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            fields["payment_method"] = payment_method
+            take(match)
+            break
+
+    # Questions such as "Is breakfast included?" are not an answer
+    match = NO_BREAKFAST_PATTERN.search(text)
+    if match and not _is_question(text, match.start()):
+        fields["include_breakfast"] = False
+        take(match)
+    elif not match:
+        match = BREAKFAST_PATTERN.search(text)
+        if match and not _is_question(text, match.start()):
+            fields["include_breakfast"] = True
+            take(match)
+
+    match = NAME_PATTERN.search(text)
+    if match and _clean_name(match.group(1)):
+        fields["full_name"] = _clean_name(match.group(1))
+        take(match)
+
+    rest = text
+    for start, end in sorted(spans, reverse=True):
+        rest = rest[:start] + " " + rest[end:]
+    return fields, rest
+
+
+def extract_stay(text: str, today: date = None) -> tuple[str, str]:
+    """(start_date, end_date) of the nights the message asks about, a single date is one night. None if the message has no dates."""
+    fields, _ = extract_booking_fields(text, today)
+    start_date = fields.get("start_date") or fields.get("date")
+    end_date = fields.get("end_date")
+    if start_date is None and end_date is None:
+        return None
+    if start_date is None:
+        start_date = (date.fromisoformat(end_date) - timedelta(days=1)).isoformat()
+    if end_date is None or end_date <= start_date:
+        end_date = (date.fromisoformat(start_date) + timedelta(days=1)).isoformat()
+    return start_date, end_date
+
+
+def has_booking_content(text: str) -> bool:
+    """Whether the text has words that may carry booking information."""
+    words = re.findall(r"[\w']+", text.lower())
+    return any(word not in FILLER_WORDS and not word.isdigit() for word in words)
+
+
+def merge_booking_fields(booking: Booking, fields: dict) -> None:
+    """Found values fill the slots of the booking, so a guest can correct a value that is not confirmed yet.
+    A single unmarked date only fills the first open date, it does not say which date it corrects."""
+    slot_states = booking.get_slot_states()
+    open_slots = {field_name for field_name, state in slot_states.items() if state in ("empty", "invalid")}
+    for field_name, value in fields.items():
+        if field_name == "date":
+            if "start_date" in open_slots:
+                booking.fill("start_date", value)
+            elif "end_date" in open_slots:
+                booking.fill("end_date", value)
+        elif slot_states.get(field_name) != "confirmed":
+            booking.fill(field_name, value)
+
+
+def normalize_field(field_name: str, value):
+    """Values of the LLM in the types of the booking, None if the value is empty or can not be converted."""
+    if value is None or value == "":
+        return None
+    if field_name in ("guest_count", "number_of_rooms"):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    if field_name == "include_breakfast":
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in ("true", "yes", "evet", "1")
+    if field_name == "room_type":
+        return str(value).strip().lower()
+    if field_name == "phone_number":
+        return re.sub(r"\D", "", str(value)) or None
+    return value
+
+
+JSON_PAIR_PATTERN = re.compile(r'"(\w+)"\s*:\s*("(?:[^"\\]|\\.)*"|true|false|null|-?\d+(?:\.\d+)?)')
+
+
+def repair_json(text: str) -> dict:
+    """Object in an LLM response. Code fences, Python literals, single quotes, trailing commas and a cut off end are tolerated,
+    otherwise the key-value pairs that can be read are returned."""
+    text = re.sub(r"```(?:json)?", "", text or "")
+    start = text.find("{")
+    if start >= 0:
+        candidate = text[start:text.rfind("}") + 1] if "}" in text[start:] else text[start:]
+        attempts = [candidate]
+        fixed = re.sub(r"\bTrue\b", "true", re.sub(r"\bFalse\b", "false", re.sub(r"\bNone\b", "null", candidate)))
+        if '"' not in fixed:
+            fixed = fixed.replace("'", '"')
+        fixed = re.sub(r",\s*([}\]])", r"\1", fixed)
+        attempts.append(fixed)
+        # A cut off response is closed after its last complete value
+        cut = re.sub(r",?\s*(?:\"[^\"]*\"\s*:?\s*(?:\"[^\"]*)?)?$", "", fixed.rstrip().rstrip("}"))
+        attempts.append(cut + "}")
+        for attempt in attempts:
+            try:
+                data = json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                return data
+    data = {}
+    for key, value in JSON_PAIR_PATTERN.findall(text):
+        try:
+            data[key] = json.loads(value)
+        except json.JSONDecodeError:
+            continue
+    return data
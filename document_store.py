@@ -0,0 +1,176 @@
+"""Native FAISS index file and SQLite docstore, the vector store is no longer pickled as a whole."""
+
+import os
+import re
+import json
+import hashlib
+import sqlite3
+import threading
+import faiss
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock, the lock then only covers the threads of one worker
+    fcntl = None
+import numpy as np
+from typing import Union
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+INDEX_PATH = "document.faiss"
+DOCSTORE_PATH = "document.db"
+
+
+class SQLiteDocstore(Docstore):
+    def __init__(self, path=DOCSTORE_PATH):
+        # Chunk text and metadata live in SQLite, FAISS ids are the chunk ids of this table
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL;")
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS chunks (
+                                    chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                    source TEXT,
+                                    chunk_hash TEXT,
+                                    content TEXT,
+                                    metadata TEXT
+                                )''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (source, chunk_hash)")
+            # Chunks that left the index stay readable until the next upload, in-flight searches on the old index may still return them
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS stale_chunks (
+                                    chunk_id INTEGER PRIMARY KEY
+                                )''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS meta (
+                                    key TEXT PRIMARY KEY,
+                                    value TEXT
+                                )''')
+            self.conn.commit()
+
+    def search(self, search: str) -> Union[str, Document]:
+        """Returns the chunk with the given id as a document."""
+        with self.lock:
+            row = self.conn.execute("SELECT content, metadata FROM chunks WHERE chunk_id = ?", (int(search),)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def add_chunks(self, chunks: list[str], metadatas: list[dict], chunk_hashes: list[str]) -> list[int]:
+        """Saves chunks and returns their ids in the same order, metadata must have the source document."""
+        chunk_ids = []
+        with self.lock:
+            cursor = self.conn.cursor()
+            for chunk, metadata, chunk_hash in zip(chunks, metadatas, chunk_hashes):
+                cursor.execute("INSERT INTO chunks (source, chunk_hash, content, metadata) VALUES (?, ?, ?, ?)", (metadata["source"], chunk_hash, chunk, json.dumps(metadata)))
+                chunk_ids.append(cursor.lastrowid)
+            self.conn.commit()
+        return chunk_ids
+
+    def delete(self, ids: list) -> None:
+        with self.lock:
+            self.conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(int(chunk_id),) for chunk_id in ids])
+            self.conn.commit()
+
+    def mark_stale(self, ids: list) -> None:
+        """Chunks that are removed from the index, they are deleted by the next purge_stale."""
+        with self.lock:
+            self.conn.executemany("INSERT OR IGNORE INTO stale_chunks (chunk_id) VALUES (?)", [(int(chunk_id),) for chunk_id in ids])
+            self.conn.commit()
+
+    def purge_stale(self) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM chunks WHERE chunk_id IN (SELECT chunk_id FROM stale_chunks)")
+            self.conn.execute("DELETE FROM stale_chunks")
+            self.conn.commit()
+
+    def get_chunks(self) -> list[tuple[int, str]]:
+        with self.lock:
+            return self.conn.execute("SELECT chunk_id, content FROM chunks WHERE chunk_id NOT IN (SELECT chunk_id FROM stale_chunks)").fetchall()
+
+    def get_source_hashes(self, source: str) -> dict[str, int]:
+        """Returns the chunk hashes of a source document mapped to their chunk ids."""
+        with self.lock:
+            return {chunk_hash: chunk_id for chunk_id, chunk_hash in self.conn.execute("SELECT chunk_id, chunk_hash FROM chunks WHERE source = ? AND chunk_id NOT IN (SELECT chunk_id FROM stale_chunks)", (source,))}
+
+    def get_meta(self, key: str) -> str:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class FileLock:
+    def __init__(self, path: str):
+        # Threads of a worker wait on the thread lock, workers wait on flock of the lock file
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.file = open(self.path, "a")
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_EX)
+        except Exception:
+            if self.file is not None:
+                self.file.close()
+            self.lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+        finally:
+            self.file = None
+            self.lock.release()
+
+
+class ChunkIdMapping:
+    """FAISS ids are already docstore ids, so LangChain's id mapping is computed instead of stored."""
+    def __getitem__(self, i) -> str:
+        return str(int(i))
+
+
+def hash_chunk(chunk: str) -> str:
+    """Whitespace differences do not change the hash of a chunk."""
+    normalized = re.sub(r"\s+", " ", chunk).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def build_index(vectors: list[list[float]], chunk_ids: list[int]) -> faiss.Index:
+    """Creates a flat L2 index whose ids are the docstore chunk ids."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+    index.add_with_ids(vectors, np.asarray(chunk_ids, dtype=np.int64))
+    return index
+
+
+def add_to_index(index: faiss.Index, vectors: list[list[float]], chunk_ids: list[int]) -> None:
+    index.add_with_ids(np.asarray(vectors, dtype=np.float32), np.asarray(chunk_ids, dtype=np.int64))
+
+
+def remove_from_index(index: faiss.Index, chunk_ids: list[int]) -> None:
+    index.remove_ids(np.asarray(chunk_ids, dtype=np.int64))
+
+
+def write_index(index: faiss.Index, path=INDEX_PATH) -> None:
+    """Writes to a temporary file and renames it, so a worker never reads a half written index."""
+    temp_path = f"{path}.tmp"
+    faiss.write_index(index, temp_path)
+    os.replace(temp_path, path)
+
+
+def read_index(path=INDEX_PATH) -> faiss.Index:
+    """Reads the whole index into memory. IO_FLAG_MMAP only maps the inverted lists of IVF indexes,
+    a flat index is copied by every worker and its loading time grows with the corpus."""
+    return faiss.read_index(path)
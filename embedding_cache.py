@@ -0,0 +1,125 @@
+"""On-disk embedding cache, chunks that are embedded once are never sent to the transformer again."""
+
+import os
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from document_store import FileLock, hash_chunk
+
+CACHE_DIRECTORY = "embedding_cache"
+
+
+class EmbeddingCache:
+    def __init__(self, directory=CACHE_DIRECTORY):
+        # Vectors of each embedder are appended to one float32 file, SQLite maps (embedder, chunk hash) to a row of it
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self.lock = threading.Lock()
+        # Rows are numbered by the array file size, workers append to it one at a time
+        self.write_lock = FileLock(os.path.join(directory, "index.lock"))
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL;")
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS arrays (
+                                    embedder TEXT PRIMARY KEY,
+                                    file_name TEXT,
+                                    dimension INTEGER
+                                )''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS vectors (
+                                    embedder TEXT,
+                                    chunk_hash TEXT,
+                                    row INTEGER,
+                                    PRIMARY KEY (embedder, chunk_hash)
+                                )''')
+            self.conn.commit()
+
+    def _get_array(self, embedder: str) -> tuple[str, int]:
+        row = self.conn.execute("SELECT file_name, dimension FROM arrays WHERE embedder = ?", (embedder,)).fetchone()
+        if row is None:
+            return None, None
+        return os.path.join(self.directory, row[0]), row[1]
+
+    def get(self, embedder: str, chunk_hashes: list[str]) -> dict[str, list[float]]:
+        """Returns the cached vectors of the given chunk hashes, missing hashes are left out."""
+        with self.lock:
+            path, dimension = self._get_array(embedder)
+            if path is None or not os.path.exists(path):
+                return {}
+            rows = {}
+            for chunk_hash in set(chunk_hashes):
+                row = self.conn.execute("SELECT row FROM vectors WHERE embedder = ? AND chunk_hash = ?", (embedder, chunk_hash)).fetchone()
+                if row is not None:
+                    rows[chunk_hash] = row[0]
+            if not rows:
+                return {}
+            array = np.memmap(path, dtype=np.float32, mode="r").reshape(-1, dimension)
+            return {chunk_hash: array[row].tolist() for chunk_hash, row in rows.items()}
+
+    def put(self, embedder: str, chunk_hashes: list[str], vectors: list[list[float]]) -> None:
+        """Appends the vectors to the embedder's array and saves their rows."""
+        if not chunk_hashes:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.write_lock, self.lock:
+            path, dimension = self._get_array(embedder)
+            if path is None:
+                file_name = hashlib.sha1(embedder.encode("utf-8")).hexdigest()[:16] + ".f32"
+                path, dimension = os.path.join(self.directory, file_name), vectors.shape[1]
+                self.conn.execute("INSERT INTO arrays (embedder, file_name, dimension) VALUES (?, ?, ?)", (embedder, file_name, dimension))
+            first_row = os.path.getsize(path) // (dimension * 4) if os.path.exists(path) else 0
+            with open(path, "ab") as f:
+                f.write(vectors.tobytes())
+            self.conn.executemany("INSERT OR REPLACE INTO vectors (embedder, chunk_hash, row) VALUES (?, ?, ?)",
+                                  [(embedder, chunk_hash, first_row + i) for i, chunk_hash in enumerate(chunk_hashes)])
+            self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, model_name: str, cache: EmbeddingCache):
+        # The transformer is loaded only when a text is not in the cache or a query is embedded
+        self.model_name = model_name
+        self.cache = cache
+        self.model = None
+        self.lock = threading.Lock()
+
+    def _get_model(self) -> Embeddings:
+        with self.lock:
+            if self.model is None:
+                self.model = HuggingFaceEmbeddings(model_name=self.model_name)
+            return self.model
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Cached vectors are read from disk, only the missing texts are embedded and cached."""
+        chunk_hashes = [hash_chunk(text) for text in texts]
+        vectors = self.cache.get(self.model_name, chunk_hashes)
+        missing = {}
+        for text, chunk_hash in zip(texts, chunk_hashes):
+            if chunk_hash not in vectors and chunk_hash not in missing:
+                missing[chunk_hash] = text
+        if missing:
+            missing_vectors = self._get_model().embed_documents(list(missing.values()))
+            self.cache.put(self.model_name, list(missing.keys()), missing_vectors)
+            vectors.update(zip(missing.keys(), missing_vectors))
+        return [vectors[chunk_hash] for chunk_hash in chunk_hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._get_model().embed_query(text)
+
+
+_shared_embedding_cache = None
+_shared_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache(directory=CACHE_DIRECTORY) -> EmbeddingCache:
+    """Returns the process-wide embedding cache."""
+    global _shared_embedding_cache
+    with _shared_embedding_cache_lock:
+        if _shared_embedding_cache is None:
+            _shared_embedding_cache = EmbeddingCache(directory=directory)
+        return _shared_embedding_cache
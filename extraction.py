@@ -0,0 +1,112 @@
+"""Text extraction that can run on worker processes, large PDFs are split into page ranges."""
+
+import io
+import os
+import tempfile
+from concurrent.futures import Executor
+from typing import BinaryIO, Iterator, Union
+import PyPDF2
+from docx import Document
+
+
+def split_parts(file_name: str, byte_object: bytes, pages_per_part: int) -> list[tuple[int, int]]:
+    """Page ranges of a PDF, other documents are extracted as a single part."""
+    if os.path.splitext(file_name)[1] != '.pdf':
+        return [(0, 1)]
+    page_count = len(PyPDF2.PdfReader(io.BytesIO(byte_object)).pages)
+    return [(start, min(start + pages_per_part, page_count)) for start in range(0, page_count, pages_per_part)]
+
+
+def iter_part(file_name: str, byte_object: Union[bytes, BinaryIO], start: int, end: int) -> Iterator[tuple[str, dict]]:
+    """Yields the text of each PDF page, DOCX paragraph or TXT line with its source file and page. The document is given as bytes or an open binary file."""
+    file_extension = os.path.splitext(file_name)[1]
+    stream = byte_object if hasattr(byte_object, "read") else io.BytesIO(byte_object)
+    if file_extension == '.txt':
+        for line in stream.read().decode('utf-8').splitlines():
+            yield line, {"source": file_name, "page": 1}
+    elif file_extension == '.pdf':
+        pdf_reader = PyPDF2.PdfReader(stream)
+        for page_number in range(start, min(end, len(pdf_reader.pages))):
+            page = pdf_reader.pages[page_number]
+            yield page.extract_text(), {"source": file_name, "page": page_number + 1}
+    elif file_extension == '.docx':
+        doc = Document(stream)
+        for paragraph in doc.paragraphs:
+            yield paragraph.text, {"source": file_name, "page": 1}
+
+
+def extract_part(file_name: str, path: str, start: int, end: int) -> list[tuple[str, dict]]:
+    """Worker process entry point, the document is read from a file so that only its path is sent to the worker.
+    The segments of one part are returned together."""
+    with open(path, "rb") as file:
+        return list(iter_part(file_name, file, start, end))
+
+
+class ExtractionWindow:
+    def __init__(self, pool: Executor, size: int):
+        # At most size parts of all files of an upload are submitted or waiting to be consumed.
+        # Workers read each document from a temporary file instead of receiving its bytes with every part.
+        self.pool = pool
+        self.size = size
+        self.files = []
+        self.next_parts = []
+        self.futures = {}
+
+    def add(self, file_name: str, byte_object: bytes, parts: list[tuple[int, int]]) -> int:
+        """Writes the document to a temporary file and returns its index, nothing is submitted before start."""
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(file_name)[1], delete=False) as temp_file:
+            temp_file.write(byte_object)
+        self.files.append((file_name, temp_file.name, parts))
+        self.next_parts.append(0)
+        return len(self.files) - 1
+
+    def _submit(self, file_index: int) -> None:
+        file_name, path, parts = self.files[file_index]
+        part_index = self.next_parts[file_index]
+        start, end = parts[part_index]
+        self.futures[(file_index, part_index)] = self.pool.submit(extract_part, file_name, path, start, end)
+        self.next_parts[file_index] += 1
+
+    def start(self) -> None:
+        """Submits the first parts of every file in turns, so all files are extracted while the first one is consumed."""
+        while len(self.futures) < self.size:
+            waiting = [file_index for file_index, (_, _, parts) in enumerate(self.files) if self.next_parts[file_index] < len(parts)]
+            if not waiting:
+                return
+            for file_index in waiting[:self.size - len(self.futures)]:
+                self._submit(file_index)
+
+    def _fill(self) -> None:
+        """Refills the window with the next parts in the order they are consumed."""
+        for file_index, (_, _, parts) in enumerate(self.files):
+            while len(self.futures) < self.size and self.next_parts[file_index] < len(parts):
+                self._submit(file_index)
+
+    def results(self, file_index: int) -> Iterator[list[tuple[str, dict]]]:
+        """Segments of each part of the file in order."""
+        _, path, parts = self.files[file_index]
+        for part_index in range(len(parts)):
+            if (file_index, part_index) not in self.futures:
+                # The consumed part is always extracted, even if later files fill the window
+                self._submit(file_index)
+            segments = self.futures.pop((file_index, part_index)).result()
+            if part_index == len(parts) - 1:
+                os.remove(path)
+            self._fill()
+            yield segments
+
+    def close(self) -> None:
+        """Cancels the parts that are not consumed and removes the temporary files."""
+        for future in self.futures.values():
+            future.cancel()
+        # Cancelled or running parts may still read the files, they are waited for before they are removed
+        for future in self.futures.values():
+            if not future.cancelled():
+                try:
+                    future.result()
+                except Exception:
+                    pass
+        self.futures.clear()
+        for _, path, _ in self.files:
+            if os.path.exists(path):
+                os.remove(path)
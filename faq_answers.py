@@ -0,0 +1,108 @@
+"""FAQ answers that are written in every configured language at upload time and served without retrieval or generation."""
+
+import re
+import sqlite3
+import threading
+import numpy as np
+
+FAQ_DB_PATH = "faq_answers.db"
+
+QA_PATTERN = re.compile(r"^[ \t]*Q:[ \t]*(.+?)\s*\n[ \t]*A:[ \t]*(.+?)\s*(?=\n[ \t]*Q:|\Z)", re.S | re.M)
+
+
+def parse_qa_pairs(text: str) -> list[tuple[str, str]]:
+    """(question, answer) pairs of a document written as "Q: ..." and "A: ..." lines."""
+    return [(question, answer) for question, answer in QA_PATTERN.findall(text) if question and answer]
+
+
+class FAQAnswerStore:
+    def __init__(self, db_name=FAQ_DB_PATH):
+        # Normalized question vectors are kept in memory, they are reloaded after any connection changes the database
+        self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.data_version = None
+        self.pairs = []
+        self.vectors = None
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL;")
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS pairs (
+                                    source TEXT,
+                                    pair_hash TEXT,
+                                    question TEXT,
+                                    answer TEXT,
+                                    embedder TEXT,
+                                    vector BLOB,
+                                    PRIMARY KEY (source, pair_hash)
+                                )''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS answers (
+                                    pair_hash TEXT,
+                                    language TEXT,
+                                    answer TEXT,
+                                    PRIMARY KEY (pair_hash, language)
+                                )''')
+            self.conn.commit()
+
+    def get_answers(self, pair_hash: str) -> dict[str, str]:
+        """Precomputed answers of a pair by language."""
+        with self.lock:
+            rows = self.conn.execute("SELECT language, answer FROM answers WHERE pair_hash = ?", (pair_hash,)).fetchall()
+            return dict(rows)
+
+    def save_source(self, source: str, embedder: str, pairs: list[dict]) -> None:
+        """Replaces the pairs of a document. Each pair has question, answer, pair_hash, vector and answers by language."""
+        with self.lock:
+            self.conn.execute("DELETE FROM pairs WHERE source = ?", (source,))
+            for pair in pairs:
+                self.conn.execute("INSERT OR REPLACE INTO pairs (source, pair_hash, question, answer, embedder, vector) VALUES (?, ?, ?, ?, ?, ?)",
+                                  (source, pair["pair_hash"], pair["question"], pair["answer"], embedder, np.asarray(pair["vector"], dtype=np.float32).tobytes()))
+                self.conn.executemany("INSERT OR REPLACE INTO answers (pair_hash, language, answer) VALUES (?, ?, ?)",
+                                      [(pair["pair_hash"], language, answer) for language, answer in pair["answers"].items()])
+            # Answers of pairs that are not in any document anymore
+            self.conn.execute("DELETE FROM answers WHERE pair_hash NOT IN (SELECT pair_hash FROM pairs)")
+            self.conn.commit()
+            # data_version only changes for commits of other connections
+            self.vectors = None
+
+    def _load(self) -> None:
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if self.vectors is not None and data_version == self.data_version:
+            return
+        rows = self.conn.execute("SELECT pair_hash, embedder, vector FROM pairs").fetchall()
+        self.pairs = [(pair_hash, embedder) for pair_hash, embedder, _ in rows]
+        vectors = [np.frombuffer(vector, dtype=np.float32) for _, _, vector in rows]
+        self.vectors = [vector / (np.linalg.norm(vector) or 1.0) for vector in vectors]
+        self.data_version = data_version
+
+    def match(self, vector: list[float], embedder: str, language: str, threshold: float) -> str:
+        """Precomputed answer of the most similar FAQ question if it is at least threshold similar, otherwise None."""
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self.lock:
+            self._load()
+            best_hash, best_similarity = None, threshold
+            for (pair_hash, pair_embedder), pair_vector in zip(self.pairs, self.vectors):
+                if pair_embedder != embedder or pair_vector.shape != vector.shape:
+                    continue
+                similarity = float(np.dot(pair_vector, vector))
+                if similarity >= best_similarity:
+                    best_hash, best_similarity = pair_hash, similarity
+            if best_hash is None:
+                return None
+            row = self.conn.execute("SELECT answer FROM answers WHERE pair_hash = ? AND language = ?", (best_hash, language)).fetchone()
+            return row[0] if row else None
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+_shared_faq_store = None
+_shared_faq_store_lock = threading.Lock()
+
+
+def get_faq_store(db_name=FAQ_DB_PATH) -> FAQAnswerStore:
+    """Returns the process-wide FAQ answer store."""
+    global _shared_faq_store
+    with _shared_faq_store_lock:
+        if _shared_faq_store is None:
+            _shared_faq_store = FAQAnswerStore(db_name=db_name)
+        return _shared_faq_store
@@ -1,18 +1,85 @@
 """"""
 
+import os
+import time
 import sqlite3
-from datetime import datetime
+import calendar
+from datetime import datetime, timedelta
 import json
+import threading
+from collections import OrderedDict
+
+SCHEMA_VERSION = 2
+# Write transactions that can not get the database lock within the busy timeout are tried again
+BUSY_TIMEOUT = 5
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+
+_shared_hotel_manager = None
+_shared_hotel_manager_lock = threading.Lock()
+
+
+def get_hotel_manager(db_name="hotel.db", rooms_file="room.json") -> "HotelManager":
+    """Returns the process-wide hotel manager, it is created on the first call and reused afterwards. INVENTORY_CACHE_SIZE configures it."""
+    global _shared_hotel_manager
+    with _shared_hotel_manager_lock:
+        if _shared_hotel_manager is None:
+            _shared_hotel_manager = HotelManager(db_name=db_name, rooms_file=rooms_file, inventory_cache_size=int(os.getenv("INVENTORY_CACHE_SIZE", "256")))
+        return _shared_hotel_manager
+
+
+def get_nights(start_date: str, end_date: str) -> list[str]:
+    """Nights of a stay from the start date up to, but not including, the end date."""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    return [(start + timedelta(days=day)).strftime('%Y-%m-%d') for day in range((end - start).days)]
+
 
 class HotelManager:
-    def __init__(self, db_name="hotel.db"):
-        # Connect to the database
-        self.conn = sqlite3.connect(db_name)
-        # Drop all tables before recreating them
-        self.drop_all_tables()
-        # Recreate tables and initialize room data
-        self.create_tables()
-        self.initialize_rooms(rooms_file="room.json")
+    def __init__(self, db_name="hotel.db", rooms_file="room.json", inventory_cache_size=256):
+        # One long-lived connection is shared by every request, the lock serializes access to it
+        self.conn = sqlite3.connect(db_name, check_same_thread=False, timeout=BUSY_TIMEOUT)
+        self.lock = threading.RLock()
+        # Inventory results by date range in least recently used order, dropped when a reservation changes one of their nights
+        # or another connection writes. Every guest can ask for other dates, so only inventory_cache_size of them are kept.
+        self.inventory_cache = OrderedDict()
+        self.inventory_cache_size = inventory_cache_size
+        self.data_version = None
+        # WAL lets other workers read availability while a reservation is written
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.setup(rooms_file=rooms_file)
+
+    def setup(self, rooms_file):
+        """Runs schema migrations and seeds rooms only when the database is empty.
+        Both run in one write transaction, so workers starting together on a new database seed the rooms once."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.migrate()
+                if self.is_empty():
+                    self.initialize_rooms(rooms_file=rooms_file)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    def migrate(self):
+        """Brings the schema up to SCHEMA_VERSION, existing reservations are kept. It is committed by setup."""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("PRAGMA user_version;")
+            version = cursor.fetchone()[0]
+            if version < SCHEMA_VERSION:
+                self.create_tables()
+                # Databases of every older version may have reservations without an occupancy index, an empty one has nothing to fill
+                self.backfill_room_nights()
+                cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM rooms;")
+            return cursor.fetchone()[0] == 0
 
     def drop_all_tables(self):
         cursor = self.conn.cursor()
@@ -72,7 +139,34 @@ class HotelManager:
                             FOREIGN KEY (reservation_id) REFERENCES reservations(reservation_id),
                             FOREIGN KEY (room_id) REFERENCES rooms(room_id)
                         )''')
-        self.conn.commit()
+
+        # Occupancy index, one row per booked night of a room. Free rooms of a date range are found
+        # by reading only the nights in that range, independent of the reservation history.
+        cursor.execute('''CREATE TABLE IF NOT EXISTS room_nights (
+                            room_id INTEGER,
+                            night TEXT,
+                            room_type TEXT,
+                            reservation_id INTEGER,
+                            PRIMARY KEY (room_id, night),
+                            FOREIGN KEY (room_id) REFERENCES rooms(room_id),
+                            FOREIGN KEY (reservation_id) REFERENCES reservations(reservation_id)
+                        ) WITHOUT ROWID''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_room_nights_type_night ON room_nights (room_type, night, room_id)''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_room_nights_reservation ON room_nights (reservation_id)''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_rooms_type ON rooms (room_type, room_id)''')
+
+    def backfill_room_nights(self):
+        """Fills the occupancy index from the reservations of a database older than SCHEMA_VERSION."""
+        cursor = self.conn.cursor()
+        cursor.execute('''SELECT rr.reservation_id, rr.room_id, r.room_type, res.start_date, res.end_date FROM reservation_rooms rr
+                          JOIN rooms r ON rr.room_id = r.room_id
+                          JOIN reservations res ON rr.reservation_id = res.reservation_id''')
+        for reservation_id, room_id, room_type, start_date, end_date in cursor.fetchall():
+            if not self.is_valid_date_format(start_date) or not self.is_valid_date_format(end_date):
+                continue
+            # Overlapping reservations of the old flag based booking keep their first night owner
+            cursor.executemany('''INSERT OR IGNORE INTO room_nights (room_id, night, room_type, reservation_id) VALUES (?, ?, ?, ?)''',
+                               [(room_id, night, room_type, reservation_id) for night in get_nights(start_date, end_date)])
 
     def initialize_rooms(self, rooms_file):
         with open(rooms_file, 'r') as f:
@@ -90,8 +184,6 @@ class HotelManager:
                 cursor.execute('''INSERT INTO rooms (room_type)
                                   VALUES (?)''', (room_type,))
 
-        self.conn.commit()
-
     def is_valid_date_format(self, date_str):
         try:
             datetime.strptime(date_str, '%Y-%m-%d')
@@ -99,107 +191,212 @@ class HotelManager:
         except ValueError:
             return False
     
-    def get_room_status(self) -> str:
+    def _get_cached_inventory(self, key, start_date, end_date, compute):
+        with self.lock:
+            # data_version changes when another worker commits, own commits invalidate their dates
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self.data_version:
+                self.inventory_cache.clear()
+                self.data_version = data_version
+            if key in self.inventory_cache:
+                self.inventory_cache.move_to_end(key)
+                return self.inventory_cache[key][2]
+            result = compute()
+            if self.inventory_cache_size > 0:
+                while len(self.inventory_cache) >= self.inventory_cache_size:
+                    self.inventory_cache.popitem(last=False)
+                self.inventory_cache[key] = (start_date, end_date, result)
+            return result
+
+    def _invalidate_inventory(self, start_date, end_date):
+        for key, (cached_start, cached_end, _) in list(self.inventory_cache.items()):
+            if cached_start < end_date and start_date < cached_end:
+                del self.inventory_cache[key]
+
+    def _get_booked_counts(self, start_date, end_date, by_night):
+        """Booked rooms of each type in [start_date, end_date) from one grouped read of the occupancy index."""
         cursor = self.conn.cursor()
+        if by_night:
+            cursor.execute('''SELECT night, room_type, COUNT(*) FROM room_nights
+                              WHERE room_type IN (SELECT room_type FROM room_types) AND night >= ? AND night < ?
+                              GROUP BY night, room_type''', (start_date, end_date))
+            return cursor.fetchall()
+        cursor.execute('''SELECT room_type, COUNT(DISTINCT room_id) FROM room_nights
+                          WHERE room_type IN (SELECT room_type FROM room_types) AND night >= ? AND night < ?
+                          GROUP BY room_type''', (start_date, end_date))
+        return cursor.fetchall()
+
+    def get_room_type_counts(self) -> dict[str, int]:
+        """Total room count of each room type."""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''SELECT room_type, COUNT(*) FROM rooms GROUP BY room_type''')
+            return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def get_free_room_counts(self, start_date, end_date) -> dict[str, int]:
+        """Room count of each room type that is free every night of [start_date, end_date)."""
+        def compute():
+            free_counts = self.get_room_type_counts()
+            for room_type, booked in self._get_booked_counts(start_date, end_date, by_night=False):
+                free_counts[room_type] -= booked
+            return free_counts
+
+        return dict(self._get_cached_inventory(("range", start_date, end_date), start_date, end_date, compute))
+
+    def get_month_availability(self, year: int, month: int) -> dict[str, dict[str, int]]:
+        """Free room count of each room type for every night of a month."""
+        start_date = f"{year:04d}-{month:02d}-01"
+        end_date = (datetime(year, month, calendar.monthrange(year, month)[1]) + timedelta(days=1)).strftime('%Y-%m-%d')
+
+        def compute():
+            totals = self.get_room_type_counts()
+            grid = {night: dict(totals) for night in get_nights(start_date, end_date)}
+            for night, room_type, booked in self._get_booked_counts(start_date, end_date, by_night=True):
+                grid[night][room_type] -= booked
+            return grid
+
+        grid = self._get_cached_inventory(("month", year, month), start_date, end_date, compute)
+        return {night: dict(free_counts) for night, free_counts in grid.items()}
+
+    def get_available_room_counts(self, start_date=None, end_date=None) -> dict[str, int]:
+        """Room count of each room type that is free for the dates, tonight if no dates are given."""
+        if start_date is None:
+            start_date = datetime.today().strftime('%Y-%m-%d')
+        if end_date is None:
+            end_date = (datetime.strptime(start_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        return self.get_free_room_counts(start_date, end_date)
 
-        # Get available rooms by type
-        cursor.execute('''
-            SELECT room_type, 
-                COUNT(CASE WHEN is_available = 1 THEN 1 END) AS available_rooms,
-                COUNT(CASE WHEN is_available = 0 THEN 1 END) AS occupied_rooms
-            FROM rooms
-            GROUP BY room_type
-        ''')
-
-        room_status = cursor.fetchall()
-
+    def get_room_status(self) -> str:
         # Prepare the output string
         result_str = "Room Status Information:\n"
         result_str += "----------------------------\n"
-        
-        for row in room_status:
-            room_type = row[0]
-            available_rooms = row[1]
+    
+        for room_type, available_rooms in self.get_available_room_counts().items():
             result_str += f"For Room Type: {room_type} there are {available_rooms} available rooms\n"
-        
+    
         return result_str
 
 
-    def check_room_availability(self, room_type, start_date, end_date):
-        cursor = self.conn.cursor()
-        cursor.execute('''SELECT r.room_id FROM rooms r
-                          LEFT JOIN reservation_rooms rr ON r.room_id = rr.room_id
-                          LEFT JOIN reservations res ON rr.reservation_id = res.reservation_id
-                          WHERE r.room_type = ? AND r.is_available = 1
-                          AND (res.start_date IS NULL OR res.end_date < ? OR res.start_date > ?)
-                          LIMIT 1''', (room_type, start_date, end_date))
-        room = cursor.fetchone()
-        return room if room else None
-
-    def reserve_room(self, full_name, phone_number, email, room_type, start_date, end_date, guest_count, number_of_rooms, payment_method, include_breakfast, note) -> tuple[int, str]:
-        if not self.is_valid_date_format(start_date) or not self.is_valid_date_format(end_date):
-            return None, "Invalid date format. Please use YYYY-MM-DD."
-
-        cursor = self.conn.cursor()
-        room = self.check_room_availability(room_type, start_date, end_date)
-        if room:
-            room_id = room[0]
-            # Create the reservation entry
-            cursor.execute('''INSERT INTO reservations (full_name, phone_number, email, start_date, end_date, guest_count, room_type, number_of_rooms, payment_method, include_breakfast, note)
-                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
-                           (full_name, phone_number, email, start_date, end_date, guest_count, room_type, number_of_rooms, payment_method, include_breakfast, note))
-            reservation_id = cursor.lastrowid
-
-            # Link reservation to the room
-            cursor.execute('''INSERT INTO reservation_rooms (reservation_id, room_id)
-                              VALUES (?, ?)''', (reservation_id, room_id))
-
-            # Update room availability status
-            cursor.execute('''UPDATE rooms SET is_available = 0 WHERE room_id = ?''', (room_id,))
-
-            self.conn.commit()
-            return room_id, f"Room {room_id} reserved from {start_date} to {end_date} successfully."
-        else:
-            return None, "No available rooms for the selected type and dates, I could not do your reservation."
-
-    def cancel_reservation(self, room_id) -> str:
-        cursor = self.conn.cursor()
-
-        # Get the reservation_id from reservation_rooms table for the given room_id
-        cursor.execute('''SELECT reservation_id FROM reservation_rooms WHERE room_id = ?''', (room_id,))
-        reservation = cursor.fetchone()
-
-        if reservation:
-            reservation_id = reservation[0]
-            # Delete from reservation_rooms table
-            cursor.execute('''DELETE FROM reservation_rooms WHERE room_id = ?''', (room_id,))
+    def get_free_rooms(self, room_type, start_date, end_date, limit=None) -> list[int]:
+        """Ids of the rooms of a type that are free every night of [start_date, end_date)."""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''SELECT room_id FROM rooms
+                              WHERE room_type = ? AND room_id NOT IN
+                              (SELECT room_id FROM room_nights WHERE room_type = ? AND night >= ? AND night < ?)
+                              ORDER BY room_id LIMIT ?''', (room_type, room_type, start_date, end_date, -1 if limit is None else limit))
+            return [row[0] for row in cursor.fetchall()]
 
-            # Delete from reservations table using reservation_id
-            cursor.execute('''DELETE FROM reservations WHERE reservation_id = ?''', (reservation_id,))
-
-            # Update room availability
-            cursor.execute('''UPDATE rooms SET is_available = 1 WHERE room_id = ?''', (room_id,))
+    def check_room_availability(self, room_type, start_date, end_date):
+        rooms = self.get_free_rooms(room_type, start_date, end_date, limit=1)
+        return (rooms[0],) if rooms else None
 
-            self.conn.commit()
-            return f"Reservation for Room {room_id} has been canceled."
+    def reserve_room(self, full_name, phone_number, email, room_type, start_date, end_date, guest_count, number_of_rooms, payment_method, include_breakfast, note) -> tuple[int, int, str]:
+        """Reserves number_of_rooms rooms of the type for [start_date, end_date), all of them or none.
+        The first room id and the reservation id are returned, a reservation is cancelled by its id."""
+        if not self.is_valid_date_format(start_date) or not self.is_valid_date_format(end_date):
+            return None, None, "Invalid date format. Please use YYYY-MM-DD."
+
+        if start_date >= end_date:
+            return None, None, "End date must be after start date."
+
+        number_of_rooms = number_of_rooms or 1
+        if number_of_rooms < 1:
+            return None, None, "Number of rooms must be at least 1."
+
+        reservation = (full_name, phone_number, email, start_date, end_date, guest_count, room_type, number_of_rooms, payment_method, include_breakfast,
+                       note if note is None or isinstance(note, str) else json.dumps(note, ensure_ascii=False))
+        for attempt in range(BUSY_RETRIES):
+            try:
+                reservation_id, room_ids = self.allocate_rooms(room_type, start_date, end_date, number_of_rooms, reservation)
+                break
+            except sqlite3.OperationalError as e:
+                # Another worker holds the write lock longer than the busy timeout
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+                print(f"[DEBUG] Hotel database is busy, attempt {attempt + 1}: {e}")
+                time.sleep(BUSY_BACKOFF * (attempt + 1))
         else:
-            return f"No reservation found for Room {room_id}."
+            return None, None, "The hotel system is busy right now, I could not do your reservation. Please try again."
+
+        if not room_ids:
+            return None, None, "No available rooms for the selected type and dates, I could not do your reservation."
+        if len(room_ids) == 1:
+            return room_ids[0], reservation_id, f"Room {room_ids[0]} reserved from {start_date} to {end_date} successfully."
+        return room_ids[0], reservation_id, f"Rooms {', '.join(str(room_id) for room_id in room_ids)} reserved from {start_date} to {end_date} successfully."
+
+    def allocate_rooms(self, room_type, start_date, end_date, number_of_rooms, reservation) -> tuple[int, list[int]]:
+        """Books free rooms in one write transaction and returns (reservation id, room ids), (None, []) if there are not enough of them.
+        BEGIN IMMEDIATE takes the database write lock before the free rooms are read, so two workers can not pick the same room."""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                room_ids = self.get_free_rooms(room_type, start_date, end_date, limit=number_of_rooms)
+                if len(room_ids) < number_of_rooms:
+                    self.conn.rollback()
+                    return None, []
+                # Create the reservation entry
+                cursor.execute('''INSERT INTO reservations (full_name, phone_number, email, start_date, end_date, guest_count, room_type, number_of_rooms, payment_method, include_breakfast, note)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', reservation)
+                reservation_id = cursor.lastrowid
+
+                # Link reservation to the rooms
+                cursor.executemany('''INSERT INTO reservation_rooms (reservation_id, room_id)
+                                      VALUES (?, ?)''', [(reservation_id, room_id) for room_id in room_ids])
+
+                # Book every night of the stay
+                cursor.executemany('''INSERT INTO room_nights (room_id, night, room_type, reservation_id) VALUES (?, ?, ?, ?)''',
+                                   [(room_id, night, room_type, reservation_id) for room_id in room_ids for night in get_nights(start_date, end_date)])
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            self._invalidate_inventory(start_date, end_date)
+            return reservation_id, room_ids
+
+    def cancel_reservation(self, reservation_id) -> str:
+        """Cancels the reservation by its id, a room id is not enough since a room is booked by other reservations on other dates."""
+        with self.lock:
+            cursor = self.conn.cursor()
+
+            cursor.execute('''SELECT start_date, end_date FROM reservations WHERE reservation_id = ?''', (reservation_id,))
+            reservation = cursor.fetchone()
+
+            if reservation:
+                start_date, end_date = reservation
+                # Free the booked nights
+                cursor.execute('''DELETE FROM room_nights WHERE reservation_id = ?''', (reservation_id,))
+
+                # Delete from reservation_rooms table, every room of the reservation is released
+                cursor.execute('''DELETE FROM reservation_rooms WHERE reservation_id = ?''', (reservation_id,))
+
+                # Delete from reservations table using reservation_id
+                cursor.execute('''DELETE FROM reservations WHERE reservation_id = ?''', (reservation_id,))
+
+                self.conn.commit()
+                self._invalidate_inventory(start_date, end_date)
+                return f"Reservation {reservation_id} has been canceled."
+            else:
+                return f"No reservation found with the id {reservation_id}."
 
     def release_past_reservations(self) -> str:
-        today = datetime.today().strftime('%Y-%m-%d')
-        cursor = self.conn.cursor()
-        cursor.execute('''DELETE FROM reservations WHERE end_date < ?''', (today,))
-        cursor.execute('''UPDATE rooms SET is_available = 1
-                          WHERE room_id IN (SELECT room_id FROM reservations WHERE end_date < ?)''', (today,))
-        self.conn.commit()
-        return "Past reservations released and rooms marked as available."
+        with self.lock:
+            today = datetime.today().strftime('%Y-%m-%d')
+            cursor = self.conn.cursor()
+            cursor.execute('''DELETE FROM room_nights WHERE night < ?''', (today,))
+            cursor.execute('''DELETE FROM reservation_rooms WHERE reservation_id IN (SELECT reservation_id FROM reservations WHERE end_date < ?)''', (today,))
+            cursor.execute('''DELETE FROM reservations WHERE end_date < ?''', (today,))
+            self.conn.commit()
+            self.inventory_cache.clear()
+            return "Past reservations released and rooms marked as available."
 
 if __name__ == "__main__":
     hotel_manager = HotelManager()
     start_date = '2024-09-25'
     end_date = '2024-09-26'
-    room_id, room_str = hotel_manager.reserve_room("Barkın Öz", "5365363636", "c.barkinozer@gmail.com", "single", "2024-10-03", "2024-10-07", 1, 1, "credit card", True, "Planning to arrive between 00:00 and 02:00.")
-    print(hotel_manager.cancel_reservation(room_id=room_id))
+    room_id, reservation_id, room_str = hotel_manager.reserve_room("Barkın Öz", "5365363636", "c.barkinozer@gmail.com", "single", "2024-10-03", "2024-10-07", 1, 1, "credit card", True, "Planning to arrive between 00:00 and 02:00.")
+    print(hotel_manager.cancel_reservation(reservation_id=reservation_id))
     print(hotel_manager.reserve_room("Barkın Öz", "5365363636", "c.barkinozer@gmail.com", "suite", "2024-10-01", "2024-10-05", 2, 1, "credit card", True, "Planning to arrive between 00:00 and 02:00."))
     print(hotel_manager.reserve_room("Barkın Öz", "5365363636", "c.barkinozer@gmail.com", "suite", "2024-10-01", "2024-10-05", 2, 1, "credit card", True, "Planning to arrive between 00:00 and 02:00."))
     print(hotel_manager.reserve_room("Barkın Öz", "5365363636", "c.barkinozer@gmail.com", "suite", "2024-10-06", "2024-10-08", 2, 1, "credit card", True, "Planning to arrive between 00:00 and 02:00."))
@@ -0,0 +1,126 @@
+"""Background document ingestion jobs and their progress."""
+
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class IngestionJob:
+    def __init__(self, file_names: list[str]):
+        # Progress is written by the worker thread and read by the status endpoint
+        self.job_id = uuid.uuid4().hex
+        self.file_names = file_names
+        self.stage = "queued"
+        self.pages_processed = 0
+        self.chunks_embedded = 0
+        self.error = None
+        self.embedding_started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    def set_stage(self, stage: str) -> None:
+        with self.lock:
+            self.stage = stage
+            if stage == "embedding" and self.embedding_started_at is None:
+                self.embedding_started_at = time.time()
+            if stage in ("done", "failed"):
+                self.finished_at = time.time()
+
+    def add_pages(self, count: int = 1) -> None:
+        with self.lock:
+            self.pages_processed += count
+
+    def add_chunks(self, count: int) -> None:
+        with self.lock:
+            self.chunks_embedded += count
+
+    def fail(self, error: str) -> None:
+        with self.lock:
+            self.error = error
+        self.set_stage("failed")
+
+    def is_finished(self) -> bool:
+        return self.stage in ("done", "failed")
+
+    def get_status(self) -> dict:
+        """Stage, counters and embedding throughput in chunks per second."""
+        with self.lock:
+            chunks_per_second = 0.0
+            if self.embedding_started_at is not None:
+                elapsed = (self.finished_at or time.time()) - self.embedding_started_at
+                if elapsed > 0:
+                    chunks_per_second = round(self.chunks_embedded / elapsed, 2)
+            return {
+                "job_id": self.job_id,
+                "files": self.file_names,
+                "stage": self.stage,
+                "pages_processed": self.pages_processed,
+                "chunks_embedded": self.chunks_embedded,
+                "chunks_per_second": chunks_per_second,
+                "error": self.error
+            }
+
+
+class IngestionQueue:
+    def __init__(self, max_workers: int = 2, max_jobs: int = 100):
+        # Jobs run on a thread pool, only the last max_jobs jobs are kept for status requests
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, work: callable, file_names: list[str], *args) -> IngestionJob:
+        """Queues work(job, *args) and returns the job right away."""
+        job = IngestionJob(file_names)
+        with self.lock:
+            self.jobs[job.job_id] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+        self.executor.submit(self._run, job, work, args)
+        return job
+
+    def _run(self, job: IngestionJob, work: callable, args: tuple) -> None:
+        try:
+            work(job, *args)
+            job.set_stage("done")
+        except Exception as e:
+            print(f"[DEBUG] Ingestion job {job.job_id} failed: {e}")
+            job.fail(str(e))
+
+    def get_job(self, job_id: str) -> IngestionJob:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+
+_shared_ingestion_queue = None
+_shared_ingestion_queue_lock = threading.Lock()
+
+
+def get_ingestion_queue() -> IngestionQueue:
+    """Returns the process-wide ingestion queue, INGESTION_WORKERS sets its worker count."""
+    global _shared_ingestion_queue
+    with _shared_ingestion_queue_lock:
+        if _shared_ingestion_queue is None:
+            _shared_ingestion_queue = IngestionQueue(max_workers=int(os.getenv("INGESTION_WORKERS", "2")))
+        return _shared_ingestion_queue
+
+
+_shared_extraction_pool = None
+_shared_extraction_pool_lock = threading.Lock()
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Returns the process-wide text extraction pool, EXTRACTION_WORKERS sets its size and 0 extracts on the ingestion thread."""
+    global _shared_extraction_pool
+    with _shared_extraction_pool_lock:
+        max_workers = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+        if max_workers <= 0:
+            return None
+        if _shared_extraction_pool is None:
+            # Spawned workers only import the extraction module instead of forking the server with its threads
+            _shared_extraction_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return _shared_extraction_pool
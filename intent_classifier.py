@@ -0,0 +1,140 @@
+"""Local intent classifier that answers confident routing decisions without an LLM call."""
+
+import os
+import re
+import math
+import random
+import sqlite3
+import threading
+
+LABELS = ["booking", "status", "cancel", "question"]
+
+# Few-shot examples of the routing prompt and similar turns, logged LLM decisions are added to them
+SEED_EXAMPLES = [
+    ("Hello, My name is Arda Yılmaz. You can reach me at 123-456-7890 or via email at arda.yilmaz@example.com. We plan to arrive on September 10, 2024, between 1:00 PM and 3:00 PM, and depart on September 20, 2024. My wife and I will be staying in an economy room. I intend to pay with a MasterCard. We would also like to include breakfasts with our stay.", "booking"),
+    ("I want breakfast. burak@gmail.com. credit card. Burak Çivit.", "booking"),
+    ("yes sorry, it is barorkar@gmail.com", "booking"),
+    ("I want to book a single room from 2024-10-03 to 2024-10-07.", "booking"),
+    ("Please reserve a double room for 3 people.", "booking"),
+    ("Book me a suite for next weekend, I will pay by credit card.", "booking"),
+    ("My phone number is 5365363636 and my email is test@example.com.", "booking"),
+    ("We are two guests, arriving on 15 August and leaving on the 24th.", "booking"),
+    ("I would like to make a reservation.", "booking"),
+    ("Rezervasyon yapmak istiyorum, iki kişiyiz.", "booking"),
+    ("Do you have a room for three people?", "status"),
+    ("Are there any free rooms?", "status"),
+    ("Which rooms are available?", "status"),
+    ("How many single rooms are available right now?", "status"),
+    ("Is there an available suite?", "status"),
+    ("Do you have any double rooms left?", "status"),
+    ("Boş odanız var mı?", "status"),
+    ("I changed my mind. Please cancel my booking/reservation.", "cancel"),
+    ("Cancel my reservation.", "cancel"),
+    ("I want to cancel my booking.", "cancel"),
+    ("Please cancel it, I am not coming.", "cancel"),
+    ("Can you cancel the room I booked?", "cancel"),
+    ("Rezervasyonumu iptal et.", "cancel"),
+    ("Hey, I am Barkın Özer. I am planning a vacation in Antalya on August 5, 2024. I wanted to know first, can I book a conference room? Because if we decide to book your hotel, I need a place to do meetings.", "question"),
+    ("What time is check-in and check-out?", "question"),
+    ("What are the meal times?", "question"),
+    ("Do you offer free Wi-Fi?", "question"),
+    ("Is breakfast included in the room rate?", "question"),
+    ("Do you have a swimming pool?", "question"),
+    ("Is there a gym? Is it extra?", "question"),
+    ("What is the email of the hotel?", "question"),
+    ("Are pets allowed?", "question"),
+    ("Where is the hotel located?", "question"),
+    ("Kahvaltı saat kaçta?", "question"),
+]
+
+EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+def _get_features(text: str) -> list[str]:
+    """Words, word pairs and character trigrams, emails and numbers are replaced by placeholders."""
+    text = EMAIL_PATTERN.sub(" __email__ ", text.lower())
+    text = NUMBER_PATTERN.sub(" __number__ ", text)
+    words = re.findall(r"\w+", text)
+    features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    features += [f"#{word[i:i + 3]}" for word in words if not word.startswith("__") for i in range(len(word) - 2)]
+    return features
+
+
+class IntentClassifier:
+    def __init__(self, epochs: int = 40, learning_rate: float = 0.5, l2: float = 1e-4):
+        # Multinomial logistic regression over sparse features, weights are kept per label
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.weights = {label: {} for label in LABELS}
+        self.biases = {label: 0.0 for label in LABELS}
+
+    def _scores(self, features: list[str]) -> dict[str, float]:
+        value = 1 / math.sqrt(len(features)) if features else 0.0
+        return {label: self.biases[label] + sum(self.weights[label].get(feature, 0.0) for feature in features) * value for label in LABELS}
+
+    def _softmax(self, scores: dict[str, float]) -> dict[str, float]:
+        highest = max(scores.values())
+        exponents = {label: math.exp(score - highest) for label, score in scores.items()}
+        total = sum(exponents.values())
+        return {label: exponent / total for label, exponent in exponents.items()}
+
+    def fit(self, examples: list[tuple[str, str]]) -> "IntentClassifier":
+        """Trains with stochastic gradient descent on (text, label) pairs."""
+        featurized = [(_get_features(text), label) for text, label in examples if label in LABELS]
+        shuffler = random.Random(0)
+        for _ in range(self.epochs):
+            shuffler.shuffle(featurized)
+            for features, label in featurized:
+                probabilities = self._softmax(self._scores(features))
+                value = 1 / math.sqrt(len(features)) if features else 0.0
+                for candidate in LABELS:
+                    gradient = probabilities[candidate] - (1.0 if candidate == label else 0.0)
+                    weights = self.weights[candidate]
+                    for feature in features:
+                        weight = weights.get(feature, 0.0)
+                        weights[feature] = weight - self.learning_rate * (gradient * value + self.l2 * weight)
+                    self.biases[candidate] -= self.learning_rate * gradient * 0.1
+        return self
+
+    def predict_proba(self, text: str) -> dict[str, float]:
+        return self._softmax(self._scores(_get_features(text)))
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """Most likely intent and its probability."""
+        probabilities = self.predict_proba(text)
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+
+def load_logged_examples(db_name="log_data.db", limit=5000) -> list[tuple[str, str]]:
+    """Questions routed by the LLM in the logs, decisions of the local classifier are skipped."""
+    if not os.path.exists(db_name):
+        return []
+    conn = sqlite3.connect(db_name)
+    try:
+        rows = conn.execute("SELECT question, selected_function FROM logs WHERE selected_function NOT LIKE 'local:%' ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+    examples = []
+    for question, selected_function in rows:
+        labels = [label for label in LABELS if label in (selected_function or "").lower()]
+        if question and len(labels) == 1:
+            examples.append((question, labels[0]))
+    return examples
+
+
+_shared_intent_classifier = None
+_shared_intent_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier(db_name="log_data.db") -> IntentClassifier:
+    """Returns the process-wide classifier, it is trained on the seed examples and the logs on the first call."""
+    global _shared_intent_classifier
+    with _shared_intent_classifier_lock:
+        if _shared_intent_classifier is None:
+            _shared_intent_classifier = IntentClassifier().fit(SEED_EXAMPLES + load_logged_examples(db_name=db_name))
+        return _shared_intent_classifier
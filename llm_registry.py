@@ -0,0 +1,87 @@
+"""LLM clients that are created once per model name and share HTTP connection pools."""
+
+import os
+import threading
+import httpx
+from dotenv import load_dotenv
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_openai import OpenAI
+from langchain_openai import AzureOpenAI
+from langchain_groq import ChatGroq
+
+
+class LLMRegistry:
+    def __init__(self, env_file=".env"):
+        # Keep-alive connections and TLS sessions live in these HTTP clients, every OpenAI and Groq client reuses them
+        self.env_file = env_file
+        self.env_mtime = None
+        self.is_loaded = False
+        self.clients = {}
+        self.lock = threading.Lock()
+        self.http_client = httpx.Client(limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60))
+        self.http_async_client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60))
+
+    def _get_env_mtime(self):
+        return os.stat(self.env_file).st_mtime_ns if os.path.exists(self.env_file) else None
+
+    def _load_config(self) -> None:
+        # Values of a changed .env file replace the ones that were loaded before
+        is_loaded = load_dotenv(self.env_file, override=self.is_loaded)
+        print(f"[DEBUG] Is .env loaded: {is_loaded}")
+        self.env_mtime = self._get_env_mtime()
+        self.is_loaded = True
+
+    def get(self, model_name: str):
+        """Returns the client of the model, the .env file is read again only after it changes."""
+        with self.lock:
+            if not self.is_loaded or self._get_env_mtime() != self.env_mtime:
+                self.clients.clear()
+                self._load_config()
+            if model_name not in self.clients:
+                self.clients[model_name] = self._create_client(model_name)
+            return self.clients[model_name]
+
+    def reload(self) -> None:
+        """Reads the configuration again and recreates clients on their next use, e.g. after credentials are rotated."""
+        with self.lock:
+            self.clients.clear()
+            self._load_config()
+
+    def _create_client(self, model_name: str):
+        """LLM adapter using langchain wrappers."""
+        http_clients = {"http_client": self.http_client, "http_async_client": self.http_async_client}
+        if model_name == "openai":
+            OPENAI_KEY = os.getenv("OPENAI_KEY")
+            llm = OpenAI(api_key=OPENAI_KEY, model="gpt-3.5-turbo-instruct", temperature=0, **http_clients)
+        elif model_name == "azure_openai":
+            AZURE_AD_TOKEN = os.getenv("AZURE_AD_TOKEN")
+            AZURE_AD_TOKEN_PROVIDER = os.getenv("AZURE_AD_TOKEN_PROVIDER")
+            AZURE_DEPLOYMENT = os.getenv("AZURE_DEPLOYMENT")
+            AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
+            llm = AzureOpenAI(azure_ad_token=AZURE_AD_TOKEN, azure_ad_token_provider=AZURE_AD_TOKEN_PROVIDER, azure_deployment=AZURE_DEPLOYMENT, azure_endpoint=AZURE_ENDPOINT, model="gpt-3.5-turbo-instruct", temperature=0, **http_clients)
+        elif model_name == "llama3":
+            GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+            llm = ChatGroq(api_key=GROQ_API_KEY, model_name="llama3-70b-8192", temperature=0, **http_clients)
+        elif model_name == "llama3-small":
+            GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+            llm = ChatGroq(api_key=GROQ_API_KEY, model_name="llama3-8b-8192", temperature=0, **http_clients)
+        elif model_name == "gemma2-2b":
+            GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+            llm = ChatGoogleGenerativeAI(google_api_key=GOOGLE_API_KEY,model="gemma-2-2b-it", temperature=0)
+        else:
+            GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+            llm = ChatGoogleGenerativeAI(google_api_key=GOOGLE_API_KEY,model="gemini-pro", temperature=0)
+        return llm
+
+
+_shared_llm_registry = None
+_shared_llm_registry_lock = threading.Lock()
+
+
+def get_llm_registry(env_file=".env") -> LLMRegistry:
+    """Returns the process-wide LLM registry."""
+    global _shared_llm_registry
+    with _shared_llm_registry_lock:
+        if _shared_llm_registry is None:
+            _shared_llm_registry = LLMRegistry(env_file=env_file)
+        return _shared_llm_registry
@@ -1,33 +1,94 @@
 """Assistant's memory features."""
 
+import os
 from collections import deque
 
+MAX_TURNS = 5
+MAX_CHARACTERS = 1000
+MAX_SUMMARY_CHARACTERS = 300
+
+
+def render_turn(question: str, answer: str) -> str:
+    return f"<Previous Question>: {question} <Previous Answer>: {answer}"
+
+
 class Memory:
     def __init__(self):
-        self.memory_deque = deque(maxlen=5)
+        # Turns are (question, answer) tuples, the character count of their rendered form is kept while saving
+        self.turns = deque()
+        self.size = 0
+        self.summary = ""
+        self.rendered = None
+        # Dropped turns wait here to be summarized when MEMORY_SUMMARY is on, otherwise they are forgotten
+        self.summarize = os.getenv("MEMORY_SUMMARY", "0") == "1"
+        self.evicted = []
+        self.summarizing = False
+
+    @property
+    def memory_deque(self) -> list[str]:
+        """Turns in their prompt format."""
+        return [render_turn(question, answer) for question, answer in self.turns]
 
     def save(self, question, answer) -> None:
-        """Saves to a deque and keeps the element count less than 5."""
-        concatenated_memory = ''.join(self.memory_deque)
-        if len(self.memory_deque) >= 5 or (len(concatenated_memory) + len(question)) > 1000:
-            self.memory_deque.popleft()      
-        self.memory_deque.append(f"<Previous Question>: {question} <Previous Answer>: {answer}")
-    
+        """Saves the turn and keeps the turn count less than 5 and the history around 1000 characters."""
+        if len(self.turns) >= MAX_TURNS or (self.size + len(question)) > MAX_CHARACTERS:
+            self._evict()
+        turn = (question, answer)
+        self.turns.append(turn)
+        self.size += len(render_turn(*turn))
+        self.rendered = None
+
+    def _evict(self) -> None:
+        turn = self.turns.popleft()
+        self.size -= len(render_turn(*turn))
+        if self.summarize:
+            self.evicted.append(turn)
+
     def get_last_answer(self) -> str:
         """Calls the last speaking turn."""
-        if self.memory_deque:
-            last_entry = self.memory_deque[-1]
-            # Extract the last answer from the stored format
-            start = last_entry.find('<Previous Answer>: ') + len('<Previous Answer>: ')
-            return last_entry[start:]
+        if self.turns:
+            return self.turns[-1][1]
         return ""
 
-    
     def get_memory(self) -> str:
-        """Remembers the all previous turns."""
-        concatenated_memory = "Chat history: <chat_history>" + ''.join(self.memory_deque) + "</chat_history>"
-        return concatenated_memory
-    
+        """Remembers the summary of the dropped turns and all the kept turns, the text is built again only after a change."""
+        if self.rendered is None:
+            summary = f"<Summary>: {self.summary} " if self.summary else ""
+            self.rendered = "Chat history: <chat_history>" + summary + "".join(render_turn(question, answer) for question, answer in self.turns) + "</chat_history>"
+        return self.rendered
+
+    def is_empty(self) -> bool:
+        """Whether there is no chat history, neither kept turns nor a summary."""
+        return not self.turns and not self.summary
+
+    def get_size(self) -> int:
+        """Characters of the kept turns."""
+        return self.size
+
+    def pop_evicted(self) -> list[tuple[str, str]]:
+        """Dropped turns that are not summarized yet."""
+        evicted, self.evicted = self.evicted, []
+        return evicted
+
+    def set_summary(self, summary: str) -> None:
+        self.summary = summary.strip()[:MAX_SUMMARY_CHARACTERS]
+        self.rendered = None
+
+    def get_turns(self) -> list[tuple[str, str]]:
+        return list(self.turns)
+
+    def load(self, turns: list, summary: str = "") -> None:
+        """Replaces the memory with saved turns and summary."""
+        self.clear()
+        for question, answer in turns:
+            self.turns.append((question, answer))
+            self.size += len(render_turn(question, answer))
+        self.summary = summary
+
     def clear(self) -> None:
         """Cleans mind."""
-        self.memory_deque.clear()
\ No newline at end of file
+        self.turns.clear()
+        self.size = 0
+        self.summary = ""
+        self.evicted = []
+        self.rendered = None
@@ -0,0 +1,134 @@
+"""Cache of LLM responses by model and prompt, every client runs with temperature 0 so equal prompts get equal answers."""
+
+import os
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+
+class LLMResponseCache:
+    def __init__(self, max_entries: int = 1000, ttl: float = 86400, db_name: str = None, bypass_models: set[str] = None):
+        # Memory tier is an LRU, the optional SQLite tier keeps responses across restarts and workers
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bypass_models = bypass_models or set()
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lock = threading.Lock()
+        self.conn = None
+        if db_name:
+            self.conn = sqlite3.connect(db_name, check_same_thread=False)
+            with self.lock:
+                self.conn.execute("PRAGMA journal_mode=WAL;")
+                self.conn.execute('''CREATE TABLE IF NOT EXISTS responses (
+                                        key TEXT PRIMARY KEY,
+                                        model TEXT,
+                                        response TEXT,
+                                        created_at REAL
+                                    )''')
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_created_at ON responses (created_at)")
+                self.conn.commit()
+
+    def _get_key(self, model_name: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, model_name: str, prompt: str) -> str:
+        """Cached response of the prompt, None if it is missing or expired."""
+        key = self._get_key(model_name, prompt)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self.entries.move_to_end(key)
+                return entry[0]
+            self.entries.pop(key, None)
+            if self.conn is None:
+                return None
+            row = self.conn.execute("SELECT response, created_at FROM responses WHERE key = ? AND created_at >= ?", (key, now - self.ttl)).fetchone()
+            if row is None:
+                return None
+            self._put_memory(key, row[0], row[1])
+            return row[0]
+
+    def put(self, model_name: str, prompt: str, response: str) -> None:
+        key = self._get_key(model_name, prompt)
+        now = time.time()
+        with self.lock:
+            self._put_memory(key, response, now)
+            if self.conn is not None:
+                self.conn.execute("INSERT OR REPLACE INTO responses (key, model, response, created_at) VALUES (?, ?, ?, ?)", (key, model_name, response, now))
+                # Oldest responses beyond the size cap and expired ones are removed
+                self.conn.execute("DELETE FROM responses WHERE created_at < ? OR key IN (SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (now - self.ttl, self.max_entries))
+                self.conn.commit()
+
+    def _put_memory(self, key: str, response: str, created_at: float) -> None:
+        self.entries[key] = (response, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_or_call(self, model_name: str, prompt: str, call: Callable[[], Awaitable[str]]) -> str:
+        """Cached response, or the response of call(). Concurrent calls with the same prompt share one upstream request."""
+        if self.max_entries <= 0 or model_name in self.bypass_models:
+            return await call()
+        response = self.get(model_name, prompt)
+        if response is not None:
+            self.hits += 1
+            return response
+        key = self._get_key(model_name, prompt)
+        task = self.in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(call())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda task: self._finish(key, model_name, prompt, task))
+        else:
+            self.coalesced += 1
+        # A cancelled caller does not cancel the request the others are waiting for
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, model_name: str, prompt: str, task: asyncio.Task) -> None:
+        self.in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        if isinstance(task.result(), str):
+            self.put(model_name, prompt, task.result())
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0
+            }
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+
+
+_shared_response_cache = None
+_shared_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> LLMResponseCache:
+    """Returns the process-wide response cache. LLM_CACHE_SIZE, LLM_CACHE_TTL, LLM_CACHE_DB and LLM_CACHE_BYPASS configure it."""
+    global _shared_response_cache
+    with _shared_response_cache_lock:
+        if _shared_response_cache is None:
+            bypass_models = {model_name.strip() for model_name in os.getenv("LLM_CACHE_BYPASS", "").split(",") if model_name.strip()}
+            _shared_response_cache = LLMResponseCache(max_entries=int(os.getenv("LLM_CACHE_SIZE", "1000")),
+                                                      ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+                                                      db_name=os.getenv("LLM_CACHE_DB") or None,
+                                                      bypass_models=bypass_models)
+        return _shared_response_cache
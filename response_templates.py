@@ -0,0 +1,176 @@
+"""Fixed responses of status, cancel and booking turns in each language, translations are written by an LLM once and saved."""
+
+import re
+import json
+import sqlite3
+import threading
+from string import Formatter
+
+TEMPLATES_DB_PATH = "templates.db"
+
+TEMPLATES = {
+    "en": {
+        "status": "Right now we have {rooms} available.",
+        "room_count": "{count} {room_type} rooms",
+        "no_rooms": "Unfortunately we have no available rooms right now.",
+        "status_dates": "From {start_date} to {end_date} we have {rooms} available.",
+        "no_rooms_dates": "Unfortunately we have no available rooms from {start_date} to {end_date}.",
+        "room_type.single": "single (1-2 people)",
+        "room_type.double": "double (3-4 people)",
+        "room_type.suite": "suite (4-5 people)",
+        "cancelled": "Your reservation is cancelled for the room with the room id: {room_id}",
+        "no_reservation": "I can't see a reservation on your account.",
+        "booking_questions": "For me to book you, please tell me your full name, phone number, email, booking start date, booking end date, guest count, room type (single (1-2 people), double (3-4 people), suite (4-5 people)), number of rooms and payment method. Also do you want breakfasts?",
+        "missing_fields": "You need to tell me these information as well please: {fields}",
+        "field.full_name": "full name",
+        "field.phone_number": "phone number",
+        "field.email": "email",
+        "field.start_date": "start date",
+        "field.end_date": "end date",
+        "field.guest_count": "guest count",
+        "field.room_type": "room type",
+        "field.number_of_rooms": "number of rooms",
+        "field.payment_method": "payment method",
+        "field.include_breakfast": "whether you want breakfast",
+        "invalid.date_format": "Dates must be in YYYY-MM-DD format. Are you sure you entered the start and end date?",
+        "invalid.date_order": "End date must be after start date.",
+        "invalid.room_type": "Room type can be either single, double, or suite.",
+        "invalid.guest_count": "Guest count must be at least 1.",
+        "invalid.number_of_rooms": "Number of rooms must be at least 1.",
+        "invalid.phone_number": "Phone number must be between 10 and 15 digits.",
+        "invalid.email": "The email format is invalid, can you check the format?",
+        "invalid.include_breakfast": "Can you tell me whether you want breakfast, yes or no?"
+    },
+    "tr": {
+        "status": "Şu anda {rooms} müsait.",
+        "room_count": "{count} adet {room_type} oda",
+        "no_rooms": "Maalesef şu anda müsait odamız yok.",
+        "status_dates": "{start_date} - {end_date} tarihleri arasında {rooms} müsait.",
+        "no_rooms_dates": "Maalesef {start_date} - {end_date} tarihleri arasında müsait odamız yok.",
+        "room_type.single": "tek kişilik (1-2 kişi)",
+        "room_type.double": "çift kişilik (3-4 kişi)",
+        "room_type.suite": "süit (4-5 kişi)",
+        "cancelled": "{room_id} numaralı odadaki rezervasyonunuz iptal edildi.",
+        "no_reservation": "Hesabınızda bir rezervasyon göremiyorum.",
+        "booking_questions": "Rezervasyonunuzu yapabilmem için lütfen adınızı soyadınızı, telefon numaranızı, e-posta adresinizi, giriş tarihinizi, çıkış tarihinizi, misafir sayısını, oda tipini (tek kişilik (1-2 kişi), çift kişilik (3-4 kişi), süit (4-5 kişi)), oda sayısını ve ödeme yönteminizi söyleyin. Kahvaltı da ister misiniz?",
+        "missing_fields": "Lütfen şu bilgileri de iletin: {fields}",
+        "field.full_name": "adınız soyadınız",
+        "field.phone_number": "telefon numaranız",
+        "field.email": "e-posta adresiniz",
+        "field.start_date": "giriş tarihi",
+        "field.end_date": "çıkış tarihi",
+        "field.guest_count": "misafir sayısı",
+        "field.room_type": "oda tipi",
+        "field.number_of_rooms": "oda sayısı",
+        "field.payment_method": "ödeme yöntemi",
+        "field.include_breakfast": "kahvaltı isteyip istemediğiniz",
+        "invalid.date_format": "Tarihler YYYY-AA-GG biçiminde olmalı. Giriş ve çıkış tarihini yazdığınızdan emin misiniz?",
+        "invalid.date_order": "Çıkış tarihi giriş tarihinden sonra olmalı.",
+        "invalid.room_type": "Oda tipi tek kişilik, çift kişilik veya süit olabilir.",
+        "invalid.guest_count": "Misafir sayısı en az 1 olmalı.",
+        "invalid.number_of_rooms": "Oda sayısı en az 1 olmalı.",
+        "invalid.phone_number": "Telefon numarası 10 ile 15 rakam arasında olmalı.",
+        "invalid.email": "E-posta adresinin biçimi geçersiz, kontrol edebilir misiniz?",
+        "invalid.include_breakfast": "Kahvaltı isteyip istemediğinizi söyler misiniz, evet mi hayır mı?"
+    }
+}
+
+
+def _get_placeholders(template: str) -> set[str]:
+    return {field_name for _, field_name, _, _ in Formatter().parse(template) if field_name}
+
+
+def render(templates: dict, key: str, **values) -> str:
+    return templates[key].format(**values)
+
+
+def render_room_status(templates: dict, room_counts: dict[str, int], start_date: str = None, end_date: str = None) -> str:
+    """Available rooms of each type in one sentence, for the given dates or right now."""
+    rooms = [render(templates, "room_count", count=count, room_type=templates.get(f"room_type.{room_type}", room_type))
+             for room_type, count in room_counts.items() if count > 0]
+    if start_date:
+        if not rooms:
+            return render(templates, "no_rooms_dates", start_date=start_date, end_date=end_date)
+        return render(templates, "status_dates", rooms=", ".join(rooms), start_date=start_date, end_date=end_date)
+    if not rooms:
+        return render(templates, "no_rooms")
+    return render(templates, "status", rooms=", ".join(rooms))
+
+
+def render_missing_fields(templates: dict, field_names: list[str]) -> str:
+    fields = ", ".join(templates.get(f"field.{field_name}", field_name.replace("_", " ")) for field_name in field_names)
+    return render(templates, "missing_fields", fields=fields)
+
+
+class ResponseTemplates:
+    def __init__(self, db_name=TEMPLATES_DB_PATH):
+        # Built-in templates are used as they are, translated ones are read from SQLite once per language
+        self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.translations = {}
+        with self.lock:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS translations (
+                                    language TEXT PRIMARY KEY,
+                                    templates TEXT
+                                )''')
+            self.conn.commit()
+
+    def get(self, language: str) -> dict:
+        """Templates of the language, None if they are not written yet or were written before templates were added."""
+        if language in TEMPLATES:
+            return TEMPLATES[language]
+        with self.lock:
+            if language not in self.translations:
+                row = self.conn.execute("SELECT templates FROM translations WHERE language = ?", (language,)).fetchone()
+                if row is None or set(json.loads(row[0])) != set(TEMPLATES["en"]):
+                    return None
+                self.translations[language] = json.loads(row[0])
+            return self.translations[language]
+
+    def get_translation_prompt(self, language: str) -> str:
+        return f"""
+        Translate the values of the following JSON object into the {language} language.
+        The tone is friendly and neutral, like a hotel reservation assistant texting a guest.
+        Keep the keys and the placeholders in curly braces such as {{room_id}} exactly as they are.
+        Do not give any other response than JSON.
+
+        {json.dumps(TEMPLATES["en"], ensure_ascii=False, indent=2)}
+        """
+
+    def add_translation(self, language: str, response: str) -> dict:
+        """Saves the translated templates if every key and placeholder is kept, otherwise returns None."""
+        match = re.search(r"\{.*\}", response, re.S)
+        try:
+            templates = json.loads(match.group(0)) if match else None
+        except json.JSONDecodeError:
+            templates = None
+        if not isinstance(templates, dict) or set(templates) != set(TEMPLATES["en"]):
+            return None
+        for key, template in TEMPLATES["en"].items():
+            try:
+                if not isinstance(templates[key], str) or _get_placeholders(templates[key]) != _get_placeholders(template):
+                    return None
+            except ValueError:
+                # Unbalanced braces
+                return None
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO translations (language, templates) VALUES (?, ?)", (language, json.dumps(templates, ensure_ascii=False)))
+            self.conn.commit()
+            self.translations[language] = templates
+        return templates
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+_shared_response_templates = None
+_shared_response_templates_lock = threading.Lock()
+
+
+def get_response_templates(db_name=TEMPLATES_DB_PATH) -> ResponseTemplates:
+    """Returns the process-wide response templates."""
+    global _shared_response_templates
+    with _shared_response_templates_lock:
+        if _shared_response_templates is None:
+            _shared_response_templates = ResponseTemplates(db_name=db_name)
+        return _shared_response_templates
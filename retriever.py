@@ -0,0 +1,110 @@
+"""Resident vector store that is loaded once and swapped after document uploads."""
+
+import os
+import threading
+from contextlib import contextmanager
+from langchain_community.vectorstores import FAISS
+from embedding_cache import CachedEmbeddings, get_embedding_cache
+from document_store import INDEX_PATH, DOCSTORE_PATH, SQLiteDocstore, ChunkIdMapping, FileLock, read_index
+
+
+class ReadWriteLock:
+    def __init__(self):
+        # Any number of readers can hold the lock, a writer waits until they are all gone
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writing = False
+
+    @contextmanager
+    def read(self):
+        with self.condition:
+            while self.writing:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.condition:
+            while self.writing or self.readers > 0:
+                self.condition.wait()
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+
+
+_embeddings = {}
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings(model_name: str) -> CachedEmbeddings:
+    """Embedding models are created once per model name, document vectors go through the on-disk cache."""
+    with _embeddings_lock:
+        if model_name not in _embeddings:
+            _embeddings[model_name] = CachedEmbeddings(model_name=model_name, cache=get_embedding_cache())
+        return _embeddings[model_name]
+
+
+class Retriever:
+    def __init__(self, index_path=INDEX_PATH, docstore_path=DOCSTORE_PATH):
+        # Questions read the current vector store, uploads replace it as a whole
+        self.index_path = index_path
+        self.docstore = SQLiteDocstore(docstore_path)
+        self.vector_store = None
+        self.version = 0
+        self.loaded_mtime = None
+        self.lock = ReadWriteLock()
+        # Ingestion jobs of every worker take this lock while they read, update and replace the index files
+        self.write_lock = FileLock(f"{index_path}.lock")
+
+    def load(self) -> any:
+        """Reads the saved index from disk, keeps None if nothing is uploaded yet."""
+        if not os.path.exists(self.index_path):
+            return None
+        mtime = os.stat(self.index_path).st_mtime_ns
+        embeddings = get_embeddings(self.docstore.get_meta("embedder"))
+        vector_store = FAISS(embedding_function=embeddings, index=read_index(self.index_path), docstore=self.docstore, index_to_docstore_id=ChunkIdMapping())
+        self.swap(vector_store)
+        self.loaded_mtime = mtime
+        return vector_store
+
+    def refresh(self) -> any:
+        """Reloads the index if another worker has written a newer one."""
+        if os.path.exists(self.index_path) and os.stat(self.index_path).st_mtime_ns != self.loaded_mtime:
+            self.load()
+        return self.get_vector_store()
+
+    def get_vector_store(self) -> any:
+        """Returns the current vector store, callers keep using it even if a newer one is swapped in."""
+        with self.lock.read():
+            return self.vector_store
+
+    def swap(self, vector_store: any) -> None:
+        """Replaces the vector store atomically, new questions see the new one."""
+        with self.lock.write():
+            self.vector_store = vector_store
+            self.version += 1
+
+
+_shared_retriever = None
+_shared_retriever_lock = threading.Lock()
+
+
+def get_retriever(index_path=INDEX_PATH, docstore_path=DOCSTORE_PATH) -> Retriever:
+    """Returns the process-wide retriever, the vector store is loaded on the first call."""
+    global _shared_retriever
+    with _shared_retriever_lock:
+        if _shared_retriever is None:
+            _shared_retriever = Retriever(index_path=index_path, docstore_path=docstore_path)
+            _shared_retriever.load()
+        return _shared_retriever
@@ -1,86 +1,331 @@
 import os
-import PyPDF2
-from docx import Document
+import time
+import asyncio
 from fastapi import UploadFile
 from user import User
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import OpenAI
-from langchain_openai import AzureOpenAI
-from langchain_groq import ChatGroq
-import pickle
 from datetime import datetime
-import io
-from dotenv import load_dotenv
-import json
-from booking import Booking
+from collections import deque
+from typing import Iterable, Iterator
+from booking import Booking, BOOKING_FIELDS
 import sqlite3
 from langdetect import detect
+from retriever import get_retriever, get_embeddings
+from document_store import hash_chunk, build_index, add_to_index, remove_from_index, read_index, write_index
+from ingestion import IngestionJob, get_ingestion_queue, get_extraction_pool
+from extraction import split_parts, iter_part, ExtractionWindow
+from llm_registry import get_llm_registry
+from intent_classifier import get_intent_classifier
+from answer_cache import get_answer_cache
+from response_cache import get_response_cache
+from session_store import get_session_store
+from faq_answers import parse_qa_pairs, get_faq_store
+from booking_extractor import extract_booking_fields, extract_stay, merge_booking_fields, has_booking_content, normalize_field, repair_json
+from response_templates import TEMPLATES, get_response_templates, render, render_room_status, render_missing_fields
+
+# References of fire-and-forget tasks, so they are not garbage collected before they finish
+BACKGROUND_TASKS = set()
 
-USER_STORE = {}
 
 async def upload_documents(user: User, files: list[UploadFile], password:str) -> tuple[str, int]:
-    """Checking the password, extracting texts, chunking and creating embeddings from them."""
+    """Checking the password and queueing an ingestion job, the job id is returned right away."""
     ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
     if password != ADMIN_PASSWORD:
         return "Only ADMIN can insert files.", 400
-    text = await _extract_text_from_document(files)
-    chunks = await _chunk_text(text)
-    await _create_embeddings_and_save(user, chunks)
-    return "Document is uploaded successfully.", 200
-
-
-async def _extract_text_from_document(files: list[UploadFile]) -> str:
-    """Extracting text from documents."""
-    text = ""
+    # Uploaded files are closed after the response, so their bytes are read here
+    documents = []
     for file in files:
-        byte_object = await file.read()
-        file_name = file.filename
-        file_extension = os.path.splitext(file_name)[1]
-        if file_extension == '.txt':
-            text += byte_object.decode('utf-8')
-        elif file_extension == '.pdf':
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(byte_object))
-            for page_number in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_number]
-                text += page.extract_text()
-        elif file_extension == '.docx':
-            doc = Document(io.BytesIO(byte_object))
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-    return text
-
-
-async def _chunk_text(text: str) -> list[str]:
-    """Splitting text to chunks to get better semantic matches."""
-    chunks = None
-    text_splitter = CharacterTextSplitter(
-        separator="\n",
-        chunk_size=1000,
-        chunk_overlap=20,
-        length_function=len
-    )
-    chunks = text_splitter.split_text(text)
-    return chunks
-
-
-async def _create_embeddings_and_save(user: User, chunks: any) -> FAISS:
-    """An embedding model is running on CPU to create embeddings and save to local"""
-    embeddings = HuggingFaceEmbeddings(model_name=user.embedder)
-    pkl_name = os.path.join("document.pkl")
-    vector_store = FAISS.from_texts(chunks, embeddings, metadatas=[{"source": f"{pkl_name}:{i}"} for i in range(len(chunks))])
-    with open(pkl_name, "wb") as f:
-        pickle.dump(vector_store, f)
-    return vector_store
+        documents.append((file.filename, await file.read()))
+    job = get_ingestion_queue().submit(_ingest, [file_name for file_name, _ in documents], user, documents)
+    return job.job_id, 202
+
+
+async def get_ingestion_status(job_id: str) -> tuple[dict | str, int]:
+    """Progress of an ingestion job."""
+    job = get_ingestion_queue().get_job(job_id)
+    if job is None:
+        return "Ingestion job not found.", 404
+    return job.get_status(), 200
+
+
+def _ingest(job: IngestionJob, user: User, documents: list[tuple[str, bytes]]) -> None:
+    """Extracting texts, chunking and creating embeddings from them on an ingestion worker."""
+    # Extraction and chunking are generators, they run while the embedding step consumes their chunks
+    job.set_stage("embedding")
+    pool = get_extraction_pool()
+    # One window of EXTRACTION_WORKERS parts is shared by every file of the upload
+    window = ExtractionWindow(pool, max(1, int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1))))) if pool is not None else None
+    languages = [language.strip() for language in os.getenv("FAQ_LANGUAGES", "").split(",") if language.strip()]
+    chunks = {}
+    texts = {}
+    try:
+        for file_name, byte_object in documents:
+            segments = _extract_segments(file_name, byte_object, job, window)
+            if languages:
+                # Texts are kept for the FAQ stage while the chunks are embedded
+                texts[file_name] = []
+                segments = _collect_texts(segments, texts[file_name])
+            chunks[file_name] = _chunk_segments(segments)
+        if window is not None:
+            window.start()
+        _create_embeddings_and_save(user, chunks, job)
+    finally:
+        if window is not None:
+            window.close()
+    if languages:
+        job.set_stage("faq")
+        for file_name, file_texts in texts.items():
+            _save_faq_answers(user, file_name, "\n".join(file_texts), languages)
+
+
+def _collect_texts(segments: Iterable[tuple[str, dict]], texts: list[str]) -> Iterator[tuple[str, dict]]:
+    """Passes the segments through and appends their texts to the given list."""
+    for text, metadata in segments:
+        texts.append(text)
+        yield text, metadata
+
+
+def _save_faq_answers(user: User, source: str, text: str, languages: list[str]) -> None:
+    """Q:/A: pairs of a document are saved with their question embeddings and an answer in each language. Answers of unchanged pairs are reused."""
+    pairs = parse_qa_pairs(text)
+    faq_store = get_faq_store()
+    vectors = get_embeddings(user.embedder).embed_documents([question for question, _ in pairs]) if pairs else []
+    entries = []
+    for (question, answer), vector in zip(pairs, vectors):
+        pair_hash = hash_chunk(f"{question}\n{answer}")
+        answers = faq_store.get_answers(pair_hash)
+        for language in languages:
+            if language in answers:
+                continue
+            try:
+                answers[language] = _write_faq_answer(user, question, answer, language)
+            except Exception as e:
+                # The question is answered by the RAG pipeline in this language
+                print(f"[DEBUG] FAQ answer could not be written in {language}: {e}")
+        entries.append({"question": question, "answer": answer, "pair_hash": pair_hash, "vector": vector, "answers": answers})
+    faq_store.save_source(source, user.embedder, entries)
+    print(f"[DEBUG] FAQ answers are saved for {len(entries)} questions of {source}")
+
+
+def _write_faq_answer(user: User, question: str, answer: str, language: str) -> str:
+    """Polished answer of an FAQ pair in the language, it runs on the ingestion worker. Raises asyncio.TimeoutError after LLM_TIMEOUT seconds,
+    so a provider that does not answer can not keep the ingestion job from finishing."""
+    system_message = f"""
+    You are a reservation assistant who books and reserves places.
+    Your task is to answer the question using the information provided to you.
+    The tone of your answers is friendly and neutral.
+    NEVER use information outside of what is provided to you.
+    Answer ONLY in the {language} language.
+    Your answer will be directly send to the user so do not say something like "here is my response:"
+    """
+    prompt = f" System Message: {system_message} <Question>: {question} <Information>: {answer}"
+    timeout = float(os.getenv("LLM_TIMEOUT", "30"))
+    # The ingestion worker has no event loop, the call gets one of its own
+    final_answer = asyncio.run(asyncio.wait_for(get_llm_registry().get(user.llm).ainvoke(prompt), timeout=timeout))
+    return getattr(final_answer, "content", final_answer)
+
+
+def _extract_segments(file_name: str, byte_object: bytes, job: IngestionJob = None, window: ExtractionWindow = None) -> Iterator[tuple[str, dict]]:
+    """Text segments of a document in order. With an extraction window, files and PDF page ranges are extracted in parallel on the pool."""
+    parts = split_parts(file_name, byte_object, pages_per_part=int(os.getenv("EXTRACTION_PAGES_PER_PART", "16")))
+    if window is not None:
+        part_segments = window.results(window.add(file_name, byte_object, parts))
+    else:
+        part_segments = (iter_part(file_name, byte_object, start, end) for start, end in parts)
+    return _count_pages(parts, part_segments, job)
+
+
+def _count_pages(parts: list[tuple[int, int]], part_segments: Iterable[Iterable[tuple[str, dict]]], job: IngestionJob = None) -> Iterator[tuple[str, dict]]:
+    """Yields the segments of each part and reports its pages as processed."""
+    for (start, end), segments in zip(parts, part_segments):
+        yield from segments
+        if job:
+            job.add_pages(end - start)
+
+
+def _chunk_segments(segments: Iterable[tuple[str, dict]], chunk_size: int = 1000, chunk_overlap: int = 20, separator: str = "\n") -> Iterator[tuple[str, dict]]:
+    """Splitting text to chunks to get better semantic matches. Lines are merged up to chunk_size and only the current chunk is kept in memory."""
+    lines = deque()
+    length = 0
+    for text, metadata in segments:
+        for line in text.split(separator):
+            if not line:
+                continue
+            if lines and length + len(separator) + len(line) > chunk_size:
+                yield separator.join(line_text for line_text, _ in lines).strip(), lines[0][1]
+                # Last lines up to chunk_overlap characters are repeated in the next chunk
+                while lines and (length > chunk_overlap or length + len(separator) + len(line) > chunk_size):
+                    removed, _ = lines.popleft()
+                    length -= len(removed) + (len(separator) if lines else 0)
+            length += len(line) + (len(separator) if lines else 0)
+            lines.append((line, metadata))
+    if lines:
+        yield separator.join(line_text for line_text, _ in lines).strip(), lines[0][1]
+
+
+def _create_embeddings_and_save(user: User, chunks: dict[str, Iterable[tuple[str, dict]]], job: IngestionJob = None) -> FAISS:
+    """An embedding model is running on CPU to embed only the new chunks of each document in batches, chunks that are no longer in a re-uploaded document are removed."""
+    embeddings = get_embeddings(user.embedder)
+    retriever = get_retriever()
+    docstore = retriever.docstore
+    batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+    # Only one job at a time updates the index
+    with retriever.write_lock:
+        # Chunks replaced by the previous upload are not in any served index anymore
+        docstore.purge_stale()
+        index, is_changed = _get_index_for_update(user, embeddings, retriever)
+        added_chunk_ids, stale_chunk_ids = [], []
+        try:
+            for source, source_chunks in chunks.items():
+                saved_hashes = docstore.get_source_hashes(source)
+                uploaded_hashes = set()
+                batch = []
+                for i, (chunk, metadata) in enumerate(source_chunks):
+                    chunk_hash = hash_chunk(chunk)
+                    if chunk_hash in uploaded_hashes:
+                        continue
+                    uploaded_hashes.add(chunk_hash)
+                    if chunk_hash not in saved_hashes:
+                        batch.append((chunk, {**metadata, "chunk": i}, chunk_hash))
+                    if len(batch) >= batch_size:
+                        index = _embed_batch(embeddings, docstore, index, batch, added_chunk_ids, job)
+                        batch = []
+                if batch:
+                    index = _embed_batch(embeddings, docstore, index, batch, added_chunk_ids, job)
+                stale_chunk_ids += [chunk_id for chunk_hash, chunk_id in saved_hashes.items() if chunk_hash not in uploaded_hashes]
+
+            if not added_chunk_ids and not stale_chunk_ids and not is_changed:
+                return retriever.get_vector_store()
+            if stale_chunk_ids and index is not None:
+                remove_from_index(index, stale_chunk_ids)
+            if index is None:
+                return None
+
+            if job:
+                job.set_stage("saving")
+            docstore.set_meta("embedder", user.embedder)
+            write_index(index, retriever.index_path)
+        except Exception:
+            # Chunks that did not reach the saved index would be skipped as duplicates by the next upload
+            docstore.delete(added_chunk_ids)
+            raise
+        vector_store = retriever.load()
+        # Cached answers were written from the previous document
+        get_answer_cache().invalidate()
+        # Searches on the previous index and workers that did not refresh yet can still read stale chunks until the next upload
+        docstore.mark_stale(stale_chunk_ids)
+        return vector_store
+
+
+def _embed_batch(embeddings: any, docstore: any, index: any, batch: list[tuple[str, dict, str]], added_chunk_ids: list[int], job: IngestionJob = None) -> any:
+    """Embeds a batch of chunks, saves them to the docstore and adds them to the index."""
+    texts = [chunk for chunk, _, _ in batch]
+    vectors = embeddings.embed_documents(texts)
+    chunk_ids = docstore.add_chunks(texts, [metadata for _, metadata, _ in batch], [chunk_hash for _, _, chunk_hash in batch])
+    added_chunk_ids += chunk_ids
+    if job:
+        job.add_chunks(len(batch))
+    if index is None:
+        return build_index(vectors, chunk_ids)
+    add_to_index(index, vectors, chunk_ids)
+    return index
+
+
+def _get_index_for_update(user: User, embeddings: any, retriever: any) -> tuple[any, bool]:
+    """Writable copy of the saved index. It is rebuilt from the docstore if it is missing or was built with another embedder."""
+    docstore = retriever.docstore
+    if os.path.exists(retriever.index_path) and docstore.get_meta("embedder") == user.embedder:
+        return read_index(retriever.index_path), False
+    saved_chunks = docstore.get_chunks()
+    if not saved_chunks:
+        return None, False
+    vectors = embeddings.embed_documents([content for _, content in saved_chunks])
+    return build_index(vectors, [chunk_id for chunk_id, _ in saved_chunks]), True
 
 
 async def ask_question(user: User, question: str) -> tuple[str, int]: 
-    """Customer's inquiry is answered. First user object is retrieved from unique username. Language preference is set if None. Inquirys type is decided using an LLM call."""
+    """Customer's inquiry is answered. First user object is retrieved from unique username. Language preference is set if None. Inquirys type is decided by the local intent classifier or an LLM call.
+    Routing, language detection and the FAQ retrieval run concurrently, retrieval results are discarded if the inquiry is not a question."""
     user = await _get_saved_user(user)
-    if user.get_language_preference() == None:
-        user.set_language_preference(language_preference=detect(question))
+    retrieval = None
+    if os.getenv("SPECULATIVE_RETRIEVAL", "1") == "1":
+        retrieval = asyncio.create_task(_retrieve(user, question))
+    try:
+        if user.get_language_preference() == None:
+            selected_function, language = await asyncio.gather(_route(user, question), asyncio.to_thread(detect, question))
+            user.set_language_preference(language_preference=language)
+        else:
+            selected_function = await _route(user, question)
+        if retrieval and "question" not in selected_function.lower():
+            _discard(retrieval)
+            retrieval = None
+
+        if "booking" in selected_function.lower():
+            final_answer, memory, system_message, http_code = await _book(user, question)
+        if "status" in selected_function.lower():
+            final_answer, memory, system_message, http_code = await _status(user, question)
+        if "cancel" in selected_function.lower():
+            final_answer, memory, system_message, http_code = await _cancel(user, question)
+        elif "question" in selected_function.lower():
+            final_answer, memory, system_message, http_code = await _rag(user, question, retrieval=retrieval)
+        else:
+            "Can you explain your request in a different way with more details? I could not understand.", memory, system_message, 400
+    except asyncio.TimeoutError:
+        return "The assistant is taking too long to answer, please try again.", 504
+    finally:
+        if retrieval and not retrieval.done():
+            _discard(retrieval)
+
+    print(f"[DEBUG] Selected Function: {selected_function}")
+    
+    user.memory.save(question=question, answer=final_answer)
+    if user.memory.evicted and not user.memory.summarizing:
+        task = asyncio.create_task(_summarize_memory(user))
+        BACKGROUND_TASKS.add(task)
+        task.add_done_callback(BACKGROUND_TASKS.discard)
+    await _save_user(user)
+    await _log(user=user, memory=memory, question=question, selected_function= selected_function, final_answer = final_answer)
+    return final_answer, http_code
+
+async def _summarize_memory(user: User) -> None:
+    """Dropped turns are folded into one short digest in the background, so long conversations keep their context without growing the prompt."""
+    memory = user.memory
+    memory.summarizing = True
+    try:
+        while memory.evicted:
+            turns = "".join(f"<Question>: {question} <Answer>: {answer} " for question, answer in memory.pop_evicted())
+            prompt = f"""
+                Update the summary of a conversation between a hotel guest and a reservation assistant with the new turns.
+                Keep the facts the guest gave such as names, dates, room preferences and requests. Write at most three short sentences.
+                Do not give any other response than the summary.
+                <summary>: {memory.summary} <new_turns>: {turns}
+            """
+            memory.set_summary(await _ask_llm(user=user, prompt=prompt, llm="llama3-small"))
+        # Only the summary is written, the request may have saved newer turns in the meantime
+        await asyncio.to_thread(get_session_store().save_summary, user)
+    except Exception as e:
+        print(f"[DEBUG] Memory summary failed: {e}")
+    finally:
+        memory.summarizing = False
+
+
+async def _route(user: User, question: str) -> str:
+    """Confident inquiries are routed by the local classifier in milliseconds, the rest by an LLM call.
+    Only intents in LOCAL_INTENTS are acted on locally, booking and cancelling change reservations and are always confirmed by the LLM."""
+    # Training on the logs is slow, the first call runs on a thread instead of blocking the event loop
+    classifier = await asyncio.to_thread(get_intent_classifier)
+    intent, confidence = classifier.predict(question)
+    local_intents = {name.strip() for name in os.getenv("LOCAL_INTENTS", "question,status").split(",")}
+    if intent in local_intents and confidence >= float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.8")):
+        print(f"[DEBUG] Local intent: {intent} ({confidence:.2f})")
+        # Prefix keeps local decisions out of the classifier's training data
+        return f"local:{intent}"
+    return await _classify_with_llm(user, question)
+
+
+async def _classify_with_llm(user: User, question: str) -> str:
+    """Inquiry type is decided using an LLM call."""
     system_message = f"""
         Your task is to classify customer inquiries related to booking or reservation.
         Based on the content of the inquiry, provide the appropriate response from the following options:
@@ -134,51 +379,59 @@ async def ask_question(user: User, question: str) -> tuple[str, int]:
         Now it's your turn:
     """
     prompt = f" System Message: {system_message} <Inquiry>: {question}"
-    selected_function = await _ask_llm(user=user,prompt=prompt)
-    
-    if "booking" in selected_function.lower():
-        final_answer, memory, system_message, http_code = await _book(user, question)
-    if "status" in selected_function.lower():
-        final_answer, memory, system_message, http_code = await _status(user, question)
-    if "cancel" in selected_function.lower():
-        final_answer, memory, system_message, http_code = await _cancel(user, question)
-    elif "question" in selected_function.lower():
-        final_answer, memory, system_message, http_code = await _rag(user, question)
-    else:
-        "Can you explain your request in a different way with more details? I could not understand.", memory, system_message, 400
-
-    print(f"[DEBUG] Selected Function: {selected_function}")
-    
-    user.memory.save(question=question, answer=final_answer)
-    await _log(user=user, memory=memory, question=question, selected_function= selected_function, final_answer = final_answer)
-    return final_answer, http_code
+    return await _ask_llm(user=user,prompt=prompt)
 
 async def _status(user:User, question:str)-> tuple[str,str,str,int]:
-    """Retrieve room availability status and return to the user."""
-    answer = user.get_hotel_management().get_room_status()
+    """Retrieve room availability status and return to the user. Dates in the question are used, otherwise tonight's availability is given."""
+    stay = extract_stay(question)
+    start_date, end_date = stay if stay else (None, None)
+    room_counts = user.get_hotel_management().get_available_room_counts(start_date, end_date)
     memory = user.memory.get_last_answer()
-    language = user.get_language_preference()
-    FLUENCY_PROMPT = f"""
-        As a realtime chatbot you are texting with the user.
-        Your objective is to answer the user's inquiry with the specified answer in a friendly, concise, clear tone.
-        Do not greet the user or feel sorry.
-        Answer ONLY in the {language} language in which the question was posed.
-
-        Now it's your turn, answer the question in the {language} language with the given answer:
-    """
-    prompt = f"""{FLUENCY_PROMPT} <chat_memory>: {memory} <question>:{question} <answer>: {answer}"""
-    final_answer = await _ask_llm(user=user,prompt=prompt,llm="llama3-small")
-    return final_answer, memory, prompt, 200
+    templates = await _get_templates(user)
+    final_answer = render_room_status(templates or TEMPLATES["en"], room_counts, start_date, end_date)
+    if templates is None:
+        final_answer = await _rewrite(user, question, memory, final_answer)
+    return final_answer, memory, None, 200
 
 async def _cancel(user:User, question:str) -> tuple[str,str,str,int]:
     """Cancel reservation if the user have one."""
     room_id = user.get_room_id()
-    user.get_hotel_management().cancel_reservation(room_id)
+    reservation_id = user.get_reservation_id()
     memory = user.memory.get_last_answer()
-    if room_id:
-        answer = f"Your reservation is cancelled for the room with the room id: {room_id}"
+    if reservation_id:
+        await asyncio.to_thread(user.get_hotel_management().cancel_reservation, reservation_id)
+        user.set_room_id(room_id=None)
+        user.set_reservation_id(reservation_id=None)
+        final_answer = await _respond(user, question, memory, "cancelled", room_id=room_id)
     else:
-        answer = "I can't see a reservation on your account"
+        final_answer = await _respond(user, question, memory, "no_reservation")
+    return final_answer, memory, None, 200
+
+
+async def _get_templates(user: User) -> dict | None:
+    """Response templates of the user's language. Missing languages are translated by an LLM once, None if the translation fails."""
+    language = user.get_language_preference() or "en"
+    response_templates = get_response_templates()
+    templates = response_templates.get(language)
+    if templates is None:
+        try:
+            translation = await _ask_llm(user=user, prompt=response_templates.get_translation_prompt(language), llm="llama3-small")
+            templates = response_templates.add_translation(language, translation)
+        except Exception as e:
+            print(f"[DEBUG] Templates could not be translated to {language}: {e}")
+    return templates
+
+
+async def _respond(user: User, question: str, memory: str, key: str, **values) -> str:
+    """Template answer in the user's language, it is rewritten by an LLM only if the language has no templates."""
+    templates = await _get_templates(user)
+    if templates is None:
+        return await _rewrite(user, question, memory, render(TEMPLATES["en"], key, **values))
+    return render(templates, key, **values)
+
+
+async def _rewrite(user: User, question: str, memory: str, answer: str) -> str:
+    """The answer is rewritten in the user's language with an LLM call."""
     language = user.get_language_preference()
     FLUENCY_PROMPT = f"""
         As a realtime chatbot you are texting with the user.
@@ -188,189 +441,146 @@ async def _cancel(user:User, question:str) -> tuple[str,str,str,int]:
         ONLY answer the question do NOT answer <chat_memory>.
     """
     prompt = f"""{FLUENCY_PROMPT} <chat_memory>: {memory} <question>:{question} <answer>: {answer}"""
-    final_answer = await _ask_llm(user=user,prompt=prompt,llm="llama3-small")
-    return final_answer, memory, prompt, 200
+    return await _ask_llm(user=user,prompt=prompt,llm="llama3-small")
 
 
 async def _book(user: User, question: str):
-    """Get required information in JSON and later book the user."""
-    language = user.get_language_preference()
-    FLUENCY_PROMPT = f"""
-        As a realtime chatbot you are texting with the user.
-        Your objective is to answer the user's inquiry with the specified answer in a friendly, concise, clear tone.
-        Do not greet the user or feel sorry.
-        Answer ONLY in the {language} language in which the question was posed.
-        ONLY answer the question do NOT answer <chat_memory>.
-    """
-
-    system_message = """
-    You are responsible for getting a reservation information and creating a json from it.
-    Do not give any other response than JSON.
-    Detect the required json fields and put them in the right place.
-    
-    You need to find following values in the text and put in the JSON:
-    full_name: The full name of the customer,
-    phone_number: The phone number of the customer,
-    e_mail: The e-mail of the customer,
-    start_date: The arrival date of the customer,
-    end_date: The leaving date of the customer,
-    guest_count: The customer count,
-    room_type: What type of room they will stay,
-    rumber_of_rooms: How many rooms they want,
-    payment_method: How they will pay,
-    include_breakfast: Do they want to include breakfast as well or not,
-    note: (Optional) other informations
-
-    Do NOT forget:
-    Room type only can be single (for 1-2 people) double (for 3-4 people) or suite (for 4-5 people).
-    Dates must be in YYYY-MM-DD format.
-    End date must be after start date.
-    Guest count must be at least 1.
-    Number of rooms must be at least 1.
-    Phone number must be between 10 and 15 digits.
-    Include breakfast must be a boolean.
-
-    If you can not find the value just leave that field empty like this: ""
-
-    <Example>
-    <Human>:
-    Hi, I am Barkın Özer. You can call me from 5365363636 or mail me at c.barkinozer@gmail.com, We plan to be there at 15 August 2024 between 00.00 pm to 02.00 pm and leave at the 24 th.
-    Me and my girlfriend will stay on an economy room. I am planning to pay with visa card. We want breakfasts as well. Please include that.
-    Also can you add spa to our gym plan as well? Thanks.
-
-    <AI>:
-    {
-        "full_name": "Barkın Özer",
-        "phone_number": "5365363636",
-        "email": "c.barkinozer@gmail.com",
-        "start_date": "2024-08-15",
-        "end_date": "2024-08-24",
-        "guest_count": 2,
-        "room_type": "single",
-        "number_of_rooms": 1,
-        "payment_method": "credit card",
-        "include_breakfast": true,
-        "note": "Visa card will be used as credit card. Spa will be added to the gym plan. Planning to arrive between 00.00 pm to 02.00 pm."
-    }
-
-    Now it's your turn:
-    """
-    memory = user.memory.get_memory()
-    date = f"Current date (Year-Month-Date Hour-Minute-Second): {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-    prompt = f" System Message: {system_message} <Question>: {question} <Memory>: {memory}, <Date>: {date}"
-    print("[DEBUG] Memory: ", memory)
-    
-    json_string = await _ask_llm(user=user, prompt=prompt)
-    
-    try:
-        data = json.loads(json_string)
-    except Exception as e:
-        # Booking request with no info is given
-        print(f"An exception has occured: {e}\n")
-        print(json_string)
-        memory = user.memory.get_last_answer()
-        prompt = f"""{FLUENCY_PROMPT} <chat_memory>: {memory} <question>:{question} <answer>:For me to book you, please tell me your full name, phone number, email, booking start date, booking end date, guest count, room type (single (1-2 people), double (3-4 people), suite (4-5 people), number of rooms, payment method. Also do you want breakfasts?"""
-        final_answer = await _ask_llm(user=user,prompt=prompt,llm="llama3-small")
-        return final_answer, memory, prompt, 200
-
-    print(data)
-    
-    # Check for each key and assign if it exists
-    full_name = data['full_name'] if 'full_name' in data else None
-    phone_number = data['phone_number'] if 'phone_number' in data else None
-    email = data['email'] if 'email' in data else None
-    start_date = data['start_date'] if 'start_date' in data else None
-    end_date = data['end_date'] if 'end_date' in data else None
-    guest_count = data['guest_count'] if 'guest_count' in data else None
-    room_type = data['room_type'] if 'room_type' in data else None
-    number_of_rooms = data['number_of_rooms'] if 'number_of_rooms' in data else None
-    payment_method = data['payment_method'] if 'payment_method' in data else None
-    include_breakfast = data['include_breakfast'] if 'include_breakfast' in data else None
-    note = data['note'] if 'note' in data else None
-
-    scrapped_data = {
-        "full_name":full_name,
-        "phone_number":phone_number,
-        "email": email,
-        "start_date":start_date,
-        "end_date":end_date,
-        "guest_count":guest_count,
-        "room_type":room_type,
-        "number_of_rooms":number_of_rooms,
-        "payment_method": payment_method,
-        "include_breakfast": include_breakfast,
-        "note": note
-    }
-
-    none_fields = []
+    """Booking is filled slot by slot. Fields are read from the message locally first, the LLM is asked only for the empty or invalid slots.
+    Missing field and validation answers come from the response templates."""
     booking = user.get_booking()
-
-    if booking is None:
+    if booking is None or booking.is_confirmed():
+        # A confirmed booking is already reserved, a new request starts a new booking
         booking = Booking()
 
-    for field_name, value in scrapped_data.items():
-        if (value == "" or value is None) and (field_name != "note" and getattr(booking, field_name) is None):
-            field_name = field_name.replace("_", " ")
-            none_fields.append(field_name)
-        else:
-            setattr(booking, field_name, value)
-
+    fields, rest = extract_booking_fields(question)
+    merge_booking_fields(booking, fields)
+    print(f"[DEBUG] Locally extracted booking fields: {fields}")
+    missing_fields = booking.get_missing_fields()
+    system_message = None
+    if missing_fields and has_booking_content(rest):
+        system_message, llm_fields = await _extract_booking_fields_with_llm(user, booking, question, missing_fields)
+        for field_name, value in llm_fields.items():
+            if field_name in missing_fields or field_name == "note":
+                booking.fill(field_name, normalize_field(field_name, value))
+        missing_fields = booking.get_missing_fields()
     user.set_booking(booking=booking)
-    
-    if none_fields:
-        memory = user.memory.get_last_answer()
-        prompt = f"""{FLUENCY_PROMPT} <chat_memory>: {memory} <question>:{question} <answer>: You need to tell me these information as well please: {', '.join(none_fields)}"""
-        final_answer = await _ask_llm(user=user,prompt=prompt,llm="llama3-small")
-        return final_answer, memory, prompt, 200
-    
-    is_valid, message = booking.is_valid()
-    
-    if not is_valid:
-        memory = user.memory.get_last_answer()
-        prompt = f"""{FLUENCY_PROMPT} <chat_memory>: {memory} <question>:{question} <answer>: {message}"""
-        final_answer = await _ask_llm(user=user,prompt=prompt,llm="llama3-small")
-        return final_answer, memory, prompt, 400
+    print(f"[DEBUG] Booking slots: {booking.get_slot_states()}")
+
+    memory = user.memory.get_last_answer()
+    if len(missing_fields) == len(BOOKING_FIELDS) and not booking.get_invalid_fields():
+        # Booking request with no info is given
+        final_answer = await _respond(user, question, memory, "booking_questions")
+        return final_answer, memory, system_message, 200
+
+    validation_error = booking.get_validation_error()
+    if validation_error:
+        final_answer = await _respond(user, question, memory, f"invalid.{validation_error}")
+        return final_answer, memory, system_message, 400
+
+    if missing_fields:
+        templates = await _get_templates(user)
+        final_answer = render_missing_fields(templates or TEMPLATES["en"], missing_fields)
+        if templates is None:
+            final_answer = await _rewrite(user, question, memory, final_answer)
+        return final_answer, memory, system_message, 200
     
     details = user.booking.get_booking_details()
-    room_id, reservation_response = user.get_hotel_management().reserve_room(full_name=details["full_name"], phone_number=details["phone_number"], email=details["email"], room_type=details["room_type"],
+    # A busy hotel database is retried for seconds, other users are served on the event loop meanwhile
+    room_id, reservation_id, reservation_response = await asyncio.to_thread(user.get_hotel_management().reserve_room, full_name=details["full_name"], phone_number=details["phone_number"], email=details["email"], room_type=details["room_type"],
                                              start_date=details["start_date"],end_date=details["end_date"],guest_count=details["guest_count"],number_of_rooms=details["number_of_rooms"],
                                              payment_method=details["payment_method"],include_breakfast=details["include_breakfast"],note=details["note"])
     user.set_room_id(room_id=room_id)
-    memory = user.memory.get_last_answer()
-    prompt = f"""{FLUENCY_PROMPT} <chat_memory>: {memory} <question>:{question} <answer>: Great 😊 {reservation_response}\n Details: {details}"""
-    final_answer = await _ask_llm(user=user,prompt=prompt,llm="llama3-small")
+    user.set_reservation_id(reservation_id=reservation_id)
+    if room_id:
+        booking.confirm()
+    final_answer = await _rewrite(user, question, memory, f"Great 😊 {reservation_response}\n Details: {details}")
     final_answer += f"\n [DEBUG]: Booking is saved successfully: {details}"
     return final_answer, memory, system_message, 200
 
 
+async def _extract_booking_fields_with_llm(user: User, booking: Booking, question: str, missing_fields: list[str]) -> tuple[str, dict]:
+    """Empty and invalid slots are read from the new message by an LLM call, the prompt only has these slots and the message.
+    Broken JSON is repaired instead of asking again."""
+    descriptions = {
+        "full_name": "The full name of the customer",
+        "phone_number": "The phone number of the customer, 10 to 15 digits",
+        "email": "The e-mail of the customer",
+        "start_date": "The arrival date of the customer in YYYY-MM-DD format",
+        "end_date": "The leaving date of the customer in YYYY-MM-DD format, after the arrival date",
+        "guest_count": "The customer count, at least 1",
+        "room_type": "single (for 1-2 people), double (for 3-4 people) or suite (for 4-5 people)",
+        "number_of_rooms": "How many rooms they want, at least 1",
+        "payment_method": "How they will pay",
+        "include_breakfast": "true or false, do they want to include breakfast as well or not",
+        "note": "(Optional) other informations"
+    }
+    slots = []
+    for field_name in missing_fields + ["note"]:
+        slot = f"{field_name}: {descriptions[field_name]}"
+        if booking.get_slot_state(field_name) == "invalid":
+            slot += f" (the previous value {getattr(booking, field_name)} is invalid)"
+        slots.append(slot)
+    requested_fields = "\n".join(slots)
+    system_message = f"""
+    You are responsible for getting reservation information from the customer's new message and creating a json from it.
+    Do not give any other response than JSON.
+    Only look for the following fields, leave a field empty like this: "" if the message does not have it.
+    {requested_fields}
+    """
+    date = f"Current date (Year-Month-Date): {datetime.now().strftime('%Y-%m-%d')}"
+    prompt = f" System Message: {system_message} <Message>: {question} <Date>: {date}"
+    json_string = await _ask_llm(user=user, prompt=prompt)
+    data = repair_json(json_string)
+    if not data:
+        print(f"[DEBUG] No booking fields in the LLM response: {json_string}")
+    return system_message, data
+
+
 async def _get_saved_user(user: User) -> User:
-    """User is retrieved from user store according to the unique username."""
-    if user.username in USER_STORE:
-        return USER_STORE[user.username]
-    else:
-        USER_STORE[user.username] = user
-        return user
+    """User is retrieved from the session store according to the unique username."""
+    return await asyncio.to_thread(get_session_store().get_or_add, user)
 
 
-async def _rag(user: User, question: str):
-    """Similar answer is retrieved from the FAQ document."""
-    vector_store = await _get_vector_file()
-    if vector_store is None:
+async def _save_user(user: User) -> None:
+    """Conversation state is written to the shared session backend, so any worker can answer the next message."""
+    await asyncio.to_thread(get_session_store().save, user)
+
+
+async def _rag(user: User, question: str, retrieval: asyncio.Task = None):
+    """Similar answer is retrieved from the FAQ document. Retrieval that was started while routing is awaited instead of searching again.
+    The answer is written with one LLM call in single_pass mode, two_stage mode drafts it from the chunks first.
+    Precomputed FAQ answers and answers of similar questions in the same language are served without retrieval or generation.
+    The answer cache is only used without chat history, a follow-up question depends on the conversation it was asked in."""
+    memory = user.memory.get_memory()
+    language = user.get_language_preference()
+    use_answer_cache = user.memory.is_empty()
+    cache_key = await _embed_question(question)
+    if cache_key:
+        answer = get_faq_store().match(cache_key[0], cache_key[2], language, threshold=float(os.getenv("FAQ_MATCH_THRESHOLD", "0.9")))
+        if answer is not None:
+            print("[DEBUG] Precomputed FAQ answer is served")
+            return answer, memory, None, 200
+    if cache_key and use_answer_cache:
+        answer = get_answer_cache().get(cache_key[0], language, cache_key[1])
+        print(f"[DEBUG] Answer cache: {get_answer_cache().get_stats()}")
+        if answer is not None:
+            return answer, memory, None, 200
+
+    docs = await (retrieval if retrieval else _retrieve(user, question))
+    if docs is None:
         return "Document not found.", None, None, 400
     
-    llm = await _get_llm(model_name=user.llm)
-    memory = user.memory.get_memory()
-    docs = vector_store.similarity_search(question+memory)
+    started_at = time.perf_counter()
     retrieved_chunks = docs[0].page_content + docs[1].page_content + docs[2].page_content
-    language = user.get_language_preference
-    system_message= f"Figure out the answer of the question by the given information pieces. ALWAYS answer in {language} language."
-    prompt = system_message + "Question: " + question + " Context: " + retrieved_chunks
-    try:
-        response = llm.invoke(prompt)
-    except Exception as e:
-        return f"LLM call error: {e}", None, None, 400
-    answer = response.content
-    print(f"[DEBUG] RAG Results: {answer}")
+    information = retrieved_chunks
+    if user.get_rag_mode() == "two_stage":
+        system_message= f"Figure out the answer of the question by the given information pieces. ALWAYS answer in {language} language."
+        prompt = system_message + "Question: " + question + " Context: " + retrieved_chunks
+        try:
+            information = await _ask_llm(user=user, prompt=prompt)
+        except Exception as e:
+            return f"LLM call error: {e}", None, None, 400
+        print(f"[DEBUG] RAG Results: {information}")
 
     system_message = f"""
     You are a reservation assistant who books and reserves places.
@@ -414,56 +624,80 @@ async def _rag(user: User, question: str):
     Now it's your turn, answer ONLY in the {language} language:
     """
     date = f"Current date (Year-Month-Date Hour-Minute-Second): {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-    prompt = f" System Message: {system_message} <Question>: {question} <Information>: {answer} <Memory>: {memory}, <Date>: {date}"
+    prompt = f" System Message: {system_message} <Question>: {question} <Information>: {information} <Memory>: {memory}, <Date>: {date}"
     print("[DEBUG] Memory: ",memory)
 
     answer = await _ask_llm(user=user, prompt=prompt)
+    print(f"[DEBUG] RAG mode: {user.get_rag_mode()}, answered in {time.perf_counter() - started_at:.2f} s")
+    if cache_key and use_answer_cache:
+        get_answer_cache().put(cache_key[0], language, cache_key[1], answer)
     return answer, memory, system_message, 200
 
+
+async def _embed_question(question: str) -> tuple[list[float], int, str] | None:
+    """Question embedding, knowledge base version and embedder name, None if no document is uploaded."""
+    retriever = get_retriever()
+    vector_store = retriever.refresh()
+    if vector_store is None:
+        return None
+    embeddings = vector_store.embeddings
+    vector = await asyncio.to_thread(embeddings.embed_query, question)
+    return vector, retriever.version, embeddings.model_name
+
+async def _retrieve(user: User, question: str) -> list | None:
+    """Top-k chunks of the question and chat memory, None if no document is uploaded."""
+    vector_store = await _get_vector_file()
+    if vector_store is None:
+        return None
+    # Query embedding and search are CPU work, they run off the event loop
+    return await asyncio.to_thread(vector_store.similarity_search, question+user.memory.get_memory())
+
+
+def _discard(task: asyncio.Task) -> None:
+    """Cancels a speculative task, its result or error is ignored."""
+    task.cancel()
+    task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
 async def _ask_llm(user:User, prompt:str, llm:str=None) ->str:
-    """LLM call."""
+    """Async LLM call, other users are served while waiting for the provider. Raises asyncio.TimeoutError after LLM_TIMEOUT seconds.
+    Responses are cached by model and prompt, equal prompts that are asked at the same time wait for one call."""
     if llm:
         model_name = llm
     else:
         model_name = user.llm
-    llm = await _get_llm(model_name=model_name)
-    final_answer = llm.invoke(prompt)
-    final_answer = final_answer.content
-    return final_answer
+
+    async def call() -> str:
+        llm = await _get_llm(model_name=model_name)
+        timeout = float(os.getenv("LLM_TIMEOUT", "30"))
+        final_answer = await asyncio.wait_for(llm.ainvoke(prompt), timeout=timeout)
+        # Chat models return a message, completion models (openai, azure_openai) return a string
+        return getattr(final_answer, "content", final_answer)
+
+    return await get_response_cache().get_or_call(model_name, prompt, call)
 
 
 async def _get_llm(model_name:str):
-    """LLM adapter using langchain wrappers."""
-    is_loaded = load_dotenv('.env')
-    print(f"[DEBUG] Is .env loaded: {is_loaded}")
-    if model_name == "openai":
-        OPENAI_KEY = os.getenv("OPENAI_KEY")
-        llm = OpenAI(api_key=OPENAI_KEY, model="gpt-3.5-turbo-instruct", temperature=0)
-    elif model_name == "azure_openai":
-        AZURE_AD_TOKEN = os.getenv("AZURE_AD_TOKEN")
-        AZURE_AD_TOKEN_PROVIDER = os.getenv("AZURE_AD_TOKEN_PROVIDER")
-        AZURE_DEPLOYMENT = os.getenv("AZURE_DEPLOYMENT")
-        AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
-        llm = AzureOpenAI(azure_ad_token=AZURE_AD_TOKEN, azure_ad_token_provider=AZURE_AD_TOKEN_PROVIDER, azure_deployment=AZURE_DEPLOYMENT, azure_endpoint=AZURE_ENDPOINT, model="gpt-3.5-turbo-instruct", temperature=0)
-    elif model_name == "llama3":
-        GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-        llm = ChatGroq(api_key=GROQ_API_KEY, model_name="llama3-70b-8192", temperature=0)
-    elif model_name == "llama3-small":
-        GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-        llm = ChatGroq(api_key=GROQ_API_KEY, model_name="llama3-8b-8192", temperature=0)
-    elif model_name == "gemma2-2b":
-        GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-        llm = ChatGoogleGenerativeAI(google_api_key=GOOGLE_API_KEY,model="gemma-2-2b-it", temperature=0)
-    else:
-        GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-        llm = ChatGoogleGenerativeAI(google_api_key=GOOGLE_API_KEY,model="gemini-pro", temperature=0)
-    return llm
+    """LLM client of the model from the process-wide registry, clients are not rebuilt per call."""
+    return get_llm_registry().get(model_name)
+
+
+async def reload_llm_clients(password: str) -> tuple[str, int]:
+    """Reads the .env file again so that rotated credentials are used by the next LLM calls."""
+    ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+    if password != ADMIN_PASSWORD:
+        return "Only ADMIN can reload LLM clients.", 400
+    get_llm_registry().reload()
+    return "LLM clients are reloaded.", 200
+
+
+async def get_cache_stats() -> tuple[dict, int]:
+    """Hit-rate counters of the answer caches and session counters."""
+    return {"answer_cache": get_answer_cache().get_stats(), "llm_cache": get_response_cache().get_stats(), "sessions": get_session_store().get_stats()}, 200
 
 
 async def _get_vector_file()-> any:
-    with open("document.pkl", "rb") as f:
-        vector_store = pickle.load(f)
-    return vector_store
+    """Resident vector store, it is loaded once at startup and swapped after every upload."""
+    return get_retriever().refresh()
 
 
 async def _log(user: User, memory: str, question: str, selected_function: str, final_answer: str) -> None:
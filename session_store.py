@@ -0,0 +1,215 @@
+"""Conversation sessions by username with a size limit and an idle timeout, optionally saved to a backend that every worker shares."""
+
+import os
+import time
+import json
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from user import User
+from booking import Booking, BOOKING_FIELDS
+
+SESSION_DB_PATH = "sessions.db"
+
+
+def to_record(user: User) -> str:
+    """Conversation state of a user as compact JSON, empty values are left out."""
+    record = {}
+    if user.memory.turns:
+        record["m"] = user.memory.get_turns()
+    if user.memory.summary:
+        record["s"] = user.memory.summary
+    if user.booking is not None:
+        record["b"] = [getattr(user.booking, field_name) for field_name in BOOKING_FIELDS] + [user.booking.note or None]
+        if user.booking.confirmed_fields:
+            record["c"] = [user.booking.confirmed_fields.get(field_name) for field_name in BOOKING_FIELDS]
+    if user.room_id is not None:
+        record["r"] = user.room_id
+    if user.reservation_id is not None:
+        record["i"] = user.reservation_id
+    if user.language_preference is not None:
+        record["l"] = user.language_preference
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def apply_record(user: User, record: str) -> User:
+    """Restores the conversation state of to_record on the user."""
+    record = json.loads(record)
+    user.memory.load(record.get("m", []), record.get("s", ""))
+    user.booking = None
+    if "b" in record:
+        values = record["b"]
+        user.booking = Booking(**dict(zip(BOOKING_FIELDS, values[:len(BOOKING_FIELDS)])), note=values[len(BOOKING_FIELDS)])
+        if "c" in record:
+            user.booking.confirmed_fields = dict(zip(BOOKING_FIELDS, record["c"]))
+    user.room_id = record.get("r")
+    user.reservation_id = record.get("i")
+    user.language_preference = record.get("l")
+    return user
+
+
+class SQLiteSessionBackend:
+    def __init__(self, db_name=SESSION_DB_PATH, idle_ttl: float = 3600):
+        # WAL lets every worker read sessions while another one saves, each save writes a new version token
+        self.idle_ttl = idle_ttl
+        self.conn = sqlite3.connect(db_name, check_same_thread=False, timeout=5)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL;")
+            self.conn.execute("PRAGMA synchronous=NORMAL;")
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                                    username TEXT PRIMARY KEY,
+                                    version TEXT,
+                                    record TEXT,
+                                    updated_at REAL
+                                )''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)")
+            self.conn.commit()
+
+    def load(self, username: str, known_version: str = None) -> tuple[str, str]:
+        """(version, record) of a session that is not idle, record is None if the version is already known. None if there is no such session."""
+        with self.lock:
+            return self.conn.execute("SELECT version, CASE WHEN version = ? THEN NULL ELSE record END FROM sessions WHERE username = ? AND updated_at >= ?",
+                                     (known_version, username, time.time() - self.idle_ttl)).fetchone()
+
+    def save(self, username: str, record: str) -> str:
+        """Saves the record and returns its version, idle sessions of every user are removed."""
+        version = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO sessions (username, version, record, updated_at) VALUES (?, ?, ?, ?)", (username, version, record, now))
+            self.conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.idle_ttl,))
+            self.conn.commit()
+        return version
+
+    def save_summary(self, username: str, summary: str) -> tuple[str, str]:
+        """Replaces only the memory summary of the saved record, newer turns and bookings of other workers are kept.
+        Returns (previous version, new version), None if there is no saved session."""
+        version = uuid.uuid4().hex
+        with self.lock:
+            row = self.conn.execute("SELECT version, record FROM sessions WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return None
+            record = json.loads(row[1])
+            record["s"] = summary
+            # Compare and swap, a save of another worker in between wins and the summary is written again next time
+            updated = self.conn.execute("UPDATE sessions SET version = ?, record = ?, updated_at = ? WHERE username = ? AND version = ?",
+                                        (version, json.dumps(record, ensure_ascii=False, separators=(",", ":")), time.time(), username, row[0])).rowcount
+            self.conn.commit()
+        if not updated:
+            return None
+        return row[0], version
+
+    def delete(self, username: str) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM sessions WHERE username = ?", (username,))
+            self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class SessionStore:
+    def __init__(self, max_sessions: int = 10000, idle_ttl: float = 3600, backend: SQLiteSessionBackend = None):
+        # Sessions are kept in least recently used order, so idle and evicted ones are always at the front.
+        # With a backend this is a read-through cache of it, a session saved by another worker is reloaded.
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.backend = backend
+        self.sessions = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+        self.loads = 0
+        self.lock = threading.Lock()
+
+    def _pop_expired(self, now: float) -> list[User]:
+        expired = []
+        while self.sessions:
+            username, (user, last_seen, _) = next(iter(self.sessions.items()))
+            if now - last_seen <= self.idle_ttl:
+                break
+            del self.sessions[username]
+            expired.append(user)
+        self.expirations += len(expired)
+        return expired
+
+    def get_or_add(self, user: User) -> User:
+        """Saved user of the username, the given user is saved if there is none. Idle and least recently used sessions are closed."""
+        now = time.time()
+        with self.lock:
+            closed = self._pop_expired(now)
+            entry = self.sessions.get(user.username)
+        version = entry[2] if entry else None
+        if entry:
+            user = entry[0]
+        if self.backend is not None:
+            row = self.backend.load(user.username, known_version=version)
+            if row is not None and row[0] != version:
+                # Saved by another worker or before a restart
+                apply_record(user, row[1])
+                version = row[0]
+                with self.lock:
+                    self.loads += 1
+        with self.lock:
+            if user.username not in self.sessions:
+                while len(self.sessions) >= self.max_sessions:
+                    closed.append(self.sessions.popitem(last=False)[1][0])
+                    self.evictions += 1
+            self.sessions[user.username] = (user, now, version)
+            self.sessions.move_to_end(user.username)
+        for closed_user in closed:
+            closed_user.close()
+        return user
+
+    def save(self, user: User) -> None:
+        """Writes the conversation state of the user to the backend, if there is one."""
+        if self.backend is None:
+            return
+        version = self.backend.save(user.username, to_record(user))
+        with self.lock:
+            entry = self.sessions.get(user.username)
+            if entry and entry[0] is user:
+                self.sessions[user.username] = (user, entry[1], version)
+
+    def save_summary(self, user: User) -> None:
+        """Writes only the memory summary of the user, so a background summary never overwrites a newer save with older turns."""
+        if self.backend is None:
+            return
+        versions = self.backend.save_summary(user.username, user.memory.summary)
+        if versions is None:
+            return
+        with self.lock:
+            entry = self.sessions.get(user.username)
+            # The cached user is up to date only if it had seen the record that was changed
+            if entry and entry[0] is user and entry[2] == versions[0]:
+                self.sessions[user.username] = (user, entry[1], versions[1])
+
+    def remove(self, username: str) -> None:
+        with self.lock:
+            entry = self.sessions.pop(username, None)
+        if self.backend is not None:
+            self.backend.delete(username)
+        if entry:
+            entry[0].close()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {"live_sessions": len(self.sessions), "evictions": self.evictions, "expirations": self.expirations, "loads": self.loads}
+
+
+_shared_session_store = None
+_shared_session_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Returns the process-wide session store. SESSION_MAX_COUNT, SESSION_IDLE_TTL, SESSION_BACKEND and SESSION_DB configure it."""
+    global _shared_session_store
+    with _shared_session_store_lock:
+        if _shared_session_store is None:
+            idle_ttl = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+            backend = None
+            if os.getenv("SESSION_BACKEND", "sqlite") == "sqlite":
+                backend = SQLiteSessionBackend(db_name=os.getenv("SESSION_DB", SESSION_DB_PATH), idle_ttl=idle_ttl)
+            _shared_session_store = SessionStore(max_sessions=int(os.getenv("SESSION_MAX_COUNT", "10000")), idle_ttl=idle_ttl, backend=backend)
+        return _shared_session_store
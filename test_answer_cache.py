@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import patch
+from answer_cache import SemanticAnswerCache
+
+
+class TestSemanticAnswerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = SemanticAnswerCache(max_entries=2, ttl=60, threshold=0.95)
+
+    def test_similar_question_hits(self):
+        """Test that a close question vector returns the cached answer."""
+        self.cache.put([1.0, 0.0, 0.0], "en", 1, "Check-in is at 14:00.")
+
+        self.assertEqual(self.cache.get([0.99, 0.05, 0.0], "en", 1), "Check-in is at 14:00.")
+        self.assertEqual(self.cache.get_stats(), {"entries": 1, "hits": 1, "misses": 0, "hit_rate": 1.0})
+
+    def test_different_question_misses(self):
+        """Test that a distant vector is a miss."""
+        self.cache.put([1.0, 0.0, 0.0], "en", 1, "Check-in is at 14:00.")
+
+        self.assertIsNone(self.cache.get([0.0, 1.0, 0.0], "en", 1))
+        self.assertEqual(self.cache.get_stats()["misses"], 1)
+
+    def test_language_and_version_must_match(self):
+        """Test that answers are not shared across languages or knowledge base versions."""
+        self.cache.put([1.0, 0.0], "en", 1, "answer")
+
+        self.assertIsNone(self.cache.get([1.0, 0.0], "tr", 1))
+        self.assertIsNone(self.cache.get([1.0, 0.0], "en", 2))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used answer is evicted."""
+        self.cache.put([1.0, 0.0, 0.0], "en", 1, "first")
+        self.cache.put([0.0, 1.0, 0.0], "en", 1, "second")
+        self.cache.get([1.0, 0.0, 0.0], "en", 1)
+        self.cache.put([0.0, 0.0, 1.0], "en", 1, "third")
+
+        self.assertEqual(self.cache.get([1.0, 0.0, 0.0], "en", 1), "first")
+        self.assertIsNone(self.cache.get([0.0, 1.0, 0.0], "en", 1))
+
+    @patch('answer_cache.time.time')
+    def test_ttl_expiry(self, mock_time):
+        """Test that old answers expire."""
+        mock_time.return_value = 1000
+        self.cache.put([1.0, 0.0], "en", 1, "answer")
+
+        mock_time.return_value = 1061
+        self.assertIsNone(self.cache.get([1.0, 0.0], "en", 1))
+        self.assertEqual(self.cache.get_stats()["entries"], 0)
+
+    def test_invalidate(self):
+        """Test that invalidation drops every answer."""
+        self.cache.put([1.0, 0.0], "en", 1, "answer")
+        self.cache.invalidate()
+
+        self.assertIsNone(self.cache.get([1.0, 0.0], "en", 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
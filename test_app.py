@@ -1,11 +1,19 @@
 import unittest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, MagicMock
 from app import app
 
 # Create a TestClient instance
 client = TestClient(app)
 
+
+def setUpModule():
+    # Users get a mock hotel manager, so the suite does not create hotel.db in the working directory
+    patcher = patch('user.get_hotel_manager', return_value=MagicMock())
+    patcher.start()
+    unittest.addModuleCleanup(patcher.stop)
+
+
 class TestApp(unittest.TestCase):
 
     def test_health_check(self):
@@ -28,6 +36,60 @@ class TestApp(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), {"response": "Document uploaded successfully"})
 
+    @patch('app.upload_documents', new_callable=AsyncMock)
+    def test_document_uploader_queued(self, mock_upload_documents):
+        """Test document uploader endpoint when an ingestion job is queued"""
+        mock_upload_documents.return_value = ("job123", 202)
+
+        files = [('files', ('testfile.txt', b'file content'))]
+        response = client.post("/document-uploader", files=files, data={"password": "password"})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"response": "Document is queued for uploading.", "job_id": "job123"})
+
+    @patch('app.get_ingestion_status', new_callable=AsyncMock)
+    def test_document_uploader_status(self, mock_get_ingestion_status):
+        """Test ingestion job status endpoint"""
+        mock_get_ingestion_status.return_value = ({"job_id": "job123", "stage": "embedding"}, 200)
+
+        response = client.get("/document-uploader/job123")
+
+        mock_get_ingestion_status.assert_called_once_with("job123")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"response": {"job_id": "job123", "stage": "embedding"}})
+
+    @patch('app.get_ingestion_status', new_callable=AsyncMock)
+    def test_document_uploader_status_not_found(self, mock_get_ingestion_status):
+        """Test ingestion job status endpoint with an unknown job"""
+        mock_get_ingestion_status.return_value = ("Ingestion job not found.", 404)
+
+        response = client.get("/document-uploader/missing")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"detail": "Ingestion job not found."})
+
+    @patch('app.reload_llm_clients', new_callable=AsyncMock)
+    def test_llm_reloader(self, mock_reload_llm_clients):
+        """Test LLM client reload endpoint"""
+        mock_reload_llm_clients.return_value = ("LLM clients are reloaded.", 200)
+
+        response = client.post("/llm-reloader", data={"password": "password"})
+
+        mock_reload_llm_clients.assert_called_once_with("password")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"response": "LLM clients are reloaded."})
+
+    @patch('app.get_cache_stats', new_callable=AsyncMock)
+    def test_cache_stats(self, mock_get_cache_stats):
+        """Test cache statistics endpoint"""
+        stats = {"answer_cache": {"entries": 1, "hits": 3, "misses": 1, "hit_rate": 0.75}}
+        mock_get_cache_stats.return_value = (stats, 200)
+
+        response = client.get("/cache-stats")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"response": stats})
+
     @patch('app.ask_question', new_callable=AsyncMock)
     def test_question_answerer(self, mock_ask_question):
         """Test question answerer endpoint"""
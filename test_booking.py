@@ -67,6 +67,41 @@ class TestBooking(unittest.TestCase):
         }
         self.assertEqual(self.booking.get_booking_details(), expected_details)
 
+    def test_get_validation_error(self):
+        """Test the codes of invalid field values."""
+        self.assertIsNone(self.booking.get_validation_error())
+        self.booking.email = "john.doe"
+        self.assertEqual(self.booking.get_validation_error(), "email")
+        self.booking.start_date = "2024-10-12"
+        self.assertEqual(self.booking.get_validation_error(), "date_order")
+
+    def test_slot_states(self):
+        """Test that slots are empty, filled, invalid or confirmed."""
+        booking = Booking(full_name="John Doe", email="john.doe")
+        self.assertEqual(booking.get_slot_state("full_name"), "filled")
+        self.assertEqual(booking.get_slot_state("email"), "invalid")
+        self.assertEqual(booking.get_slot_state("phone_number"), "empty")
+        self.assertEqual(booking.get_invalid_fields(), {"email": "email"})
+        self.assertEqual(booking.get_missing_fields(), ["phone_number", "email", "start_date", "end_date", "guest_count", "room_type", "number_of_rooms", "payment_method", "include_breakfast"])
+
+        self.assertEqual(booking.fill("email", "john.doe@example.com"), "filled")
+        self.assertEqual(booking.fill("email", ""), "filled")
+        self.assertEqual(booking.fill("guest_count", "2"), "invalid")
+
+    def test_confirm(self):
+        """Test that confirmed slots become filled again when they change."""
+        self.assertFalse(self.booking.is_confirmed())
+        self.booking.confirm()
+        self.assertTrue(self.booking.is_confirmed())
+
+        self.booking.fill("room_type", "suite")
+        self.assertEqual(self.booking.get_slot_state("room_type"), "filled")
+        self.assertEqual(self.booking.get_slot_state("email"), "confirmed")
+
+    def test_end_date_before_start_date_is_invalid(self):
+        self.booking.fill("end_date", "2024-10-09")
+        self.assertEqual(self.booking.get_invalid_fields(), {"end_date": "date_order"})
+
     def test_is_valid_success(self):
         """Test if valid booking passes all validation checks."""
         is_valid, message = self.booking.is_valid()
@@ -0,0 +1,142 @@
+import unittest
+from datetime import date
+from booking import Booking
+from booking_extractor import extract_booking_fields, extract_stay, has_booking_content, merge_booking_fields, normalize_field, repair_json
+
+TODAY = date(2024, 8, 1)
+
+
+class TestExtractBookingFields(unittest.TestCase):
+
+    def test_full_message(self):
+        """Test a message with most of the fields."""
+        message = ("Hello, My name is Arda Yılmaz. You can reach me at 123-456-7890 or via email at arda.yilmaz@example.com. "
+                   "We plan to arrive on September 10, 2024, between 1:00 PM and 3:00 PM, and depart on September 20, 2024. "
+                   "My wife and I will be staying in a single room. I intend to pay with a MasterCard. We would also like to include breakfasts with our stay.")
+        fields, _ = extract_booking_fields(message, today=TODAY)
+        self.assertEqual(fields, {
+            "full_name": "Arda Yılmaz",
+            "phone_number": "1234567890",
+            "email": "arda.yilmaz@example.com",
+            "start_date": "2024-09-10",
+            "end_date": "2024-09-20",
+            "guest_count": 2,
+            "room_type": "single",
+            "number_of_rooms": 1,
+            "payment_method": "credit card",
+            "include_breakfast": True
+        })
+
+    def test_day_after_a_date(self):
+        """Test that "the 24th" is read in the month of the previous date."""
+        fields, _ = extract_booking_fields("We will be there at 15 August and leave at the 24 th.", today=TODAY)
+        self.assertEqual((fields["start_date"], fields["end_date"]), ("2024-08-15", "2024-08-24"))
+
+    def test_single_date(self):
+        """Test that a single date is marked by the words before it."""
+        self.assertEqual(extract_booking_fields("We will leave on 07.10.2024", today=TODAY)[0], {"end_date": "2024-10-07"})
+        self.assertEqual(extract_booking_fields("Check-in 2024-10-03 please", today=TODAY)[0], {"start_date": "2024-10-03"})
+        self.assertEqual(extract_booking_fields("2024-10-03", today=TODAY)[0], {"date": "2024-10-03"})
+
+    def test_past_date_without_year(self):
+        self.assertEqual(extract_booking_fields("from 5 March", today=TODAY)[0], {"start_date": "2025-03-05"})
+
+    def test_turkish_message(self):
+        fields, rest = extract_booking_fields("yarın giriş, 3 kişiyiz, 2 oda, kahvaltı istemiyorum", today=TODAY)
+        self.assertEqual(fields, {"date": "2024-08-02", "guest_count": 3, "number_of_rooms": 2, "include_breakfast": False})
+
+    def test_only_an_email(self):
+        """Test that a message without other information needs no LLM call."""
+        fields, rest = extract_booking_fields("yes sorry, it is barorkar@gmail.com", today=TODAY)
+        self.assertEqual(fields, {"email": "barorkar@gmail.com"})
+        self.assertFalse(has_booking_content(rest))
+
+    def test_name_without_prefix(self):
+        """Test that words the extractor does not understand are left to the LLM."""
+        fields, rest = extract_booking_fields("I want breakfast. burak@gmail.com. credit card. Burak Çivit.", today=TODAY)
+        self.assertEqual(fields, {"email": "burak@gmail.com", "payment_method": "credit card", "include_breakfast": True})
+        self.assertTrue(has_booking_content(rest))
+
+    def test_false_positives(self):
+        """Test that phrases that only look like booking fields are left to the LLM."""
+        self.assertNotIn("full_name", extract_booking_fields("I am Staying With My Wife for a week", today=TODAY)[0])
+        self.assertEqual(extract_booking_fields("Hi, I am Ayşe Kaya Staying Here", today=TODAY)[0]["full_name"], "Ayşe Kaya")
+        self.assertNotIn("date", extract_booking_fields("We may 2 come later", today=TODAY)[0])
+        self.assertEqual(extract_booking_fields("We arrive May 2", today=TODAY)[0]["start_date"], "2025-05-02")
+        self.assertEqual(extract_booking_fields("from may 2nd", today=TODAY)[0]["start_date"], "2025-05-02")
+        self.assertNotIn("include_breakfast", extract_booking_fields("Is breakfast included?", today=TODAY)[0])
+        self.assertNotIn("include_breakfast", extract_booking_fields("Does the price include breakfast", today=TODAY)[0])
+
+
+class TestExtractStay(unittest.TestCase):
+
+    def test_stay_of_the_message(self):
+        """Test that a date range is used as it is and a single date is one night."""
+        self.assertEqual(extract_stay("Do you have a double from 2024-10-03 to 2024-10-07?", today=TODAY), ("2024-10-03", "2024-10-07"))
+        self.assertEqual(extract_stay("Any free rooms on 2024-10-03?", today=TODAY), ("2024-10-03", "2024-10-04"))
+        self.assertIsNone(extract_stay("Any free rooms?", today=TODAY))
+
+
+class TestMergeBookingFields(unittest.TestCase):
+
+    def test_single_date_fills_the_empty_date(self):
+        booking = Booking()
+        merge_booking_fields(booking, {"date": "2024-10-03"})
+        self.assertEqual(booking.start_date, "2024-10-03")
+        merge_booking_fields(booking, {"date": "2024-10-07", "email": "a@b.com"})
+        self.assertEqual((booking.start_date, booking.end_date, booking.email), ("2024-10-03", "2024-10-07", "a@b.com"))
+
+    def test_filled_slots_are_corrected(self):
+        """Test that marked values correct filled slots and an unmarked date only fills an open date."""
+        booking = Booking(full_name="Ayşe Kaya", phone_number="123", start_date="2024-10-03", end_date="2024-10-07", room_type="single")
+        merge_booking_fields(booking, {"room_type": "double", "phone_number": "5365363636", "date": "2024-10-05"})
+        self.assertEqual((booking.room_type, booking.phone_number, booking.start_date, booking.end_date), ("double", "5365363636", "2024-10-03", "2024-10-07"))
+
+        merge_booking_fields(booking, {"start_date": "2024-10-04", "end_date": "2024-10-08"})
+        self.assertEqual((booking.start_date, booking.end_date), ("2024-10-04", "2024-10-08"))
+
+    def test_confirmed_slots_are_kept(self):
+        booking = Booking(full_name="Ayşe Kaya", room_type="single")
+        booking.confirm()
+        merge_booking_fields(booking, {"full_name": "Staying With", "room_type": "suite"})
+        self.assertEqual((booking.full_name, booking.room_type), ("Ayşe Kaya", "single"))
+
+    def test_empty_values_do_not_clear_slots(self):
+        booking = Booking(email="a@b.com")
+        merge_booking_fields(booking, {"email": "", "guest_count": None})
+        self.assertEqual(booking.email, "a@b.com")
+
+    def test_normalize_field(self):
+        self.assertEqual(normalize_field("guest_count", "2"), 2)
+        self.assertIsNone(normalize_field("guest_count", "two"))
+        self.assertIs(normalize_field("include_breakfast", "true"), True)
+        self.assertEqual(normalize_field("phone_number", "+90 536 536 36 36"), "905365363636")
+        self.assertEqual(normalize_field("room_type", "Double"), "double")
+        self.assertIsNone(normalize_field("email", ""))
+
+
+class TestRepairJson(unittest.TestCase):
+
+    def test_valid_json(self):
+        self.assertEqual(repair_json('{"email": "a@b.com", "guest_count": 2}'), {"email": "a@b.com", "guest_count": 2})
+
+    def test_code_fence_and_trailing_comma(self):
+        self.assertEqual(repair_json('Here it is:\n```json\n{"email": "a@b.com", "include_breakfast": true,}\n```'), {"email": "a@b.com", "include_breakfast": True})
+
+    def test_python_literals(self):
+        self.assertEqual(repair_json("{'room_type': 'single', 'include_breakfast': False, 'note': None}"), {"room_type": "single", "include_breakfast": False, "note": None})
+
+    def test_cut_off_response(self):
+        """Test that the complete values of a cut off response are kept."""
+        self.assertEqual(repair_json('{"full_name": "Burak Çivit", "guest_count": 2, "note": "Arriving la'), {"full_name": "Burak Çivit", "guest_count": 2})
+
+    def test_broken_pairs(self):
+        """Test that readable pairs are recovered from invalid JSON."""
+        self.assertEqual(repair_json('{"full_name": "Burak Çivit" "guest_count": 2, note: x}'), {"full_name": "Burak Çivit", "guest_count": 2})
+
+    def test_no_json(self):
+        self.assertEqual(repair_json("I could not find any booking information."), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
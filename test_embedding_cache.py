@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import multiprocessing
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from document_store import hash_chunk
+
+
+def put_vectors(directory, worker, barrier):
+    """Caches vectors of one worker while the other workers cache theirs."""
+    cache = EmbeddingCache(directory=directory)
+    barrier.wait()
+    for i in range(20):
+        cache.put("model", [f"{worker}-{i}"], [[float(worker), float(i)]])
+    cache.close()
+
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a cache in a temporary directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = EmbeddingCache(directory=self.temp_dir.name)
+
+    def tearDown(self):
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_get_empty(self):
+        """Test that nothing is returned for an unknown embedder."""
+        self.assertEqual(self.cache.get("model", ["hash"]), {})
+
+    def test_put_and_get(self):
+        """Test that vectors are appended and read back by hash."""
+        self.cache.put("model", ["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+        self.cache.put("model", ["c"], [[5.0, 6.0]])
+
+        self.assertEqual(self.cache.get("model", ["c", "a", "missing"]), {"a": [1.0, 2.0], "c": [5.0, 6.0]})
+
+    def test_embedders_are_separated(self):
+        """Test that the same hash is cached separately for each embedder."""
+        self.cache.put("model", ["a"], [[1.0, 2.0]])
+        self.cache.put("other", ["a"], [[1.0, 2.0, 3.0]])
+
+        self.assertEqual(self.cache.get("model", ["a"]), {"a": [1.0, 2.0]})
+        self.assertEqual(self.cache.get("other", ["a"]), {"a": [1.0, 2.0, 3.0]})
+
+    def test_cache_survives_restart(self):
+        """Test that vectors are persisted on disk."""
+        self.cache.put("model", ["a"], [[1.0, 2.0]])
+        self.cache.close()
+
+        self.cache = EmbeddingCache(directory=self.temp_dir.name)
+        self.assertEqual(self.cache.get("model", ["a"]), {"a": [1.0, 2.0]})
+
+    def test_workers_append_to_the_same_array(self):
+        """Test that vectors appended by several workers at once are read back at their own rows."""
+        barrier = multiprocessing.Barrier(4)
+        workers = [multiprocessing.Process(target=put_vectors, args=(self.temp_dir.name, worker, barrier)) for worker in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual([worker.exitcode for worker in workers], [0] * 4)
+        hashes = [f"{worker}-{i}" for worker in range(4) for i in range(20)]
+        self.assertEqual(self.cache.get("model", hashes), {f"{worker}-{i}": [float(worker), float(i)] for worker in range(4) for i in range(20)})
+
+
+class TestCachedEmbeddings(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = EmbeddingCache(directory=self.temp_dir.name)
+
+    def tearDown(self):
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    @patch('embedding_cache.HuggingFaceEmbeddings')
+    def test_only_missing_texts_are_embedded(self, mock_huggingface):
+        """Test that cached texts are not embedded again."""
+        mock_model = mock_huggingface.return_value
+        mock_model.embed_documents.side_effect = lambda texts: [[float(len(text)), 0.0] for text in texts]
+        self.cache.put("model", [hash_chunk("cached text")], [[9.0, 9.0]])
+        embeddings = CachedEmbeddings(model_name="model", cache=self.cache)
+
+        vectors = embeddings.embed_documents(["cached  text", "new", "new"])
+
+        mock_model.embed_documents.assert_called_once_with(["new"])
+        self.assertEqual(vectors, [[9.0, 9.0], [3.0, 0.0], [3.0, 0.0]])
+
+    @patch('embedding_cache.HuggingFaceEmbeddings')
+    def test_model_is_not_loaded_when_everything_is_cached(self, mock_huggingface):
+        """Test that a fully cached rebuild never loads the transformer."""
+        self.cache.put("model", [hash_chunk("cached")], [[1.0]])
+        embeddings = CachedEmbeddings(model_name="model", cache=self.cache)
+
+        self.assertEqual(embeddings.embed_documents(["cached"]), [[1.0]])
+        mock_huggingface.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from extraction import split_parts, iter_part, extract_part, ExtractionWindow
+
+
+class TestExtraction(unittest.TestCase):
+
+    @patch('extraction.PyPDF2.PdfReader')
+    def test_split_parts_pdf(self, mock_PdfReader):
+        """Test that a PDF is split into page ranges."""
+        mock_PdfReader.return_value.pages = [MagicMock()] * 5
+        self.assertEqual(split_parts("test.pdf", b"mock_bytes", pages_per_part=2), [(0, 2), (2, 4), (4, 5)])
+
+    def test_split_parts_other_documents(self):
+        """Test that TXT and DOCX files are a single part."""
+        self.assertEqual(split_parts("test.txt", b"text", pages_per_part=2), [(0, 1)])
+        self.assertEqual(split_parts("test.docx", b"docx", pages_per_part=2), [(0, 1)])
+
+    @patch('extraction.PyPDF2.PdfReader')
+    def test_iter_part_pdf(self, mock_PdfReader):
+        """Test that only the pages of the range are extracted."""
+        mock_PdfReader.return_value.pages = [MagicMock(extract_text=MagicMock(return_value=f"page_{i}")) for i in range(4)]
+        result = list(iter_part("test.pdf", b"mock_bytes", 1, 3))
+        self.assertEqual(result, [("page_1", {"source": "test.pdf", "page": 2}), ("page_2", {"source": "test.pdf", "page": 3})])
+        mock_PdfReader.return_value.pages[0].extract_text.assert_not_called()
+
+    @patch('extraction.Document')
+    def test_iter_part_docx(self, mock_Document):
+        """Test that every paragraph is a segment."""
+        mock_Document.return_value.paragraphs = [MagicMock(text="paragraph_text"), MagicMock(text="second_paragraph")]
+        result = list(iter_part("test.docx", b"mock_bytes", 0, 1))
+        self.assertEqual(result, [("paragraph_text", {"source": "test.docx", "page": 1}), ("second_paragraph", {"source": "test.docx", "page": 1})])
+
+    def test_extract_part_on_worker_process(self):
+        """Test that extraction runs on a spawned worker process."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "test.txt")
+            with open(path, "wb") as file:
+                file.write(b"Q: Pool?\nA: Yes.")
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                result = pool.submit(extract_part, "test.txt", path, 0, 1).result()
+        self.assertEqual(result, [("Q: Pool?", {"source": "test.txt", "page": 1}), ("A: Yes.", {"source": "test.txt", "page": 1})])
+
+
+class TestExtractionWindow(unittest.TestCase):
+
+    @patch('extraction.PyPDF2.PdfReader')
+    def test_window_is_shared_by_files(self, mock_PdfReader):
+        """Test that every file is submitted before the first one is consumed and the parts of all files stay within the window."""
+        mock_PdfReader.return_value.pages = [MagicMock(extract_text=MagicMock(return_value="page"))] * 3
+        with ThreadPoolExecutor(max_workers=2) as pool, patch.object(pool, 'submit', wraps=pool.submit) as mock_submit:
+            window = ExtractionWindow(pool, 2)
+            first = window.add("a.pdf", b"a", [(0, 1), (1, 2), (2, 3)])
+            second = window.add("b.pdf", b"b", [(0, 1), (1, 2)])
+            window.start()
+            self.assertEqual([call.args[1] for call in mock_submit.call_args_list], ["a.pdf", "b.pdf"])
+
+            in_flight = []
+            for file_index in (first, second):
+                for segments in window.results(file_index):
+                    in_flight.append(len(window.futures))
+            window.close()
+
+        self.assertEqual([(call.args[1], call.args[3]) for call in mock_submit.call_args_list], [("a.pdf", 0), ("b.pdf", 0), ("a.pdf", 1), ("a.pdf", 2), ("b.pdf", 1)])
+        self.assertLessEqual(max(in_flight), 2)
+        self.assertFalse(any(os.path.exists(path) for _, path, _ in window.files))
+
+    def test_close_removes_unconsumed_files(self):
+        """Test that temporary files of files that were not consumed are removed."""
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            window = ExtractionWindow(pool, 2)
+            window.add("a.txt", b"first", [(0, 1)])
+            window.add("b.txt", b"second", [(0, 1)])
+            window.start()
+            self.assertEqual(next(window.results(0)), [("first", {"source": "a.txt", "page": 1})])
+            window.close()
+
+        self.assertFalse(any(os.path.exists(path) for _, path, _ in window.files))
+
+
+if __name__ == '__main__':
+    unittest.main()
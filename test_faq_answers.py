@@ -0,0 +1,71 @@
+import unittest
+import os
+import tempfile
+from faq_answers import parse_qa_pairs, FAQAnswerStore
+
+
+class TestParseQAPairs(unittest.TestCase):
+
+    def test_faq_document(self):
+        """Test that every pair of the FAQ document is found."""
+        with open("document.txt", encoding="utf-8") as f:
+            pairs = parse_qa_pairs(f.read())
+        self.assertEqual(len(pairs), 43)
+        self.assertEqual(pairs[0], ("What is the name of your hotel?", "Hotel Barkın."))
+
+    def test_multiline_answer(self):
+        """Test that an answer continues until the next question."""
+        text = "Intro\nQ: Meal times?\nA: Breakfast 07.00-10.00\nDinner 19.00-21.00\n\nQ: Pool?\nA: Yes."
+        self.assertEqual(parse_qa_pairs(text), [("Meal times?", "Breakfast 07.00-10.00\nDinner 19.00-21.00"), ("Pool?", "Yes.")])
+
+    def test_no_pairs(self):
+        self.assertEqual(parse_qa_pairs("Just a paragraph."), [])
+
+
+class TestFAQAnswerStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.temp_dir.name, "faq_answers.db")
+        self.store = FAQAnswerStore(self.db_name)
+        self.store.save_source("faq.txt", "embedder", [
+            {"question": "Pool?", "answer": "Yes.", "pair_hash": "pool", "vector": [1.0, 0.0], "answers": {"en": "We have a pool.", "tr": "Havuzumuz var."}},
+            {"question": "Parking?", "answer": "No.", "pair_hash": "parking", "vector": [0.0, 1.0], "answers": {"en": "No parking."}},
+        ])
+
+    def tearDown(self):
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def test_match(self):
+        """Test that a similar question gets the answer in the requested language."""
+        self.assertEqual(self.store.match([0.95, 0.1], "embedder", "tr", threshold=0.9), "Havuzumuz var.")
+        self.assertIsNone(self.store.match([0.7, 0.7], "embedder", "en", threshold=0.9))
+        self.assertIsNone(self.store.match([0.0, 1.0], "embedder", "tr", threshold=0.9))
+        self.assertIsNone(self.store.match([1.0, 0.0], "other_embedder", "en", threshold=0.9))
+
+    def test_replace_source(self):
+        """Test that saving a document again replaces its pairs and drops unused answers."""
+        self.store.match([1.0, 0.0], "embedder", "en", threshold=0.9)
+        self.store.save_source("faq.txt", "embedder", [
+            {"question": "Parking?", "answer": "No.", "pair_hash": "parking", "vector": [0.0, 1.0], "answers": {"en": "No parking."}},
+        ])
+
+        self.assertIsNone(self.store.match([1.0, 0.0], "embedder", "en", threshold=0.9))
+        self.assertEqual(self.store.get_answers("pool"), {})
+        self.assertEqual(self.store.get_answers("parking"), {"en": "No parking."})
+
+    def test_changes_of_other_connections(self):
+        """Test that pairs saved by another worker are matched."""
+        self.store.match([1.0, 0.0], "embedder", "en", threshold=0.9)
+        other = FAQAnswerStore(self.db_name)
+        other.save_source("rules.txt", "embedder", [
+            {"question": "Pets?", "answer": "No.", "pair_hash": "pets", "vector": [0.0, 0.0, 1.0], "answers": {"en": "No pets."}},
+        ])
+        other.close()
+
+        self.assertEqual(self.store.match([0.0, 0.0, 1.0], "embedder", "en", threshold=0.9), "No pets.")
+
+
+if __name__ == '__main__':
+    unittest.main()
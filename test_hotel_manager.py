@@ -1,7 +1,19 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from hotel_manager import HotelManager
+from hotel_manager import HotelManager, get_nights
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
 import json
+import os
+import tempfile
+import multiprocessing
+
+
+def start_worker(db_name, barrier):
+    """Opens the database at the same time as the other workers."""
+    barrier.wait()
+    HotelManager(db_name=db_name).conn.close()
 
 class TestHotelManager(unittest.TestCase):
     def setUp(self):
@@ -12,6 +24,8 @@ class TestHotelManager(unittest.TestCase):
         self.mock_connect.return_value = self.mock_conn
         self.mock_cursor = MagicMock()
         self.mock_conn.cursor.return_value = self.mock_cursor
+        # Empty database with schema version 0
+        self.mock_cursor.fetchone.return_value = (0,)
 
         # Initialize HotelManager instance
         self.hotel_manager = HotelManager(db_name=":memory:")
@@ -24,7 +38,7 @@ class TestHotelManager(unittest.TestCase):
         # Mock no available rooms
         self.mock_cursor.fetchone.return_value = None  # No available rooms
         
-        room_id, msg = self.hotel_manager.reserve_room(
+        room_id, _, msg = self.hotel_manager.reserve_room(
             full_name="Test User",
             phone_number="5555555555",
             email="test@example.com",
@@ -43,22 +57,22 @@ class TestHotelManager(unittest.TestCase):
 
     def test_cancel_reservation(self):
         # Mock a valid reservation to cancel
-        self.mock_cursor.fetchone.return_value = [1]  # Assume reservation_id 1 exists
+        self.mock_cursor.fetchone.return_value = ["2024-10-03", "2024-10-07"]  # Assume reservation_id 1 exists
         
-        cancel_msg = self.hotel_manager.cancel_reservation(room_id=101)
+        cancel_msg = self.hotel_manager.cancel_reservation(reservation_id=1)
         
         self.assertIn("canceled", cancel_msg)
         
         # Check if reservation was deleted
-        self.mock_cursor.execute.assert_any_call('''DELETE FROM reservation_rooms WHERE room_id = ?''', (101,))
+        self.mock_cursor.execute.assert_any_call('''DELETE FROM reservation_rooms WHERE reservation_id = ?''', (1,))
         self.mock_cursor.execute.assert_any_call('''DELETE FROM reservations WHERE reservation_id = ?''', (1,))
         
-        # Check if room was marked available
-        self.mock_cursor.execute.assert_any_call('''UPDATE rooms SET is_available = 1 WHERE room_id = ?''', (101,))
+        # Check if the booked nights were freed
+        self.mock_cursor.execute.assert_any_call('''DELETE FROM room_nights WHERE reservation_id = ?''', (1,))
 
     def test_invalid_date_format(self):
         # Test invalid date format during reservation
-        room_id, msg = self.hotel_manager.reserve_room(
+        room_id, _, msg = self.hotel_manager.reserve_room(
             full_name="Test User",
             phone_number="5555555555",
             email="test@example.com",
@@ -74,5 +88,237 @@ class TestHotelManager(unittest.TestCase):
         self.assertIsNone(room_id)
         self.assertIn("Invalid date format", msg)
 
+
+class TestHotelManagerPersistence(unittest.TestCase):
+    def setUp(self):
+        # Real SQLite file so that separate managers share the same database
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.temp_dir.name, "hotel.db")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _room_count(self, hotel_manager):
+        return hotel_manager.conn.execute("SELECT COUNT(*) FROM rooms").fetchone()[0]
+
+    def test_rooms_are_seeded_once(self):
+        first = HotelManager(db_name=self.db_name)
+        room_count = self._room_count(first)
+        first.conn.close()
+
+        second = HotelManager(db_name=self.db_name)
+        self.assertEqual(self._room_count(second), room_count)
+        second.conn.close()
+
+    def test_concurrent_startup_seeds_rooms_once(self):
+        """Test that workers starting together on a new database do not each seed the rooms."""
+        barrier = multiprocessing.Barrier(8)
+        workers = [multiprocessing.Process(target=start_worker, args=(self.db_name, barrier)) for _ in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual([worker.exitcode for worker in workers], [0] * 8)
+        hotel_manager = HotelManager(db_name=self.db_name)
+        self.assertEqual(self._room_count(hotel_manager), 21)
+        hotel_manager.conn.close()
+
+    def test_reservations_survive_restart(self):
+        first = HotelManager(db_name=self.db_name)
+        room_id, _, _ = first.reserve_room("Test User", "5555555555", "test@example.com", "single", "2024-10-03", "2024-10-07", 1, 1, "credit card", True, "")
+        first.conn.close()
+
+        second = HotelManager(db_name=self.db_name)
+        reservation = second.conn.execute("SELECT reservation_id FROM reservation_rooms WHERE room_id = ?", (room_id,)).fetchone()
+        self.assertIsNotNone(reservation)
+        second.conn.close()
+
+
+class TestAvailability(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.temp_dir.name, "hotel.db")
+        self.hotel_manager = HotelManager(db_name=self.db_name)
+
+    def tearDown(self):
+        self.hotel_manager.conn.close()
+        self.temp_dir.cleanup()
+
+    def _reserve(self, room_type, start_date, end_date, number_of_rooms=1):
+        return self.hotel_manager.reserve_room("Test User", "5555555555", "test@example.com", room_type, start_date, end_date, 1, number_of_rooms, "credit card", True, "")[0]
+
+    def _reserve_with_id(self, room_type, start_date, end_date):
+        room_id, reservation_id, _ = self.hotel_manager.reserve_room("Test User", "5555555555", "test@example.com", room_type, start_date, end_date, 1, 1, "credit card", True, "")
+        return room_id, reservation_id
+
+    def test_get_nights(self):
+        self.assertEqual(get_nights("2024-12-30", "2025-01-02"), ["2024-12-30", "2024-12-31", "2025-01-01"])
+
+    def test_room_is_free_outside_its_nights(self):
+        """Test that a booked room is only unavailable for the nights of its stay, the check-out day is free."""
+        suites = self.hotel_manager.get_free_rooms("suite", "2030-05-01", "2030-05-02")
+        room_id = self._reserve("suite", "2030-05-01", "2030-05-04")
+
+        self.assertEqual(room_id, suites[0])
+        self.assertNotIn(room_id, self.hotel_manager.get_free_rooms("suite", "2030-05-03", "2030-05-05"))
+        self.assertIn(room_id, self.hotel_manager.get_free_rooms("suite", "2030-05-04", "2030-05-06"))
+        self.assertIn(room_id, self.hotel_manager.get_free_rooms("suite", "2030-04-28", "2030-05-01"))
+
+    def test_fully_booked_type(self):
+        """Test that no room is given when every room of the type is booked on one of the nights."""
+        for _ in range(3):
+            self.assertIsNotNone(self._reserve("suite", "2030-05-01", "2030-05-03"))
+
+        self.assertIsNone(self._reserve("suite", "2030-05-02", "2030-05-04"))
+        self.assertIsNotNone(self._reserve("suite", "2030-05-03", "2030-05-04"))
+
+    def test_cancel_frees_nights(self):
+        room_id, reservation_id = self._reserve_with_id("suite", "2030-05-01", "2030-05-03")
+        self.hotel_manager.cancel_reservation(reservation_id)
+
+        self.assertIn(room_id, self.hotel_manager.get_free_rooms("suite", "2030-05-01", "2030-05-03"))
+
+    def test_cancel_keeps_other_reservations_of_the_room(self):
+        """Test that cancelling a reservation does not release the same room booked for other dates."""
+        first_room_id, first_reservation_id = self._reserve_with_id("suite", "2030-05-01", "2030-05-03")
+        with patch.object(self.hotel_manager, 'get_free_rooms', return_value=[first_room_id]):
+            second_room_id, second_reservation_id = self._reserve_with_id("suite", "2030-05-10", "2030-05-12")
+        self.assertEqual(first_room_id, second_room_id)
+
+        self.hotel_manager.cancel_reservation(second_reservation_id)
+
+        self.assertNotIn(first_room_id, self.hotel_manager.get_free_rooms("suite", "2030-05-01", "2030-05-03"))
+        self.assertIn(first_room_id, self.hotel_manager.get_free_rooms("suite", "2030-05-10", "2030-05-12"))
+        self.assertEqual(self.hotel_manager.conn.execute("SELECT reservation_id FROM reservations").fetchall(), [(first_reservation_id,)])
+
+    def test_available_room_counts_are_for_tonight(self):
+        today = datetime.today()
+        self._reserve("double", today.strftime('%Y-%m-%d'), (today + timedelta(days=2)).strftime('%Y-%m-%d'))
+        self._reserve("double", (today + timedelta(days=1)).strftime('%Y-%m-%d'), (today + timedelta(days=2)).strftime('%Y-%m-%d'))
+
+        self.assertEqual(self.hotel_manager.get_available_room_counts(), {"double": 5, "single": 12, "suite": 3})
+
+    def test_number_of_rooms_is_reserved(self):
+        """Test that every requested room is booked and cancelling releases all of them."""
+        room_id, reservation_id, message = self.hotel_manager.reserve_room("Test User", "5555555555", "test@example.com", "double", "2030-05-01", "2030-05-03", 6, 3, "credit card", True, {"arrival": "late"})
+
+        self.assertIsNotNone(room_id)
+        self.assertTrue(message.startswith("Rooms "))
+        self.assertEqual(self.hotel_manager.get_free_room_counts("2030-05-01", "2030-05-03")["double"], 3)
+
+        self.hotel_manager.cancel_reservation(reservation_id)
+        self.assertEqual(self.hotel_manager.get_free_room_counts("2030-05-01", "2030-05-03")["double"], 6)
+
+    def test_reservation_is_all_or_nothing(self):
+        """Test that no room is booked when fewer rooms than requested are free."""
+        self._reserve("suite", "2030-05-02", "2030-05-03")
+
+        self.assertIsNone(self._reserve("suite", "2030-05-01", "2030-05-04", number_of_rooms=3))
+        self.assertEqual(self.hotel_manager.get_free_room_counts("2030-05-01", "2030-05-02")["suite"], 3)
+        self.assertEqual(self.hotel_manager.conn.execute("SELECT COUNT(*) FROM reservations").fetchone()[0], 1)
+
+    @patch('hotel_manager.time.sleep')
+    def test_busy_database_is_retried(self, mock_sleep):
+        """Test that a reservation is tried again while another worker holds the write lock."""
+        with patch.object(self.hotel_manager, 'allocate_rooms', side_effect=[sqlite3.OperationalError("database is locked"), (1, [4])]) as mock_allocate:
+            room_id, _, _ = self.hotel_manager.reserve_room("Test User", "5555555555", "test@example.com", "single", "2030-05-01", "2030-05-02", 1, 1, "credit card", True, "")
+
+        self.assertEqual(room_id, 4)
+        self.assertEqual(mock_allocate.call_count, 2)
+        mock_sleep.assert_called_once()
+
+    def test_concurrent_reservations_do_not_share_rooms(self):
+        """Test that managers with their own connections never book the same room night."""
+        managers = [HotelManager(db_name=self.db_name) for _ in range(4)]
+
+        def reserve(manager):
+            return [manager.reserve_room("Test User", "5555555555", "test@example.com", "suite", "2030-05-01", "2030-05-03", 1, 1, "credit card", True, "")[0] for _ in range(3)]
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            room_ids = [room_id for result in executor.map(reserve, managers) for room_id in result if room_id]
+        for manager in managers:
+            manager.conn.close()
+
+        self.assertEqual(sorted(room_ids), sorted(set(room_ids)))
+        self.assertEqual(len(room_ids), 3)
+
+    def test_free_room_counts_for_dates(self):
+        """Test that a room booked on any night of the range is not counted as free."""
+        self._reserve("suite", "2030-05-01", "2030-05-03")
+        self._reserve("double", "2030-05-04", "2030-05-06")
+
+        self.assertEqual(self.hotel_manager.get_free_room_counts("2030-05-02", "2030-05-05"), {"double": 5, "single": 12, "suite": 2})
+        self.assertEqual(self.hotel_manager.get_available_room_counts("2030-05-03"), {"double": 6, "single": 12, "suite": 3})
+
+    def test_month_availability(self):
+        """Test the free room count of every night of a month."""
+        self._reserve("suite", "2030-04-29", "2030-05-02")
+        self._reserve("suite", "2030-05-01", "2030-05-03")
+
+        grid = self.hotel_manager.get_month_availability(2030, 5)
+
+        self.assertEqual(len(grid), 31)
+        self.assertEqual(grid["2030-05-01"]["suite"], 1)
+        self.assertEqual(grid["2030-05-02"]["suite"], 2)
+        self.assertEqual(grid["2030-05-31"], {"double": 6, "single": 12, "suite": 3})
+
+    def test_inventory_is_cached_until_its_dates_change(self):
+        """Test that cached counts are kept for other dates and dropped for the dates of a reservation."""
+        self.hotel_manager.get_free_room_counts("2030-05-01", "2030-05-03")
+        self.hotel_manager.get_free_room_counts("2030-06-01", "2030-06-03")
+
+        _, reservation_id = self._reserve_with_id("suite", "2030-05-02", "2030-05-04")
+        self.assertEqual(set(self.hotel_manager.inventory_cache), {("range", "2030-06-01", "2030-06-03")})
+        self.assertEqual(self.hotel_manager.get_free_room_counts("2030-05-01", "2030-05-03")["suite"], 2)
+
+        self.hotel_manager.cancel_reservation(reservation_id)
+        self.assertEqual(self.hotel_manager.get_free_room_counts("2030-05-01", "2030-05-03")["suite"], 3)
+
+    def test_inventory_cache_is_bounded(self):
+        """Test that the least recently used date range is dropped beyond the cache size."""
+        self.hotel_manager.inventory_cache_size = 2
+        self.hotel_manager.get_free_room_counts("2030-05-01", "2030-05-03")
+        self.hotel_manager.get_free_room_counts("2030-06-01", "2030-06-03")
+        self.hotel_manager.get_free_room_counts("2030-05-01", "2030-05-03")
+
+        self.hotel_manager.get_free_room_counts("2030-07-01", "2030-07-03")
+
+        self.assertEqual(list(self.hotel_manager.inventory_cache), [("range", "2030-05-01", "2030-05-03"), ("range", "2030-07-01", "2030-07-03")])
+
+    def test_inventory_cache_sees_other_connections(self):
+        """Test that a reservation of another worker drops the cached counts."""
+        self.assertEqual(self.hotel_manager.get_free_room_counts("2030-05-01", "2030-05-03")["suite"], 3)
+        other = HotelManager(db_name=self.db_name)
+        other.reserve_room("Test User", "5555555555", "test@example.com", "suite", "2030-05-01", "2030-05-02", 1, 1, "credit card", True, "")
+        other.conn.close()
+
+        self.assertEqual(self.hotel_manager.get_free_room_counts("2030-05-01", "2030-05-03")["suite"], 2)
+
+    def _reopen_as_version(self, version):
+        self.hotel_manager.conn.execute("DROP TABLE room_nights")
+        self.hotel_manager.conn.execute(f"PRAGMA user_version = {version}")
+        self.hotel_manager.conn.commit()
+        self.hotel_manager.conn.close()
+        self.hotel_manager = HotelManager(db_name=self.db_name)
+
+    def test_version_1_database_is_backfilled(self):
+        """Test that the occupancy index is built from the reservations of an older database."""
+        room_id = self._reserve("single", "2030-05-01", "2030-05-03")
+        self._reopen_as_version(1)
+
+        self.assertNotIn(room_id, self.hotel_manager.get_free_rooms("single", "2030-05-02", "2030-05-03"))
+        self.assertEqual(self.hotel_manager.conn.execute("PRAGMA user_version").fetchone()[0], 2)
+
+    def test_unversioned_database_is_backfilled(self):
+        """Test that a database from before the schema versions keeps its reservations booked."""
+        room_id = self._reserve("suite", "2030-05-01", "2030-05-03")
+        self._reopen_as_version(0)
+
+        self.assertNotIn(room_id, self.hotel_manager.get_free_rooms("suite", "2030-05-01", "2030-05-02"))
+        self.assertEqual(self.hotel_manager.get_free_room_counts("2030-05-01", "2030-05-03")["suite"], 2)
+        self.assertEqual(self.hotel_manager.conn.execute("PRAGMA user_version").fetchone()[0], 2)
+
+
 if __name__ == '__main__':
     unittest.main()
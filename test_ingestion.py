@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import patch
+import os
+import threading
+from ingestion import IngestionJob, IngestionQueue, get_extraction_pool
+
+
+class TestIngestionJob(unittest.TestCase):
+
+    def test_initial_status(self):
+        """Test that a new job is queued without progress."""
+        job = IngestionJob(["faq.txt"])
+        status = job.get_status()
+        self.assertEqual(status["stage"], "queued")
+        self.assertEqual(status["files"], ["faq.txt"])
+        self.assertEqual(status["pages_processed"], 0)
+        self.assertEqual(status["chunks_embedded"], 0)
+        self.assertEqual(status["chunks_per_second"], 0.0)
+        self.assertIsNone(status["error"])
+
+    def test_progress(self):
+        """Test that counters and throughput are reported."""
+        job = IngestionJob(["faq.pdf"])
+        job.add_pages(3)
+        job.set_stage("embedding")
+        job.add_chunks(10)
+        job.set_stage("done")
+
+        status = job.get_status()
+        self.assertEqual(status["stage"], "done")
+        self.assertEqual(status["pages_processed"], 3)
+        self.assertEqual(status["chunks_embedded"], 10)
+        self.assertGreater(status["chunks_per_second"], 0)
+        self.assertTrue(job.is_finished())
+
+    def test_fail(self):
+        """Test that a failed job keeps its error."""
+        job = IngestionJob(["faq.pdf"])
+        job.fail("broken file")
+        self.assertEqual(job.get_status()["stage"], "failed")
+        self.assertEqual(job.get_status()["error"], "broken file")
+
+
+class TestIngestionQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = IngestionQueue(max_workers=1, max_jobs=2)
+
+    def tearDown(self):
+        self.queue.executor.shutdown(wait=True)
+
+    def test_submit_runs_work_in_background(self):
+        """Test that submit returns before the work is done and the job is finished later."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def work(job, value):
+            started.set()
+            release.wait()
+            job.add_chunks(value)
+
+        job = self.queue.submit(work, ["faq.txt"], 5)
+        started.wait()
+        self.assertEqual(self.queue.get_job(job.job_id).stage, "queued")
+        release.set()
+        self.queue.executor.shutdown(wait=True)
+
+        self.assertEqual(job.stage, "done")
+        self.assertEqual(job.chunks_embedded, 5)
+
+    def test_failed_work(self):
+        """Test that an exception marks the job as failed."""
+        def work(job):
+            raise ValueError("bad document")
+
+        job = self.queue.submit(work, ["faq.txt"])
+        self.queue.executor.shutdown(wait=True)
+
+        self.assertEqual(job.stage, "failed")
+        self.assertEqual(job.error, "bad document")
+
+    def test_old_jobs_are_dropped(self):
+        """Test that only the last max_jobs jobs are kept."""
+        jobs = [self.queue.submit(lambda job: None, ["faq.txt"]) for _ in range(3)]
+        self.assertIsNone(self.queue.get_job(jobs[0].job_id))
+        self.assertIsNotNone(self.queue.get_job(jobs[2].job_id))
+
+
+class TestExtractionPool(unittest.TestCase):
+
+    @patch.dict(os.environ, {"EXTRACTION_WORKERS": "0"})
+    def test_no_pool(self):
+        """Test that extraction can be kept on the ingestion thread."""
+        self.assertIsNone(get_extraction_pool())
+
+
+if __name__ == '__main__':
+    unittest.main()
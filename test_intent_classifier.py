@@ -0,0 +1,68 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+from intent_classifier import IntentClassifier, SEED_EXAMPLES, LABELS, load_logged_examples
+
+
+class TestIntentClassifier(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Train once on the seed examples."""
+        cls.classifier = IntentClassifier().fit(SEED_EXAMPLES)
+
+    def test_seed_examples_are_learned(self):
+        """Test that every seed example is classified confidently."""
+        for text, label in SEED_EXAMPLES:
+            intent, confidence = self.classifier.predict(text)
+            self.assertEqual(intent, label, text)
+            self.assertGreater(confidence, 0.8, text)
+
+    def test_similar_inquiries(self):
+        """Test inquiries that are not in the seed examples."""
+        self.assertEqual(self.classifier.predict("Can I cancel my reservation?")[0], "cancel")
+        self.assertEqual(self.classifier.predict("Do you have free double rooms?")[0], "status")
+        self.assertEqual(self.classifier.predict("my email is someone@example.org")[0], "booking")
+        self.assertEqual(self.classifier.predict("What time is breakfast?")[0], "question")
+
+    def test_unknown_inquiry_is_not_confident(self):
+        """Test that an unrelated message is left to the LLM."""
+        _, confidence = self.classifier.predict("asdf qwer")
+        self.assertLess(confidence, 0.8)
+
+    def test_probabilities(self):
+        """Test that probabilities cover every label and sum to one."""
+        probabilities = self.classifier.predict_proba("Is there parking?")
+        self.assertEqual(set(probabilities), set(LABELS))
+        self.assertAlmostEqual(sum(probabilities.values()), 1.0)
+
+
+class TestLoadLoggedExamples(unittest.TestCase):
+
+    def test_missing_database(self):
+        """Test that no examples are loaded without logs."""
+        self.assertEqual(load_logged_examples(db_name="missing_log_data.db"), [])
+
+    def test_logged_llm_decisions(self):
+        """Test that LLM decisions are loaded and local decisions are skipped."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_name = os.path.join(temp_dir, "log_data.db")
+            conn = sqlite3.connect(db_name)
+            conn.execute("CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT, selected_function TEXT)")
+            conn.executemany("INSERT INTO logs (question, selected_function) VALUES (?, ?)", [
+                ("Is there parking?", "question"),
+                ("Cancel it", "local:cancel"),
+                ("Free rooms?", " Status\n"),
+                ("Weird", "I am not sure"),
+            ])
+            conn.commit()
+            conn.close()
+
+            examples = load_logged_examples(db_name=db_name)
+
+        self.assertEqual(sorted(examples), [("Free rooms?", "status"), ("Is there parking?", "question")])
+
+
+if __name__ == '__main__':
+    unittest.main()
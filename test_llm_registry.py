@@ -0,0 +1,81 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+from llm_registry import LLMRegistry
+
+
+class TestLLMRegistry(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a registry that reads a temporary .env file."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.env_file = os.path.join(self.temp_dir.name, ".env")
+        with open(self.env_file, "w") as f:
+            f.write("GROQ_API_KEY=first_key\n")
+        self.env_patcher = patch.dict(os.environ, {}, clear=False)
+        self.env_patcher.start()
+        os.environ.pop("GROQ_API_KEY", None)
+        self.registry = LLMRegistry(env_file=self.env_file)
+
+    def tearDown(self):
+        self.env_patcher.stop()
+        self.temp_dir.cleanup()
+
+    @patch('llm_registry.ChatGroq')
+    def test_client_is_created_once(self, mock_chat_groq):
+        """Test that the same client is returned for the same model name."""
+        first = self.registry.get("llama3")
+        second = self.registry.get("llama3")
+
+        self.assertIs(first, second)
+        mock_chat_groq.assert_called_once()
+        kwargs = mock_chat_groq.call_args.kwargs
+        self.assertEqual(kwargs["api_key"], "first_key")
+        self.assertEqual(kwargs["model_name"], "llama3-70b-8192")
+        self.assertIs(kwargs["http_client"], self.registry.http_client)
+        self.assertIs(kwargs["http_async_client"], self.registry.http_async_client)
+
+    @patch('llm_registry.ChatGroq')
+    def test_clients_per_model(self, mock_chat_groq):
+        """Test that each model name has its own client."""
+        self.registry.get("llama3")
+        self.registry.get("llama3-small")
+        self.assertEqual(mock_chat_groq.call_count, 2)
+
+    @patch('llm_registry.load_dotenv')
+    @patch('llm_registry.ChatGroq')
+    def test_env_file_is_read_once(self, mock_chat_groq, mock_load_dotenv):
+        """Test that the .env file is not read on every call."""
+        self.registry.get("llama3")
+        self.registry.get("llama3-small")
+        mock_load_dotenv.assert_called_once()
+
+    @patch('llm_registry.ChatGroq')
+    def test_reload_picks_up_rotated_credentials(self, mock_chat_groq):
+        """Test that reload recreates clients with the new credentials."""
+        self.registry.get("llama3")
+        with open(self.env_file, "w") as f:
+            f.write("GROQ_API_KEY=second_key\n")
+
+        self.registry.reload()
+        self.registry.get("llama3")
+
+        self.assertEqual(mock_chat_groq.call_count, 2)
+        self.assertEqual(mock_chat_groq.call_args.kwargs["api_key"], "second_key")
+
+    @patch('llm_registry.ChatGroq')
+    def test_changed_env_file_is_reloaded(self, mock_chat_groq):
+        """Test that a changed .env file is picked up without an explicit reload."""
+        self.registry.get("llama3")
+        with open(self.env_file, "w") as f:
+            f.write("GROQ_API_KEY=rotated_key\n")
+        os.utime(self.env_file, ns=(self.registry.env_mtime + 1_000_000_000, self.registry.env_mtime + 1_000_000_000))
+
+        self.registry.get("llama3")
+
+        self.assertEqual(mock_chat_groq.call_args.kwargs["api_key"], "rotated_key")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
-from memory import Memory
+from unittest.mock import patch
+from memory import Memory, MAX_SUMMARY_CHARACTERS
 
 class TestMemory(unittest.TestCase):
 
@@ -88,6 +89,42 @@ class TestMemory(unittest.TestCase):
         self.memory.save("What is your name?", "I am an assistant.")
         self.memory.clear()
         self.assertEqual(len(self.memory.memory_deque), 0)
+    def test_size_is_counted_while_saving(self):
+        """Test that the running character count matches the kept turns."""
+        for i in range(7):
+            self.memory.save(f"Question {i}", f"Answer {i}")
+
+        self.assertEqual(self.memory.get_size(), len("".join(self.memory.memory_deque)))
+
+    def test_rendered_memory_is_rebuilt_after_save(self):
+        """Test that the cached chat history is reused until the next save."""
+        self.memory.save("Question 1", "Answer 1")
+        first = self.memory.get_memory()
+        self.assertIs(self.memory.get_memory(), first)
+
+        self.memory.save("Question 2", "Answer 2")
+        self.assertIn("Answer 2", self.memory.get_memory())
+
+    def test_evicted_turns_are_dropped_by_default(self):
+        """Test that dropped turns are not kept for a summary unless MEMORY_SUMMARY is on."""
+        for i in range(6):
+            self.memory.save(f"Question {i}", f"Answer {i}")
+
+        self.assertEqual(self.memory.pop_evicted(), [])
+
+    @patch.dict('os.environ', {"MEMORY_SUMMARY": "1"})
+    def test_summary_of_evicted_turns(self):
+        """Test that dropped turns wait for a summary and the summary leads the chat history."""
+        memory = Memory()
+        for i in range(6):
+            memory.save(f"Question {i}", f"Answer {i}")
+
+        self.assertEqual(memory.pop_evicted(), [("Question 0", "Answer 0")])
+        self.assertEqual(memory.pop_evicted(), [])
+
+        memory.set_summary("The guest asked question 0. " + "x" * 1000)
+        self.assertEqual(len(memory.summary), MAX_SUMMARY_CHARACTERS)
+        self.assertTrue(memory.get_memory().startswith("Chat history: <chat_history><Summary>: The guest asked question 0."))
 
 if __name__ == '__main__':
     unittest.main()
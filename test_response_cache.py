@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import patch, AsyncMock
+import os
+import asyncio
+import tempfile
+from response_cache import LLMResponseCache
+
+
+class TestLLMResponseCache(unittest.IsolatedAsyncioTestCase):
+
+    async def test_cached_response(self):
+        """Test that a repeated prompt does not call the LLM again."""
+        cache = LLMResponseCache()
+        call = AsyncMock(return_value="answer")
+
+        self.assertEqual(await cache.get_or_call("llama3", "prompt", call), "answer")
+        self.assertEqual(await cache.get_or_call("llama3", "prompt", call), "answer")
+
+        call.assert_awaited_once()
+        self.assertEqual(cache.get_stats(), {"entries": 1, "hits": 1, "misses": 1, "coalesced": 0, "hit_rate": 0.5})
+
+    async def test_bypass_model(self):
+        """Test that bypassed models are always called."""
+        cache = LLMResponseCache(bypass_models={"llama3"})
+        call = AsyncMock(return_value="answer")
+
+        await cache.get_or_call("llama3", "prompt", call)
+        await cache.get_or_call("llama3", "prompt", call)
+
+        self.assertEqual(call.await_count, 2)
+
+    async def test_errors_are_not_cached(self):
+        """Test that a failed call is tried again."""
+        cache = LLMResponseCache()
+        call = AsyncMock(side_effect=[asyncio.TimeoutError, "answer"])
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await cache.get_or_call("llama3", "prompt", call)
+        self.assertEqual(await cache.get_or_call("llama3", "prompt", call), "answer")
+
+    async def test_coalescing(self):
+        """Test that identical concurrent prompts share one call."""
+        cache = LLMResponseCache()
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        answers = await asyncio.gather(*[cache.get_or_call("llama3", "prompt", call) for _ in range(5)])
+
+        self.assertEqual(answers, ["answer"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.in_flight, {})
+
+    def test_lru_size_cap(self):
+        """Test that the least recently used response is evicted."""
+        cache = LLMResponseCache(max_entries=2)
+        cache.put("llama3", "a", "1")
+        cache.put("llama3", "b", "2")
+        cache.get("llama3", "a")
+        cache.put("llama3", "c", "3")
+
+        self.assertEqual(cache.get("llama3", "a"), "1")
+        self.assertIsNone(cache.get("llama3", "b"))
+
+    @patch('response_cache.time.time')
+    def test_ttl(self, mock_time):
+        """Test that expired responses are not served."""
+        cache = LLMResponseCache(ttl=10)
+        mock_time.return_value = 100
+        cache.put("llama3", "a", "1")
+
+        mock_time.return_value = 111
+        self.assertIsNone(cache.get("llama3", "a"))
+
+    def test_sqlite_tier(self):
+        """Test that responses are shared through the SQLite tier and capped in size."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_name = os.path.join(temp_dir, "llm_cache.db")
+            first = LLMResponseCache(max_entries=2, db_name=db_name)
+            for prompt in ["a", "b", "c"]:
+                first.put("llama3", prompt, prompt.upper())
+
+            second = LLMResponseCache(max_entries=2, db_name=db_name)
+            self.assertEqual(second.get("llama3", "c"), "C")
+            self.assertIsNone(second.get("llama3", "a"))
+            self.assertEqual(second.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0], 2)
+            first.close()
+            second.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
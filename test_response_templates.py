@@ -0,0 +1,84 @@
+import unittest
+import os
+import json
+import tempfile
+from response_templates import TEMPLATES, ResponseTemplates, render, render_room_status, render_missing_fields
+
+
+class TestRender(unittest.TestCase):
+
+    def test_languages_have_the_same_keys(self):
+        """Test that built-in languages have every template."""
+        for templates in TEMPLATES.values():
+            self.assertEqual(set(templates), set(TEMPLATES["en"]))
+
+    def test_room_status(self):
+        """Test that only room types with free rooms are listed."""
+        room_counts = {"single": 3, "double": 0, "suite": 1}
+        self.assertEqual(render_room_status(TEMPLATES["en"], room_counts), "Right now we have 3 single (1-2 people) rooms, 1 suite (4-5 people) rooms available.")
+        self.assertEqual(render_room_status(TEMPLATES["tr"], room_counts), "Şu anda 3 adet tek kişilik (1-2 kişi) oda, 1 adet süit (4-5 kişi) oda müsait.")
+        self.assertEqual(render_room_status(TEMPLATES["en"], {"single": 0}), TEMPLATES["en"]["no_rooms"])
+
+    def test_room_status_for_dates(self):
+        room_counts = {"single": 0, "double": 2}
+        self.assertEqual(render_room_status(TEMPLATES["en"], room_counts, "2024-10-03", "2024-10-05"), "From 2024-10-03 to 2024-10-05 we have 2 double (3-4 people) rooms available.")
+        self.assertEqual(render_room_status(TEMPLATES["en"], {"single": 0}, "2024-10-03", "2024-10-05"), "Unfortunately we have no available rooms from 2024-10-03 to 2024-10-05.")
+
+    def test_missing_fields(self):
+        self.assertEqual(render_missing_fields(TEMPLATES["en"], ["email", "guest_count"]), "You need to tell me these information as well please: email, guest count")
+
+    def test_render(self):
+        self.assertEqual(render(TEMPLATES["en"], "cancelled", room_id=7), "Your reservation is cancelled for the room with the room id: 7")
+
+
+class TestResponseTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_name = os.path.join(self.temp_dir.name, "templates.db")
+        self.response_templates = ResponseTemplates(self.db_name)
+
+    def tearDown(self):
+        self.response_templates.close()
+        self.temp_dir.cleanup()
+
+    def test_builtin_and_missing_languages(self):
+        self.assertIs(self.response_templates.get("en"), TEMPLATES["en"])
+        self.assertIsNone(self.response_templates.get("de"))
+
+    def test_translation_is_saved(self):
+        """Test that a valid translation is used and kept across restarts."""
+        translation = {key: f"DE {template}" for key, template in TEMPLATES["en"].items()}
+        response = "Here you go:\n" + json.dumps(translation)
+
+        self.assertEqual(self.response_templates.add_translation("de", response), translation)
+        other = ResponseTemplates(self.db_name)
+        self.assertEqual(other.get("de"), translation)
+        other.close()
+
+    def test_invalid_translation_is_rejected(self):
+        """Test that translations with missing keys or changed placeholders are not saved."""
+        translation = {key: f"DE {template}" for key, template in TEMPLATES["en"].items()}
+        translation["cancelled"] = "Zimmer {zimmer_id} storniert."
+        self.assertIsNone(self.response_templates.add_translation("de", json.dumps(translation)))
+
+        del translation["cancelled"]
+        self.assertIsNone(self.response_templates.add_translation("de", json.dumps(translation)))
+        self.assertIsNone(self.response_templates.add_translation("de", "not json"))
+        self.assertIsNone(self.response_templates.get("de"))
+
+    def test_outdated_translation_is_written_again(self):
+        """Test that a saved translation without the newer templates is not used."""
+        translation = {key: f"DE {template}" for key, template in TEMPLATES["en"].items()}
+        self.response_templates.add_translation("de", json.dumps(translation))
+        del translation["status_dates"]
+        self.response_templates.conn.execute("UPDATE translations SET templates = ? WHERE language = 'de'", (json.dumps(translation),))
+        self.response_templates.conn.commit()
+
+        other = ResponseTemplates(self.db_name)
+        self.assertIsNone(other.get("de"))
+        other.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+import threading
+from langchain_core.embeddings import Embeddings
+from retriever import Retriever, ReadWriteLock
+from document_store import build_index, write_index, hash_chunk
+
+
+class KeywordEmbeddings(Embeddings):
+    """Deterministic embeddings that count a few keywords."""
+    KEYWORDS = ["pool", "breakfast", "wifi"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(text.lower().count(keyword)) for keyword in self.KEYWORDS]
+
+
+class TestRetriever(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a retriever that points to temporary files."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.temp_dir.name, "document.faiss")
+        self.retriever = Retriever(index_path=self.index_path, docstore_path=os.path.join(self.temp_dir.name, "document.db"))
+
+    def tearDown(self):
+        self.retriever.docstore.close()
+        self.temp_dir.cleanup()
+
+    def _save(self, chunks):
+        embeddings = KeywordEmbeddings()
+        chunk_ids = self.retriever.docstore.add_chunks(chunks, metadatas=[{"source": str(i)} for i in range(len(chunks))], chunk_hashes=[hash_chunk(chunk) for chunk in chunks])
+        self.retriever.docstore.set_meta("embedder", "keyword")
+        write_index(build_index(embeddings.embed_documents(chunks), chunk_ids), self.index_path)
+
+    def test_load_missing_file(self):
+        """Test that nothing is loaded when no document is uploaded yet."""
+        self.assertIsNone(self.retriever.load())
+        self.assertIsNone(self.retriever.get_vector_store())
+
+    @patch('retriever.get_embeddings', return_value=KeywordEmbeddings())
+    def test_load_saved_index(self, mock_get_embeddings):
+        """Test that the saved index is loaded and searched through the SQLite docstore."""
+        self._save(["The pool is open.", "Breakfast is at 7.", "Free wifi everywhere."])
+
+        vector_store = self.retriever.load()
+        docs = vector_store.similarity_search("Where is the pool?", k=1)
+
+        mock_get_embeddings.assert_called_once_with("keyword")
+        self.assertEqual(docs[0].page_content, "The pool is open.")
+        self.assertEqual(docs[0].metadata, {"source": "0"})
+
+    @patch('retriever.get_embeddings', return_value=KeywordEmbeddings())
+    def test_refresh_loads_newer_index(self, mock_get_embeddings):
+        """Test that an index written by another worker is picked up."""
+        self.assertIsNone(self.retriever.refresh())
+        self._save(["The pool is open."])
+
+        vector_store = self.retriever.refresh()
+
+        self.assertIsNotNone(vector_store)
+        self.assertIs(self.retriever.refresh(), vector_store)
+
+    def test_swap(self):
+        """Test that new readers see the swapped vector store while old references are kept."""
+        self.retriever.swap("old")
+        in_flight = self.retriever.get_vector_store()
+
+        self.retriever.swap("new")
+
+        self.assertEqual(in_flight, "old")
+        self.assertEqual(self.retriever.get_vector_store(), "new")
+        self.assertEqual(self.retriever.version, 2)
+
+
+class TestReadWriteLock(unittest.TestCase):
+
+    def test_writer_waits_for_readers(self):
+        """Test that a writer can not enter while a reader holds the lock."""
+        lock = ReadWriteLock()
+        events = []
+
+        def write():
+            with lock.write():
+                events.append("write")
+
+        with lock.read():
+            writer = threading.Thread(target=write)
+            writer.start()
+            writer.join(timeout=0.1)
+            events.append("read")
+        writer.join()
+
+        self.assertEqual(events, ["read", "write"])
+
+    def test_readers_share_the_lock(self):
+        """Test that readers do not block each other."""
+        lock = ReadWriteLock()
+        with lock.read():
+            with lock.read():
+                self.assertEqual(lock.readers, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
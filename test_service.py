@@ -1,10 +1,46 @@
 import unittest
 from unittest.mock import patch, AsyncMock, MagicMock
-from service import upload_documents, _extract_text_from_document, _chunk_text, _create_embeddings_and_save
+import os
+import asyncio
+import json
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from service import upload_documents, get_ingestion_status, ask_question, reload_llm_clients, _route, _rag, _status, _cancel, _book, _ingest, _save_faq_answers, _write_faq_answer, _extract_segments, _chunk_segments, _create_embeddings_and_save, _ask_llm, _summarize_memory
+from ingestion import IngestionJob
+from extraction import ExtractionWindow
+from document_store import hash_chunk
+from answer_cache import SemanticAnswerCache
+from response_cache import LLMResponseCache
+from faq_answers import FAQAnswerStore
+from response_templates import TEMPLATES, ResponseTemplates
+from booking import Booking
+from retriever import Retriever
 from user import User
 from fastapi import UploadFile
 
 
+def setUpModule():
+    # Users get a mock hotel manager, so the suite does not create hotel.db in the working directory
+    patcher = patch('user.get_hotel_manager', return_value=MagicMock())
+    patcher.start()
+    unittest.addModuleCleanup(patcher.stop)
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic embeddings that remember which texts are embedded."""
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded += texts
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), float(text.count("a")), float(text.count("e"))]
+
+
 class TestService(unittest.IsolatedAsyncioTestCase):
 
     @patch('service.os.getenv')
@@ -19,74 +55,709 @@ class TestService(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result, ("Only ADMIN can insert files.", 400))
 
     @patch('service.os.getenv')
-    @patch('service._extract_text_from_document', return_value="Mocked text")
-    @patch('service._chunk_text', return_value=["chunk1", "chunk2"])
-    @patch('service._create_embeddings_and_save')
-    async def test_upload_documents_success(self, mock_create_embeddings, mock_chunk, mock_extract, mock_getenv):
+    @patch('service.get_ingestion_queue')
+    async def test_upload_documents_success(self, mock_get_queue, mock_getenv):
         # Mocking environment variable and input
         mock_getenv.return_value = "admin_password"
+        mock_get_queue.return_value.submit.return_value = IngestionJob(["test.pdf"])
         user = User(username="test_user")
-        files = [UploadFile(filename="test.pdf", file=AsyncMock())]
+        file = AsyncMock(filename="test.pdf")
+        file.read = AsyncMock(return_value=b"mock_bytes")
         password = "admin_password"
 
-        result = await upload_documents(user, files, password)
+        result = await upload_documents(user, [file], password)
+
+        # Assert that the job is queued with the file bytes and its id is returned
+        mock_get_queue.return_value.submit.assert_called_once_with(_ingest, ["test.pdf"], user, [("test.pdf", b"mock_bytes")])
+        self.assertEqual(result, (mock_get_queue.return_value.submit.return_value.job_id, 202))
+
+    @patch('service.get_ingestion_queue')
+    async def test_get_ingestion_status(self, mock_get_queue):
+        job = IngestionJob(["test.pdf"])
+        mock_get_queue.return_value.get_job.side_effect = lambda job_id: job if job_id == job.job_id else None
+
+        self.assertEqual(await get_ingestion_status(job.job_id), (job.get_status(), 200))
+        self.assertEqual(await get_ingestion_status("missing"), ("Ingestion job not found.", 404))
+
+    @patch('service._extract_segments', return_value=iter([("Mocked text", {"source": "test.pdf", "page": 1})]))
+    @patch('service._chunk_segments', return_value=iter([("chunk1", {"source": "test.pdf", "page": 1})]))
+    @patch('service._create_embeddings_and_save')
+    @patch('service.get_extraction_pool')
+    def test_ingest(self, mock_get_pool, mock_create_embeddings, mock_chunk, mock_extract):
+        user = User(username="test_user")
+        job = IngestionJob(["test.pdf"])
+        documents = [("test.pdf", b"mock_bytes")]
+
+        _ingest(job, user, documents)
+
+        # Assert that the correct steps are chained, files share one extraction window on the pool
+        mock_extract.assert_called_once()
+        self.assertEqual(mock_extract.call_args.args[:3], ("test.pdf", b"mock_bytes", job))
+        self.assertIs(mock_extract.call_args.args[3].pool, mock_get_pool.return_value)
+        mock_chunk.assert_called_once_with(mock_extract.return_value)
+        mock_create_embeddings.assert_called_once_with(user, {"test.pdf": mock_chunk.return_value}, job)
+        self.assertEqual(job.stage, "embedding")
+
+    @patch.dict(os.environ, {"EXTRACTION_WORKERS": "2"})
+    @patch('service._create_embeddings_and_save')
+    def test_ingest_submits_every_file_before_embedding(self, mock_create_embeddings):
+        """Test that the files of an upload are extracted in parallel and not one after another."""
+        with ThreadPoolExecutor(max_workers=2) as pool, patch.object(pool, 'submit', wraps=pool.submit) as mock_submit, patch('service.get_extraction_pool', return_value=pool):
+            submitted = []
+            def consume(user, chunks, job):
+                submitted.extend(call.args[1] for call in mock_submit.call_args_list)
+                return {file_name: list(file_chunks) for file_name, file_chunks in chunks.items()}
+            mock_create_embeddings.side_effect = consume
 
-        # Assert that the correct steps are taken
-        mock_extract.assert_called_once_with(files)
-        mock_chunk.assert_called_once()
-        mock_create_embeddings.assert_called_once_with(user, ["chunk1", "chunk2"])
+            _ingest(IngestionJob(["a.txt", "b.txt"]), User(username="test_user"), [("a.txt", b"first"), ("b.txt", b"second")])
 
-        self.assertEqual(result, ("Document is uploaded successfully.", 200))
+        self.assertEqual(submitted, ["a.txt", "b.txt"])
 
-    @patch('service.PyPDF2.PdfReader')
-    @patch('service.Document')
-    async def test_extract_text_from_document_pdf(self, mock_Document, mock_PdfReader):
-        # Mock a PDF file read process
+    @patch.dict(os.environ, {"FAQ_LANGUAGES": "en, tr"})
+    @patch('service._save_faq_answers')
+    @patch('service._create_embeddings_and_save')
+    @patch('service.get_extraction_pool', return_value=None)
+    def test_ingest_with_faq_answers(self, mock_get_pool, mock_create_embeddings, mock_save_faq_answers):
+        def consume(user, chunks, job):
+            for file_chunks in chunks.values():
+                list(file_chunks)
+        mock_create_embeddings.side_effect = consume
+        user = User(username="test_user")
+        job = IngestionJob(["faq.txt"])
+
+        _ingest(job, user, [("faq.txt", b"Q: Pool?\nA: Yes.")])
+
+        mock_save_faq_answers.assert_called_once_with(user, "faq.txt", "Q: Pool?\nA: Yes.", ["en", "tr"])
+        self.assertEqual(job.stage, "faq")
+
+    def test_save_faq_answers(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            faq_store = FAQAnswerStore(os.path.join(temp_dir, "faq_answers.db"))
+            embeddings = CountingEmbeddings()
+            user = User(username="test_user")
+            with patch('service.get_faq_store', return_value=faq_store), patch('service.get_embeddings', return_value=embeddings), \
+                 patch('service._write_faq_answer', side_effect=lambda user, question, answer, language: f"{language}: {answer}") as mock_write:
+                _save_faq_answers(user, "faq.txt", "Q: Do you have a pool?\nA: Yes.\n\nQ: Is there parking?\nA: No.", ["en", "tr"])
+                self.assertEqual(mock_write.call_count, 4)
+
+                # Answers of unchanged pairs are not written again
+                _save_faq_answers(user, "faq.txt", "Q: Do you have a pool?\nA: Yes.\n\nQ: Is there parking?\nA: Yes, free.", ["en", "tr"])
+                self.assertEqual(mock_write.call_count, 6)
+
+            vector = embeddings.embed_query("Is there parking?")
+            self.assertEqual(faq_store.match(vector, user.embedder, "tr", threshold=0.99), "tr: Yes, free.")
+            faq_store.close()
+
+    @patch.dict(os.environ, {"LLM_TIMEOUT": "0.01"})
+    @patch('service.get_llm_registry')
+    def test_write_faq_answer_timeout(self, mock_get_registry):
+        """Test that an FAQ answer call that does not return fails instead of blocking the ingestion worker."""
+        async def slow_invoke(prompt):
+            await asyncio.sleep(1)
+        mock_get_registry.return_value.get.return_value.ainvoke = slow_invoke
+
+        with self.assertRaises(asyncio.TimeoutError):
+            _write_faq_answer(User(username="test_user"), "Pool?", "Yes.", "en")
+
+    @patch('extraction.PyPDF2.PdfReader')
+    def test_extract_segments_pdf(self, mock_PdfReader):
+        # Mock a PDF file read process, pages are reported once their part is consumed
         mock_pdf_reader = MagicMock()
-        mock_pdf_reader.pages = [MagicMock(extract_text=MagicMock(return_value="page_text"))]
+        mock_pdf_reader.pages = [MagicMock(extract_text=MagicMock(return_value="page_text")), MagicMock(extract_text=MagicMock(return_value="second_page"))]
         mock_PdfReader.return_value = mock_pdf_reader
+        job = IngestionJob(["test.pdf"])
 
-        file = AsyncMock(filename="test.pdf")
-        file.read = AsyncMock(return_value=b"mock_bytes")
+        with patch.dict(os.environ, {"EXTRACTION_PAGES_PER_PART": "1"}):
+            segments = _extract_segments("test.pdf", b"mock_bytes", job)
+            self.assertEqual(next(segments), ("page_text", {"source": "test.pdf", "page": 1}))
+            self.assertEqual(job.pages_processed, 0)
+            self.assertEqual(list(segments), [("second_page", {"source": "test.pdf", "page": 2})])
+        self.assertEqual(job.pages_processed, 2)
 
-        result = await _extract_text_from_document([file])
-        self.assertEqual(result, "page_text")
+    @patch('extraction.PyPDF2.PdfReader')
+    def test_extract_segments_with_pool(self, mock_PdfReader):
+        # Page ranges are extracted in a window of EXTRACTION_WORKERS parts, workers get the path of a temporary copy
+        mock_pdf_reader = MagicMock()
+        mock_pdf_reader.pages = [MagicMock(extract_text=MagicMock(return_value=f"page_{i}")) for i in range(5)]
+        mock_PdfReader.return_value = mock_pdf_reader
+        job = IngestionJob(["test.pdf"])
 
-    @patch('service.Document')
-    async def test_extract_text_from_document_docx(self, mock_Document):
-        # Mock a DOCX file read process
-        mock_document = MagicMock()
-        mock_document.paragraphs = [MagicMock(text="paragraph_text")]
-        mock_Document.return_value = mock_document
+        with ThreadPoolExecutor(max_workers=3) as pool, patch.dict(os.environ, {"EXTRACTION_PAGES_PER_PART": "2"}), patch.object(pool, 'submit', wraps=pool.submit) as mock_submit:
+            window = ExtractionWindow(pool, 1)
+            segments = _extract_segments("test.pdf", b"mock_bytes", job, window)
+            window.start()
+            self.assertEqual(next(segments), ("page_0", {"source": "test.pdf", "page": 1}))
+            self.assertEqual(mock_submit.call_count, 2)
+            path = mock_submit.call_args.args[2]
+            self.assertTrue(os.path.exists(path))
+            result = list(segments)
 
-        file = AsyncMock(filename="test.docx")
-        file.read = AsyncMock(return_value=b"mock_bytes")
+        self.assertEqual(mock_submit.call_count, 3)
+        self.assertEqual([text for text, _ in result], [f"page_{i}" for i in range(1, 5)])
+        self.assertEqual(job.pages_processed, 5)
+        self.assertFalse(os.path.exists(path))
 
-        result = await _extract_text_from_document([file])
-        self.assertEqual(result, "paragraph_text\n")
+    def test_extract_segments_txt(self):
+        result = list(_extract_segments("test.txt", "first line\r\nsecond line".encode("utf-8")))
+        self.assertEqual(result, [("first line", {"source": "test.txt", "page": 1}), ("second line", {"source": "test.txt", "page": 1})])
 
-    async def test_chunk_text(self):
-        # Test for the _chunk_text function
+    def test_chunk_segments(self):
+        # Test for the _chunk_segments function
         text = "This is a sample text that will be chunked into smaller parts."
-        chunks = await _chunk_text(text)
-        self.assertIsInstance(chunks, list)
-        self.assertGreater(len(chunks), 0)
+        chunks = list(_chunk_segments([(text, {"source": "test.txt", "page": 1})]))
+        self.assertEqual(chunks, [(text, {"source": "test.txt", "page": 1})])
+
+    def test_chunk_segments_across_pages(self):
+        # Lines are merged across pages, a chunk keeps the page where it starts and the overlap is repeated
+        segments = [("a" * 40 + "\n" + "b" * 10, {"source": "test.pdf", "page": 1}), ("c" * 40, {"source": "test.pdf", "page": 2})]
+        chunks = list(_chunk_segments(segments, chunk_size=60, chunk_overlap=15))
+        self.assertEqual(chunks, [("a" * 40 + "\n" + "b" * 10, {"source": "test.pdf", "page": 1}), ("b" * 10 + "\n" + "c" * 40, {"source": "test.pdf", "page": 1})])
+
+    def test_chunk_segments_is_lazy(self):
+        # Chunks are produced before the whole document is read
+        def segments():
+            yield "a" * 30, {"source": "test.pdf", "page": 1}
+            yield "b" * 30, {"source": "test.pdf", "page": 2}
+            raise AssertionError("Read too far")
+
+        chunks = _chunk_segments(segments(), chunk_size=40, chunk_overlap=0)
+        self.assertEqual(next(chunks), ("a" * 30, {"source": "test.pdf", "page": 1}))
+
+    def test_create_embeddings_and_save_incremental(self):
+        # Real index and docstore in a temporary directory with fake embeddings
+        with tempfile.TemporaryDirectory() as temp_dir:
+            retriever = Retriever(index_path=os.path.join(temp_dir, "document.faiss"), docstore_path=os.path.join(temp_dir, "document.db"))
+            embeddings = CountingEmbeddings()
+            user = User(username="test_user")
+            with patch('service.get_retriever', return_value=retriever), patch('service.get_embeddings', return_value=embeddings), patch('retriever.get_embeddings', return_value=embeddings), patch('service.get_answer_cache') as mock_get_answer_cache:
+                job = IngestionJob(["faq.txt", "rules.txt"])
+                _create_embeddings_and_save(user, {"faq.txt": self._chunks("faq.txt", ["Q: Pool? A: Yes.", "Q: Breakfast? A: 7-10."]), "rules.txt": self._chunks("rules.txt", ["No pets."])}, job)
+                self.assertEqual(len(embeddings.embedded), 3)
+                self.assertEqual(job.chunks_embedded, 3)
+                mock_get_answer_cache.return_value.invalidate.assert_called_once()
+
+                # Same chunks are not embedded again
+                embeddings.embedded = []
+                _create_embeddings_and_save(user, {"faq.txt": self._chunks("faq.txt", ["Q: Pool?  A: Yes.", "Q: Breakfast? A: 7-10."])})
+                self.assertEqual(embeddings.embedded, [])
+
+                # Only the changed chunk is embedded and the replaced one is removed
+                replaced_chunk_id = retriever.docstore.get_source_hashes("faq.txt")[hash_chunk("Q: Breakfast? A: 7-10.")]
+                vector_store = _create_embeddings_and_save(user, {"faq.txt": self._chunks("faq.txt", ["Q: Pool? A: Yes.", "Q: Breakfast? A: 8-11."])})
+                self.assertEqual(embeddings.embedded, ["Q: Breakfast? A: 8-11."])
+                self.assertEqual(vector_store.index.ntotal, 3)
+                contents = sorted(content for _, content in retriever.docstore.get_chunks())
+                self.assertEqual(contents, ["No pets.", "Q: Breakfast? A: 8-11.", "Q: Pool? A: Yes."])
+                docs = vector_store.similarity_search("Q: Breakfast? A: 8-11.", k=1)
+                self.assertEqual(docs[0].metadata, {"source": "faq.txt", "page": 1, "chunk": 1})
 
-    @patch('service.FAISS')
-    @patch('service.pickle')
-    async def test_create_embeddings_and_save(self, mock_pickle, mock_FAISS):
-        # Mock embeddings and FAISS save
-        mock_faiss = MagicMock()
-        mock_FAISS.from_texts.return_value = mock_faiss
+                # The replaced chunk stays readable for searches on the previous index until the next upload
+                self.assertEqual(retriever.docstore.search(replaced_chunk_id).page_content, "Q: Breakfast? A: 7-10.")
+                _create_embeddings_and_save(user, {"rules.txt": self._chunks("rules.txt", ["No pets."])})
+                self.assertEqual(retriever.docstore.search(replaced_chunk_id), f"ID {replaced_chunk_id} not found.")
+            retriever.docstore.close()
 
+    def test_create_embeddings_and_save_failure_rolls_back(self):
+        # Chunks of a failed upload are removed so that the next upload embeds them again
+        with tempfile.TemporaryDirectory() as temp_dir:
+            retriever = Retriever(index_path=os.path.join(temp_dir, "document.faiss"), docstore_path=os.path.join(temp_dir, "document.db"))
+            embeddings = CountingEmbeddings()
+            user = User(username="test_user")
+
+            def broken_chunks():
+                yield from self._chunks("faq.txt", ["Q: Pool? A: Yes."])
+                raise ValueError("broken page")
+
+            with patch('service.get_retriever', return_value=retriever), patch('service.get_embeddings', return_value=embeddings), patch.dict(os.environ, {"EMBEDDING_BATCH_SIZE": "1"}):
+                with self.assertRaises(ValueError):
+                    _create_embeddings_and_save(user, {"faq.txt": broken_chunks()})
+            self.assertEqual(retriever.docstore.get_chunks(), [])
+            retriever.docstore.close()
+
+    def _chunks(self, source, texts):
+        return [(text, {"source": source, "page": 1}) for text in texts]
+
+class TestAskLLM(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.response_cache = LLMResponseCache()
+        patcher = patch('service.get_response_cache', return_value=self.response_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('service._get_llm', new_callable=AsyncMock)
+    async def test_ask_llm_uses_async_invoke(self, mock_get_llm):
+        mock_get_llm.return_value.ainvoke = AsyncMock(return_value=MagicMock(content="answer"))
+        user = User(username="test_user")
+
+        answer = await _ask_llm(user=user, prompt="prompt", llm="llama3-small")
+
+        mock_get_llm.assert_called_once_with(model_name="llama3-small")
+        mock_get_llm.return_value.ainvoke.assert_awaited_once_with("prompt")
+        mock_get_llm.return_value.invoke.assert_not_called()
+        self.assertEqual(answer, "answer")
+
+    @patch('service._get_llm', new_callable=AsyncMock)
+    async def test_ask_llm_completion_model(self, mock_get_llm):
+        # Completion models return plain strings
+        mock_get_llm.return_value.ainvoke = AsyncMock(return_value="answer")
+        user = User(username="test_user")
+        self.assertEqual(await _ask_llm(user=user, prompt="prompt"), "answer")
+
+    @patch('service.os.getenv', return_value="admin_password")
+    @patch('service.get_llm_registry')
+    async def test_reload_llm_clients(self, mock_get_registry, mock_getenv):
+        self.assertEqual(await reload_llm_clients("wrong_password"), ("Only ADMIN can reload LLM clients.", 400))
+        mock_get_registry.return_value.reload.assert_not_called()
+
+        self.assertEqual(await reload_llm_clients("admin_password"), ("LLM clients are reloaded.", 200))
+        mock_get_registry.return_value.reload.assert_called_once()
+
+    @patch.dict(os.environ, {"LLM_TIMEOUT": "0.01"})
+    @patch('service._get_llm', new_callable=AsyncMock)
+    async def test_ask_llm_timeout(self, mock_get_llm):
+        async def slow_invoke(prompt):
+            await asyncio.sleep(1)
+        mock_get_llm.return_value.ainvoke = slow_invoke
+        user = User(username="test_user")
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await _ask_llm(user=user, prompt="prompt")
+
+    @patch('service._get_saved_user', new_callable=AsyncMock)
+    @patch('service._retrieve', new_callable=AsyncMock, return_value=None)
+    @patch('service._route', new_callable=AsyncMock, side_effect=asyncio.TimeoutError)
+    async def test_ask_question_timeout(self, mock_route, mock_retrieve, mock_get_saved_user):
+        user = User(username="test_user")
+        user.set_language_preference("en")
+        mock_get_saved_user.return_value = user
+
+        result = await ask_question(user, "Do you have a pool?")
+
+        self.assertEqual(result, ("The assistant is taking too long to answer, please try again.", 504))
+
+    @patch('service._get_llm', new_callable=AsyncMock)
+    async def test_concurrent_calls_overlap(self, mock_get_llm):
+        # Two slow calls finish in about the time of one
+        async def slow_invoke(prompt):
+            await asyncio.sleep(0.2)
+            return MagicMock(content=prompt)
+        mock_get_llm.return_value.ainvoke = slow_invoke
         user = User(username="test_user")
-        chunks = ["chunk1", "chunk2"]
-        
-        result = await _create_embeddings_and_save(user, chunks)
-        
-        mock_FAISS.from_texts.assert_called_once()
-        mock_pickle.dump.assert_called_once()
-        self.assertEqual(result, mock_faiss)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        answers = await asyncio.gather(_ask_llm(user=user, prompt="a"), _ask_llm(user=user, prompt="b"))
+
+        self.assertEqual(answers, ["a", "b"])
+        self.assertLess(loop.time() - start, 0.35)
+
+    @patch('service._get_llm', new_callable=AsyncMock)
+    async def test_repeated_prompt_is_cached(self, mock_get_llm):
+        mock_get_llm.return_value.ainvoke = AsyncMock(return_value=MagicMock(content="answer"))
+        user = User(username="test_user")
+
+        answers = [await _ask_llm(user=user, prompt="prompt", llm="llama3-small") for _ in range(2)]
+        other_model_answer = await _ask_llm(user=user, prompt="prompt", llm="llama3")
+
+        self.assertEqual(answers + [other_model_answer], ["answer"] * 3)
+        self.assertEqual(mock_get_llm.return_value.ainvoke.await_count, 2)
+
+    @patch('service._get_llm', new_callable=AsyncMock)
+    async def test_identical_concurrent_prompts_are_coalesced(self, mock_get_llm):
+        async def slow_invoke(prompt):
+            await asyncio.sleep(0.05)
+            return MagicMock(content=prompt)
+        mock_get_llm.return_value.ainvoke = AsyncMock(side_effect=slow_invoke)
+        user = User(username="test_user")
+
+        answers = await asyncio.gather(*[_ask_llm(user=user, prompt="a") for _ in range(3)])
+
+        self.assertEqual(answers, ["a", "a", "a"])
+        self.assertEqual(mock_get_llm.return_value.ainvoke.await_count, 1)
+        self.assertEqual(self.response_cache.get_stats()["coalesced"], 2)
+
+
+class TestRoute(unittest.IsolatedAsyncioTestCase):
+
+    @patch('service._classify_with_llm', new_callable=AsyncMock)
+    @patch('service.get_intent_classifier')
+    async def test_confident_local_route(self, mock_get_classifier, mock_classify_with_llm):
+        mock_get_classifier.return_value.predict.return_value = ("status", 0.95)
+        user = User(username="test_user")
+
+        self.assertEqual(await _route(user, "Are there any free rooms?"), "local:status")
+        mock_classify_with_llm.assert_not_called()
+
+    @patch('service._classify_with_llm', new_callable=AsyncMock, return_value="question")
+    @patch('service.get_intent_classifier')
+    async def test_reservation_changes_are_confirmed_by_llm(self, mock_get_classifier, mock_classify_with_llm):
+        """Test that confident cancel and booking predictions are not acted on without the LLM."""
+        user = User(username="test_user")
+        for intent in ("cancel", "booking"):
+            mock_get_classifier.return_value.predict.return_value = (intent, 0.95)
+            self.assertEqual(await _route(user, "Can I cancel for free if my plans change?"), "question")
+        self.assertEqual(mock_classify_with_llm.await_count, 2)
+
+    @patch('service._classify_with_llm', new_callable=AsyncMock, return_value="status")
+    @patch('service.get_intent_classifier')
+    async def test_unsure_route_falls_back_to_llm(self, mock_get_classifier, mock_classify_with_llm):
+        mock_get_classifier.return_value.predict.return_value = ("question", 0.4)
+        user = User(username="test_user")
+
+        self.assertEqual(await _route(user, "Hmm"), "status")
+        mock_classify_with_llm.assert_awaited_once_with(user, "Hmm")
+
+
+class TestSpeculativeRetrieval(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.user = User(username="test_user")
+        self.user.set_language_preference("en")
+        self.events = []
+
+        async def route(user, question):
+            self.events.append("route started")
+            await asyncio.sleep(0.05)
+            self.events.append("route finished")
+            return self.selected_function
+
+        async def retrieve(user, question):
+            self.events.append("retrieval started")
+            await asyncio.sleep(0.01)
+            return ["doc"]
+
+        patchers = [
+            patch('service._get_saved_user', new=AsyncMock(return_value=self.user)),
+            patch('service._save_user', new=AsyncMock()),
+            patch('service._route', new=route),
+            patch('service._retrieve', new=retrieve),
+            patch('service._log', new=AsyncMock()),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch('service._rag', new_callable=AsyncMock, return_value=("answer", "", "", 200))
+    async def test_retrieval_runs_while_routing(self, mock_rag):
+        self.selected_function = "question"
+
+        result = await ask_question(self.user, "Do you have a pool?")
+
+        self.assertEqual(result, ("answer", 200))
+        self.assertLess(self.events.index("retrieval started"), self.events.index("route finished"))
+        retrieval = mock_rag.await_args.kwargs["retrieval"]
+        self.assertEqual(await retrieval, ["doc"])
+
+    @patch('service._rag', new_callable=AsyncMock)
+    @patch('service._status', new_callable=AsyncMock, return_value=("free rooms", "", "", 200))
+    async def test_retrieval_is_discarded_for_other_intents(self, mock_status, mock_rag):
+        self.selected_function = "status"
+
+        result = await ask_question(self.user, "Are there any free rooms?")
+
+        self.assertEqual(result, ("free rooms", 200))
+        mock_rag.assert_not_called()
+
+    @patch('service._rag', new_callable=AsyncMock, return_value=("answer", "", "", 200))
+    @patch('service.detect', return_value="tr")
+    async def test_language_is_detected_while_routing(self, mock_detect, mock_rag):
+        self.selected_function = "question"
+        self.user.set_language_preference(None)
+
+        await ask_question(self.user, "Havuzunuz var mı?")
+
+        self.assertEqual(self.user.get_language_preference(), "tr")
+        mock_detect.assert_called_once_with("Havuzunuz var mı?")
+
+
+class TestMemorySummary(unittest.IsolatedAsyncioTestCase):
+
+    @patch('service.get_session_store')
+    @patch('service._ask_llm', new_callable=AsyncMock, return_value="The guest wants a suite in May.")
+    async def test_evicted_turns_are_summarized(self, mock_ask_llm, mock_get_session_store):
+        """Test that dropped turns are folded into the summary and only the summary is saved."""
+        user = User(username="test_user", hotel_management=MagicMock())
+        user.memory.summarize = True
+        for i in range(6):
+            user.memory.save(f"Question {i}", f"Answer {i}")
+
+        await _summarize_memory(user)
+
+        self.assertIn("<Question>: Question 0 <Answer>: Answer 0", mock_ask_llm.await_args.kwargs["prompt"])
+        self.assertEqual(user.memory.summary, "The guest wants a suite in May.")
+        self.assertFalse(user.memory.summarizing)
+        mock_get_session_store.return_value.save_summary.assert_called_once_with(user)
+        mock_get_session_store.return_value.save.assert_not_called()
+
+
+class TestRAG(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.user = User(username="test_user")
+        self.user.set_language_preference("en")
+        self.docs = [MagicMock(page_content=f"chunk {i}. ") for i in range(4)]
+        patcher = patch('service._embed_question', new=AsyncMock(return_value=None))
+        self.mock_embed_question = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('service._ask_llm', new_callable=AsyncMock, return_value="answer")
+    async def test_single_pass(self, mock_ask_llm):
+        self.user.set_rag_mode("single_pass")
+
+        result = await _rag(self.user, "Do you have a pool?", retrieval=AsyncMock(return_value=self.docs)())
+
+        self.assertEqual(result[0], "answer")
+        self.assertEqual(result[3], 200)
+        mock_ask_llm.assert_awaited_once()
+        prompt = mock_ask_llm.await_args.kwargs["prompt"]
+        self.assertIn("<Information>: chunk 0. chunk 1. chunk 2. ", prompt)
+        self.assertIn("Answer ONLY in the en language", prompt)
+
+    @patch('service._ask_llm', new_callable=AsyncMock, side_effect=["draft", "answer"])
+    async def test_two_stage(self, mock_ask_llm):
+        self.user.set_rag_mode("two_stage")
+
+        result = await _rag(self.user, "Do you have a pool?", retrieval=AsyncMock(return_value=self.docs)())
+
+        self.assertEqual(result[0], "answer")
+        self.assertEqual(mock_ask_llm.await_count, 2)
+        self.assertIn("Context: chunk 0. chunk 1. chunk 2. ", mock_ask_llm.await_args_list[0].kwargs["prompt"])
+        self.assertIn("<Information>: draft", mock_ask_llm.await_args_list[1].kwargs["prompt"])
+
+    @patch('service.get_faq_store')
+    @patch('service.get_answer_cache')
+    @patch('service._ask_llm', new_callable=AsyncMock, return_value="answer")
+    async def test_answer_cache(self, mock_ask_llm, mock_get_answer_cache, mock_get_faq_store):
+        cache = SemanticAnswerCache()
+        mock_get_answer_cache.return_value = cache
+        mock_get_faq_store.return_value.match.return_value = None
+        self.mock_embed_question.return_value = ([1.0, 0.0], 1, "embedder")
+
+        first = await _rag(self.user, "Do you have a pool?", retrieval=AsyncMock(return_value=self.docs)())
+        second = await _rag(self.user, "Do you have a pool?")
+
+        self.assertEqual(first[0], "answer")
+        self.assertEqual(second, ("answer", self.user.memory.get_memory(), None, 200))
+        mock_ask_llm.assert_awaited_once()
+        self.assertEqual(cache.get_stats()["hits"], 1)
+
+    @patch('service.get_faq_store')
+    @patch('service.get_answer_cache')
+    @patch('service._ask_llm', new_callable=AsyncMock, return_value="answer")
+    async def test_answer_cache_is_skipped_with_chat_history(self, mock_ask_llm, mock_get_answer_cache, mock_get_faq_store):
+        """Test that a follow-up question is neither served from nor written to the answer cache."""
+        mock_get_faq_store.return_value.match.return_value = None
+        self.mock_embed_question.return_value = ([1.0, 0.0], 1, "embedder")
+        self.user.memory.save("Do you have swimming pools?", "Yes, we have an indoor pool.")
+
+        await _rag(self.user, "How many of them do you have?", retrieval=AsyncMock(return_value=self.docs)())
+
+        mock_get_answer_cache.return_value.get.assert_not_called()
+        mock_get_answer_cache.return_value.put.assert_not_called()
+
+    @patch('service._retrieve', new_callable=AsyncMock)
+    @patch('service.get_faq_store')
+    @patch('service._ask_llm', new_callable=AsyncMock)
+    async def test_precomputed_faq_answer(self, mock_ask_llm, mock_get_faq_store, mock_retrieve):
+        mock_get_faq_store.return_value.match.return_value = "Yes, we have an indoor pool."
+        self.mock_embed_question.return_value = ([1.0, 0.0], 1, "embedder")
+
+        result = await _rag(self.user, "Do you have a pool?")
+
+        self.assertEqual(result[0], "Yes, we have an indoor pool.")
+        mock_get_faq_store.return_value.match.assert_called_once_with([1.0, 0.0], "embedder", "en", threshold=0.9)
+        mock_retrieve.assert_not_called()
+        mock_ask_llm.assert_not_called()
+
+    @patch('service._retrieve', new_callable=AsyncMock, return_value=None)
+    async def test_document_not_found(self, mock_retrieve):
+        result = await _rag(self.user, "Do you have a pool?")
+
+        self.assertEqual(result, ("Document not found.", None, None, 400))
+
+
+class TestTemplateResponses(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.response_templates = ResponseTemplates(os.path.join(self.temp_dir.name, "templates.db"))
+        patcher = patch('service.get_response_templates', return_value=self.response_templates)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.hotel_manager = MagicMock()
+        self.hotel_manager.get_available_room_counts.return_value = {"single": 2, "double": 0, "suite": 1}
+        self.user = User(username="test_user", hotel_management=self.hotel_manager)
+
+    def tearDown(self):
+        self.response_templates.close()
+        self.temp_dir.cleanup()
+
+    @patch('service._ask_llm', new_callable=AsyncMock)
+    async def test_status_with_template(self, mock_ask_llm):
+        self.user.set_language_preference("tr")
+
+        final_answer, _, _, http_code = await _status(self.user, "Boş odanız var mı?")
+
+        self.assertEqual(final_answer, "Şu anda 2 adet tek kişilik (1-2 kişi) oda, 1 adet süit (4-5 kişi) oda müsait.")
+        self.assertEqual(http_code, 200)
+        mock_ask_llm.assert_not_called()
+
+    @patch('service._ask_llm', new_callable=AsyncMock)
+    async def test_status_for_dates(self, mock_ask_llm):
+        self.user.set_language_preference("en")
+
+        final_answer, _, _, _ = await _status(self.user, "Do you have free rooms from 2030-10-03 to 2030-10-05?")
+
+        self.assertEqual(final_answer, "From 2030-10-03 to 2030-10-05 we have 2 single (1-2 people) rooms, 1 suite (4-5 people) rooms available.")
+        self.hotel_manager.get_available_room_counts.assert_called_once_with("2030-10-03", "2030-10-05")
+        mock_ask_llm.assert_not_called()
+
+    @patch('service._ask_llm', new_callable=AsyncMock)
+    async def test_cancel_with_template(self, mock_ask_llm):
+        self.user.set_language_preference("en")
+        self.user.set_room_id(5)
+        self.user.set_reservation_id(9)
+
+        final_answer, _, _, _ = await _cancel(self.user, "Cancel my reservation.")
+
+        self.assertEqual(final_answer, "Your reservation is cancelled for the room with the room id: 5")
+        self.hotel_manager.cancel_reservation.assert_called_once_with(9)
+        self.assertIsNone(self.user.get_room_id())
+        self.assertIsNone(self.user.get_reservation_id())
+        mock_ask_llm.assert_not_called()
+
+    @patch('service._ask_llm', new_callable=AsyncMock)
+    async def test_translation_is_written_once(self, mock_ask_llm):
+        mock_ask_llm.return_value = json.dumps({key: f"DE {template}" for key, template in TEMPLATES["en"].items()})
+        self.user.set_language_preference("de")
+
+        first, _, _, _ = await _cancel(self.user, "Stornieren Sie meine Reservierung.")
+        second, _, _, _ = await _cancel(self.user, "Stornieren bitte.")
+
+        self.assertEqual(first, "DE I can't see a reservation on your account.")
+        self.assertEqual(second, first)
+        mock_ask_llm.assert_awaited_once()
+
+    @patch('service._ask_llm', new_callable=AsyncMock, side_effect=["not json", "Keine Reservierung."])
+    async def test_rewrite_without_template(self, mock_ask_llm):
+        self.user.set_language_preference("de")
+
+        final_answer, _, _, _ = await _cancel(self.user, "Stornieren Sie meine Reservierung.")
+
+        self.assertEqual(final_answer, "Keine Reservierung.")
+        self.assertIn("I can't see a reservation on your account.", mock_ask_llm.await_args.kwargs["prompt"])
+
+
+class TestBook(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.hotel_manager = MagicMock()
+        self.hotel_manager.reserve_room.return_value = (3, 8, "Room 3 reserved from 2030-10-03 to 2030-10-07 successfully.")
+        self.user = User(username="test_user", hotel_management=self.hotel_manager)
+        self.user.set_language_preference("en")
+        self.user.memory.save(question="Can you book me?", answer="Please tell me your details.")
+        patcher = patch('service.get_response_templates')
+        patcher.start().return_value.get.side_effect = TEMPLATES.get
+        self.addCleanup(patcher.stop)
+
+    @patch('service._ask_llm', new_callable=AsyncMock, return_value="Your room is booked.")
+    async def test_last_field_is_filled_without_extraction_call(self, mock_ask_llm):
+        self.user.set_booking(Booking(full_name="Barkın Özer", phone_number="5365363636", start_date="2030-10-03", end_date="2030-10-07", guest_count=2,
+                                      room_type="single", number_of_rooms=1, payment_method="credit card", include_breakfast=True))
+
+        final_answer, _, _, http_code = await _book(self.user, "yes sorry, it is barorkar@gmail.com")
+
+        self.assertEqual(http_code, 200)
+        self.assertTrue(final_answer.startswith("Your room is booked."))
+        self.assertEqual((self.user.get_room_id(), self.user.get_reservation_id()), (3, 8))
+        self.assertEqual(self.hotel_manager.reserve_room.call_args.kwargs["email"], "barorkar@gmail.com")
+        # Only the confirmation is written by the LLM
+        mock_ask_llm.assert_awaited_once()
+        self.assertEqual(mock_ask_llm.await_args.kwargs["llm"], "llama3-small")
+
+    @patch('service._ask_llm', new_callable=AsyncMock, return_value='```json\n{"full_name": "Burak Çivit", "note": "", "guest_count": "2 people"')
+    async def test_llm_is_asked_only_for_missing_fields(self, mock_ask_llm):
+        final_answer, _, _, http_code = await _book(self.user, "I want breakfast. burak@gmail.com. credit card. Burak Çivit.")
+
+        # The cut off JSON is repaired without another call
+        mock_ask_llm.assert_awaited_once()
+        prompt = mock_ask_llm.await_args.kwargs["prompt"]
+        self.assertIn("full_name:", prompt)
+        self.assertNotIn("email:", prompt)
+        self.assertNotIn("Please tell me your details.", prompt)
+        booking = self.user.get_booking()
+        self.assertEqual((booking.full_name, booking.email), ("Burak Çivit", "burak@gmail.com"))
+        self.assertEqual(final_answer, "You need to tell me these information as well please: phone number, start date, end date, guest count, room type, number of rooms")
+        self.assertEqual(http_code, 200)
+
+    @patch('service._ask_llm', new_callable=AsyncMock, return_value='{"email": "barkin@gmail.com"}')
+    async def test_invalid_slot_is_asked_again(self, mock_ask_llm):
+        self.user.set_booking(Booking(full_name="Barkın Özer", phone_number="5365363636", email="barkin", start_date="2030-10-03", end_date="2030-10-07",
+                                      guest_count=2, room_type="single", number_of_rooms=1, payment_method="credit card", include_breakfast=True))
+
+        final_answer, _, _, http_code = await _book(self.user, "oh the mail is on gmail, barkin at gmail")
+
+        self.assertIn("email: The e-mail of the customer (the previous value barkin is invalid)", mock_ask_llm.await_args_list[0].kwargs["prompt"])
+        self.assertEqual(self.user.get_booking().email, "barkin@gmail.com")
+        self.assertTrue(self.user.get_booking().is_confirmed())
+
+    @patch('service._ask_llm', new_callable=AsyncMock, return_value="Your room is booked.")
+    async def test_confirmed_booking_is_not_reserved_again(self, mock_ask_llm):
+        """Test that the turn after a confirmation starts a new booking instead of reserving the same room again."""
+        self.user.set_booking(Booking(full_name="Barkın Özer", phone_number="5365363636", email="barorkar@gmail.com", start_date="2030-10-03", end_date="2030-10-07",
+                                      guest_count=2, room_type="single", number_of_rooms=1, payment_method="credit card", include_breakfast=True))
+        await _book(self.user, "ok")
+        self.assertTrue(self.user.get_booking().is_confirmed())
+
+        await _book(self.user, "thanks, my email is barorkar@gmail.com")
+
+        self.hotel_manager.reserve_room.assert_called_once()
+        self.assertFalse(self.user.get_booking().is_confirmed())
+        self.assertEqual(self.user.get_room_id(), 3)
+
+    @patch('service._ask_llm', new_callable=AsyncMock, return_value="Your room is booked.")
+    async def test_reservation_runs_off_the_event_loop(self, mock_ask_llm):
+        """Test that the blocking reservation and cancellation calls do not run on the event loop thread."""
+        threads = []
+        self.hotel_manager.reserve_room.side_effect = lambda **kwargs: threads.append(threading.current_thread()) or (3, 8, "Room 3 reserved.")
+        self.hotel_manager.cancel_reservation.side_effect = lambda reservation_id: threads.append(threading.current_thread())
+        self.user.set_booking(Booking(full_name="Barkın Özer", phone_number="5365363636", email="barorkar@gmail.com", start_date="2030-10-03", end_date="2030-10-07",
+                                      guest_count=2, room_type="single", number_of_rooms=1, payment_method="credit card", include_breakfast=True))
+
+        await _book(self.user, "ok")
+        await _cancel(self.user, "Cancel my reservation.")
+
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    @patch('service._ask_llm', new_callable=AsyncMock, return_value="Your room is booked.")
+    async def test_guest_corrects_a_field(self, mock_ask_llm):
+        """Test that values the guest changes before the reservation are reserved and not the earlier ones."""
+        self.user.set_booking(Booking(full_name="Barkın Özer", phone_number="5365363636", start_date="2030-10-03", end_date="2030-10-07", guest_count=2,
+                                      room_type="single", number_of_rooms=1, payment_method="credit card", include_breakfast=True))
+
+        await _book(self.user, "Actually make it a double room, and from 2030-10-04 to 2030-10-08")
+        await _book(self.user, "my email is barorkar@gmail.com")
+
+        reservation = self.hotel_manager.reserve_room.call_args.kwargs
+        self.assertEqual((reservation["room_type"], reservation["start_date"], reservation["end_date"]), ("double", "2030-10-04", "2030-10-08"))
+
+    @patch('service._ask_llm', new_callable=AsyncMock)
+    async def test_validation_error(self, mock_ask_llm):
+        self.user.set_booking(Booking(full_name="Barkın Özer", phone_number="12345"))
+
+        final_answer, _, _, http_code = await _book(self.user, "ok thanks")
+
+        self.assertEqual((final_answer, http_code), (TEMPLATES["en"]["invalid.phone_number"], 400))
+        mock_ask_llm.assert_not_called()
+
+    @patch('service._ask_llm', new_callable=AsyncMock, return_value="{}")
+    async def test_booking_questions(self, mock_ask_llm):
+        final_answer, _, _, _ = await _book(self.user, "I would like to book")
+
+        self.assertEqual(mock_ask_llm.await_count, 1)
+        self.assertEqual(final_answer, TEMPLATES["en"]["booking_questions"])
 
 
 if __name__ == '__main__':
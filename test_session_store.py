@@ -0,0 +1,160 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from user import User
+from booking import Booking
+from session_store import SessionStore, SQLiteSessionBackend, to_record, apply_record
+
+
+def _make_user(username):
+    user = MagicMock()
+    user.username = username
+    return user
+
+
+class TestSessionStore(unittest.TestCase):
+
+    def test_saved_user_is_returned(self):
+        """Test that a second request of the same username gets the first user."""
+        store = SessionStore(max_sessions=10, idle_ttl=60)
+        first = _make_user("abc123")
+
+        self.assertIs(store.get_or_add(first), first)
+        self.assertIs(store.get_or_add(_make_user("abc123")), first)
+        self.assertEqual(store.get_stats(), {"live_sessions": 1, "evictions": 0, "expirations": 0, "loads": 0})
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that the least recently used session is closed beyond max_sessions."""
+        store = SessionStore(max_sessions=2, idle_ttl=60)
+        first, second, third = _make_user("a"), _make_user("b"), _make_user("c")
+        store.get_or_add(first)
+        store.get_or_add(second)
+        store.get_or_add(first)
+
+        store.get_or_add(third)
+
+        second.close.assert_called_once()
+        first.close.assert_not_called()
+        self.assertEqual(store.get_stats(), {"live_sessions": 2, "evictions": 1, "expirations": 0, "loads": 0})
+
+    @patch('session_store.time.time')
+    def test_idle_session_expires(self, mock_time):
+        """Test that a session idle longer than idle_ttl is closed and started again."""
+        store = SessionStore(max_sessions=10, idle_ttl=60)
+        first = _make_user("a")
+        mock_time.return_value = 1000
+        store.get_or_add(first)
+
+        mock_time.return_value = 1061
+        new_user = _make_user("a")
+
+        self.assertIs(store.get_or_add(new_user), new_user)
+        first.close.assert_called_once()
+        self.assertEqual(store.get_stats(), {"live_sessions": 1, "evictions": 0, "expirations": 1, "loads": 0})
+
+    def test_remove_closes_user(self):
+        """Test that a removed session is closed."""
+        store = SessionStore(max_sessions=10, idle_ttl=60)
+        user = _make_user("a")
+        store.get_or_add(user)
+
+        store.remove("a")
+        store.remove("missing")
+
+        user.close.assert_called_once()
+        self.assertEqual(store.get_stats()["live_sessions"], 0)
+
+
+class TestSessionRecord(unittest.TestCase):
+
+    def test_record_round_trip(self):
+        """Test that memory, partial booking, room id and language survive serialization."""
+        user = User(username="abc123", hotel_management=MagicMock())
+        user.memory.save("Can I book a room?", "Sure, what is your name?")
+        user.memory.set_summary("The guest asked about the pool.")
+        booking = Booking(full_name="Ayşe Yılmaz", guest_count=2, include_breakfast=False, note={"arrival": "late"})
+        booking.confirm()
+        user.set_booking(booking)
+        user.set_room_id(12)
+        user.set_reservation_id(4)
+        user.set_language_preference("tr")
+
+        restored = apply_record(User(username="abc123", hotel_management=MagicMock()), to_record(user))
+
+        self.assertEqual(restored.memory.get_memory(), user.memory.get_memory())
+        self.assertEqual(restored.get_booking().get_booking_details(), booking.get_booking_details())
+        self.assertEqual(restored.get_booking().get_slot_state("full_name"), "confirmed")
+        self.assertEqual((restored.get_room_id(), restored.get_reservation_id()), (12, 4))
+        self.assertEqual(restored.get_language_preference(), "tr")
+
+    def test_empty_record_is_compact(self):
+        """Test that a new session is serialized without empty fields."""
+        self.assertEqual(to_record(User(username="abc123", hotel_management=MagicMock())), "{}")
+
+
+class TestSQLiteSessionBackend(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_name = os.path.join(directory.name, "sessions.db")
+
+    def _make_worker(self):
+        backend = SQLiteSessionBackend(db_name=self.db_name, idle_ttl=60)
+        self.addCleanup(backend.close)
+        return SessionStore(max_sessions=10, idle_ttl=60, backend=backend)
+
+    def test_session_is_shared_by_workers(self):
+        """Test that a session saved by one worker is loaded by another, and reloaded after it changes."""
+        first_worker, second_worker = self._make_worker(), self._make_worker()
+        user = first_worker.get_or_add(User(username="abc123", hotel_management=MagicMock()))
+        user.set_language_preference("tr")
+        first_worker.save(user)
+
+        loaded = second_worker.get_or_add(User(username="abc123", hotel_management=MagicMock()))
+        self.assertEqual(loaded.get_language_preference(), "tr")
+
+        loaded.set_room_id(7)
+        second_worker.save(loaded)
+        self.assertEqual(first_worker.get_or_add(User(username="abc123", hotel_management=MagicMock())).get_room_id(), 7)
+        self.assertEqual(first_worker.get_stats()["loads"], 1)
+
+    def test_cached_session_is_not_reloaded(self):
+        """Test that a session this worker saved last is served from its cache."""
+        worker = self._make_worker()
+        user = worker.get_or_add(User(username="abc123", hotel_management=MagicMock()))
+        worker.save(user)
+
+        self.assertIs(worker.get_or_add(User(username="abc123", hotel_management=MagicMock())), user)
+        self.assertEqual(worker.get_stats()["loads"], 0)
+
+    def test_summary_keeps_newer_turns(self):
+        """Test that saving a summary from an older copy of the user does not overwrite turns saved by another worker."""
+        first_worker, second_worker = self._make_worker(), self._make_worker()
+        user = first_worker.get_or_add(User(username="abc123", hotel_management=MagicMock()))
+        user.memory.save("Question 0", "Answer 0")
+        first_worker.save(user)
+        newer = second_worker.get_or_add(User(username="abc123", hotel_management=MagicMock()))
+        newer.memory.save("Question 1", "Answer 1")
+        second_worker.save(newer)
+
+        user.memory.set_summary("The guest asked a question.")
+        first_worker.save_summary(user)
+
+        loaded = first_worker.get_or_add(User(username="abc123", hotel_management=MagicMock()))
+        self.assertEqual(loaded.memory.get_turns(), [("Question 0", "Answer 0"), ("Question 1", "Answer 1")])
+        self.assertEqual(loaded.memory.summary, "The guest asked a question.")
+
+    def test_removed_session_is_deleted(self):
+        """Test that removing a session deletes its saved record."""
+        worker = self._make_worker()
+        worker.save(worker.get_or_add(User(username="abc123", hotel_management=MagicMock())))
+
+        worker.remove("abc123")
+
+        self.assertIsNone(worker.backend.load("abc123"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,10 +5,18 @@ from booking import Booking
 from hotel_manager import HotelManager
 from memory import Memory
 
+
+def setUpModule():
+    # Users get a mock hotel manager, so the suite does not create hotel.db in the working directory
+    patcher = patch('user.get_hotel_manager', return_value=MagicMock())
+    patcher.start()
+    unittest.addModuleCleanup(patcher.stop)
+
+
 class TestUser(unittest.TestCase):
 
     @patch('user.Memory')
-    @patch('user.HotelManager')
+    @patch('user.get_hotel_manager')
     def test_user_initialization(self, mock_hotel_manager, mock_memory):
         """Test that User is initialized with correct attributes."""
         # Mock instances for external dependencies
@@ -33,6 +41,28 @@ class TestUser(unittest.TestCase):
         self.assertIsNone(user.booking)
         self.assertIsNone(user.room_id)
 
+    @patch.dict('os.environ', {"RAG_MODE": "two_stage"})
+    def test_rag_mode(self):
+        """Test that the RAG mode is read from the environment and can be changed."""
+        user = User(username="testuser")
+        self.assertEqual(user.get_rag_mode(), "two_stage")
+
+        user.set_rag_mode("single_pass")
+        self.assertEqual(user.get_rag_mode(), "single_pass")
+
+    def test_close(self):
+        """Test that closing a user clears its conversation state but keeps the hotel management."""
+        hotel_management = MagicMock()
+        user = User(username="testuser", hotel_management=hotel_management)
+        user.memory.save("question", "answer")
+        user.set_booking(MagicMock())
+
+        user.close()
+
+        self.assertEqual(user.memory.get_last_answer(), "")
+        self.assertIsNone(user.get_booking())
+        hotel_management.close.assert_not_called()
+
     def test_set_and_get_booking(self):
         """Test setting and getting the booking object."""
         # Create User instance
@@ -69,7 +99,7 @@ class TestUser(unittest.TestCase):
         # Assert that the LLM model is updated
         self.assertEqual(user.llm, "chatgpt")
 
-    @patch('user.HotelManager')
+    @patch('user.get_hotel_manager')
     def test_get_hotel_management(self, mock_hotel_manager):
         """Test that hotel management is retrieved correctly."""
         # Create mock instance of HotelManager
@@ -81,6 +111,16 @@ class TestUser(unittest.TestCase):
         # Assert that the hotel management object is retrieved correctly
         self.assertEqual(user.get_hotel_management(), mock_hotel_manager_instance)
 
+    @patch('user.get_hotel_manager')
+    def test_given_hotel_management_is_used(self, mock_get_hotel_manager):
+        """Test that a given hotel management is used instead of the shared one."""
+        hotel_manager = MagicMock(spec=HotelManager)
+
+        user = User(username="testuser", hotel_management=hotel_manager)
+
+        self.assertEqual(user.get_hotel_management(), hotel_manager)
+        mock_get_hotel_manager.assert_not_called()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -4,6 +4,7 @@ import os
 from dotenv import load_dotenv
 import random
 import string
+import time
 
 load_dotenv('.env')
 API_URL = os.getenv("API_URL")
@@ -40,11 +41,31 @@ class PDFChatBot:
         # Send the POST request with the files and password
         response = requests.post(f"{API_URL}/document-uploader", files=files_dict, data={"password": password})
 
-        # Handle the response
-        if response.status_code == 200:
-            return gr.update(visible=True, value="Document uploaded successfully!")
+        # Handle the response, ingestion runs in the background and its job is polled until it finishes
+        if response.status_code == 202:
+            job_id = response.json()["job_id"]
+            yield from self.poll_ingestion(job_id)
+        elif response.status_code == 200:
+            yield gr.update(visible=True, value=response.json().get("response", ""))
         else:
-            return gr.update(visible=True, value=f"Error: {response.status_code} - {response.text}")
+            yield gr.update(visible=True, value=f"Error: {response.status_code} - {response.text}")
+
+    def poll_ingestion(self, job_id, interval=1.0):
+        """Ingestion job status is shown until the job is done or failed."""
+        while True:
+            response = requests.get(f"{API_URL}/document-uploader/{job_id}")
+            if response.status_code != 200:
+                yield gr.update(visible=True, value=f"Error: {response.status_code} - {response.text}")
+                return
+            status = response.json()["response"]
+            if status["stage"] == "done":
+                yield gr.update(visible=True, value=f"Document uploaded successfully! {status['chunks_embedded']} new chunks embedded.")
+                return
+            if status["stage"] == "failed":
+                yield gr.update(visible=True, value=f"Error: {status['error']}")
+                return
+            yield gr.update(visible=True, value=f"Stage: {status['stage']} - pages processed: {status['pages_processed']}, chunks embedded: {status['chunks_embedded']} ({status['chunks_per_second']} chunks/s)")
+            time.sleep(interval)
 
     def add_text(self, chat_history, text):
         # Ensure chat_history is a list of lists
@@ -158,11 +179,12 @@ with app1:
         return gr.update(visible=True)
 
     def handle_upload(uploaded_pdf, password):
-        # Perform the file processing
-        result = pdf_chatbot.render_file(uploaded_pdf, password)
+        # Perform the file processing, every progress update is shown while the job runs
+        for result in pdf_chatbot.render_file(uploaded_pdf, password):
+            yield gr.update(visible=True), result
         
         # Hide loading message and show upload status
-        return gr.update(visible=False), result
+        yield gr.update(visible=False), result
     
     # First, show the loading message when the upload starts
     uploaded_pdf.upload(
@@ -1,18 +1,23 @@
+import os
 from memory import Memory
 from booking import Booking
-from hotel_manager import HotelManager
+from hotel_manager import HotelManager, get_hotel_manager
 
 class User:
-    def __init__(self, username):
-        # Each user has a username, llm preference, embedding model preference, memory, hotel management, booking details and room id that it's booked.
+    def __init__(self, username, hotel_management:HotelManager=None):
+        # Each user has a username, llm preference, embedding model preference, memory, hotel management, booking details, and the room id and reservation id that it booked.
+        # Hotel management is the process-wide service unless another one is given.
         self.username = username
         self.llm = "llama3" #gemini-pro
         self.embedder = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
         self.memory = Memory()
-        self.hotel_management = HotelManager()
+        self.hotel_management = hotel_management if hotel_management else get_hotel_manager()
         self.booking = None
         self.room_id = None
+        self.reservation_id = None
         self.language_preference = None
+        # "single_pass" answers FAQ questions with one LLM call, "two_stage" drafts an answer and rewrites it
+        self.rag_mode = os.getenv("RAG_MODE", "single_pass")
     
     def set_language_preference(self, language_preference:str):
         self.language_preference = language_preference
@@ -23,6 +28,12 @@ class User:
     def set_room_id(self, room_id:int):
         self.room_id = room_id
     
+    def set_reservation_id(self, reservation_id:int):
+        self.reservation_id = reservation_id
+
+    def get_reservation_id(self):
+        return self.reservation_id
+
     def get_language_preference(self):
         return self.language_preference
     
@@ -35,5 +46,16 @@ class User:
     def get_hotel_management(self):
         return self.hotel_management
     
+    def set_rag_mode(self, rag_mode:str):
+        self.rag_mode = rag_mode
+
+    def get_rag_mode(self):
+        return self.rag_mode
+
+    def close(self):
+        """Releases the conversation state of an ended session, the shared hotel management stays open."""
+        self.memory.clear()
+        self.booking = None
+
     def set_llm(self, llm):
         self.llm = llm
\ No newline at end of file